@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""End to end benchmarks of lmsh against the fake Lab Manager server.
+
+Usage: python benchmarks/bench_e2e.py [options]
+
+The fake server (tests/fakeserver.py) runs in its own process so it
+doesn't compete with the client for the GIL.  Startup is timed by
+running ``lmsh list`` as a new process, with and without a cached WSDL.
+Everything else is timed in process with a real suds client, without
+the response cache:
+
+  list         the ``list`` command (all configurations)
+  machines     the ``machines`` command for one configuration
+  machines-all the ``machines --all`` command
+  action       ``perform_machine_actions`` on every deployed machine
+  completion   refreshing the completion index
+
+Use --save to write the results to a JSON file, and --compare to
+compare against a previously saved file.  Any benchmark whose median
+is more than --threshold slower than the saved median is reported as
+a regression, and the exit status is 1.
+
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from labmanager import api
+from labmanager import completion
+from labmanager import config
+from labmanager.shell import LMShell
+
+
+# The fake server lives with the tests, it isn't installed with lmsh.
+FAKESERVER = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'tests', 'fakeserver.py')
+LMSH = ('import sys; from labmanager.shell import main; '
+        'sys.argv[0] = "lmsh"; main()')
+
+
+class NullStream(object):
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+
+def start_server(args):
+    process = subprocess.Popen(
+        [sys.executable, FAKESERVER, '--port', '0',
+         '--configurations', str(args.configurations),
+         '--machines', str(args.machines), '--latency', str(args.latency)],
+        stdout=subprocess.PIPE)
+    hostname = process.stdout.readline().strip()
+    return process, hostname
+
+
+def timed(func, repeat):
+    times = []
+    for i in xrange(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return summarize(times)
+
+
+def summarize(times):
+    times = sorted(times)
+    return {
+        'min': times[0],
+        'median': times[len(times) // 2],
+        'max': times[-1],
+        'runs': len(times),
+    }
+
+
+def bench_startup(hostname, home, extra_args, repeat):
+    env = dict(os.environ)
+    env['HOME'] = home
+    command = [sys.executable, '-c', LMSH, '--scheme', 'http',
+               '--hostname', hostname, '--wsdl-cache-dir',
+               os.path.join(home, 'wsdl')] + extra_args + ['list']
+
+    def run():
+        subprocess.check_call(command, env=env, stdout=open(os.devnull, 'w'))
+    return timed(run, repeat)
+
+
+def bench_in_process(hostname, args):
+    api_config = config.APIConfig(hostname, 'user', 'password', 'org',
+                                  'Main', wsdl_cache_dir=None,
+                                  max_workers=args.max_workers,
+                                  scheme='http')
+    lmapi = api.LabManager(api.create_soap_client(api_config),
+                           args.max_workers)
+    lmsh = LMShell(lmapi, stdout=NullStream())
+    deployed = [c['id'] for c in lmapi.list_all_configurations()
+                if c['isDeployed']]
+    machine_ids = []
+    for config_id in deployed:
+        machine_ids.extend([m['id'] for m in lmapi.list_machines(config_id)])
+    index = completion.CompletionIndex(lmapi)
+    results = {}
+    stdout = sys.stdout
+    sys.stdout = NullStream()
+    try:
+        results['list'] = timed(lambda: lmsh.onecmd('list'), args.repeat)
+        results['machines'] = timed(
+            lambda: lmsh.onecmd('machines %s' % deployed[0]), args.repeat)
+        results['machines-all'] = timed(
+            lambda: lmsh.onecmd('machines --all'), args.repeat)
+        results['action'] = timed(
+            lambda: lmapi.perform_machine_actions(lmapi.RESET, machine_ids),
+            args.repeat)
+        results['completion'] = timed(index.refresh, args.repeat)
+    finally:
+        sys.stdout = stdout
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print
+    print "%-16s %12s %12s %8s" % ('benchmark', 'baseline ms', 'median ms',
+                                   'change')
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        old = baseline[name]['median']
+        new = results[name]['median']
+        change = (new - old) / old
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print "%-16s %12.1f %12.1f %+7.0f%%%s" % (
+            name, 1000 * old, 1000 * new, 100 * change, flag)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark lmsh against a fake Lab Manager server.")
+    parser.add_argument('--configurations', type=int, default=1000)
+    parser.add_argument('--machines', type=int, default=3,
+                        help="Machines per configuration.")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds of latency added to every call.")
+    parser.add_argument('--max-workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', help="Write the results to this file.")
+    parser.add_argument('--compare', help="Compare against results saved "
+                        "with --save.")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="The slowdown (0.2 is 20%%) reported as a "
+                        "regression.")
+    args = parser.parse_args()
+
+    process, hostname = start_server(args)
+    home = tempfile.mkdtemp()
+    try:
+        open(os.path.join(home, '.lmshrc'), 'w').write(
+            '[default]\nusername=user\npassword=password\n'
+            'organization=org\n')
+        results = {
+            'startup (cold)': bench_startup(hostname, home,
+                                            ['--refresh-wsdl'], args.repeat),
+            'startup (warm)': bench_startup(hostname, home, [], args.repeat),
+        }
+        results.update(bench_in_process(hostname, args))
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(home)
+
+    print "%d configurations, %d machines each, %.0fms latency" % (
+        args.configurations, args.machines, 1000 * args.latency)
+    print "%-16s %10s %10s %10s" % ('benchmark', 'min ms', 'median ms',
+                                    'max ms')
+    for name in sorted(results):
+        print "%-16s %10.1f %10.1f %10.1f" % (
+            name, 1000 * results[name]['min'],
+            1000 * results[name]['median'], 1000 * results[name]['max'])
+
+    if args.save:
+        json.dump({'parameters': vars(args), 'results': results},
+                  open(args.save, 'w'), indent=2, sort_keys=True)
+    if args.compare:
+        saved = json.load(open(args.compare))
+        for name in ('configurations', 'machines', 'latency'):
+            if saved['parameters'].get(name) != getattr(args, name):
+                print "warning: %s was %s in %s" % (
+                    name, saved['parameters'].get(name), args.compare)
+        if compare(results, saved['results'], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""Compare listing through suds against the streaming fast path.
+
+Usage: python benchmarks/bench_lists.py [options]
+
+The fake server (tests/fakeserver.py) runs in its own process.  For
+each way of parsing the replies (suds, and labmanager.streaming with
+--stream-lists), a new process lists every workspace configuration
+and every machine of one configuration --repeat times, and reports
+the times and its peak memory (the maximum resident set size), so the
+two don't share a heap.
+
+Use --save and --compare like benchmarks/bench_e2e.py.
+
+"""
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+
+from labmanager import api
+from labmanager import config
+
+
+# The fake server lives with the tests, it isn't installed with lmsh.
+FAKESERVER = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'tests', 'fakeserver.py')
+MODES = ('suds', 'stream')
+
+
+def start_server(args):
+    process = subprocess.Popen(
+        [sys.executable, FAKESERVER, '--port', '0',
+         '--configurations', str(args.configurations),
+         '--machines', str(args.machines)],
+        stdout=subprocess.PIPE)
+    hostname = process.stdout.readline().strip()
+    return process, hostname
+
+
+def timed(func, repeat):
+    times = []
+    for i in xrange(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    times.sort()
+    return {'min': times[0], 'median': times[len(times) // 2],
+            'max': times[-1], 'runs': len(times)}
+
+
+def bench_mode(hostname, mode, repeat):
+    # Runs in its own process, see run_mode().
+    api_config = config.APIConfig(hostname, 'user', 'password', 'org',
+                                  'Main', wsdl_cache_dir=None,
+                                  scheme='http')
+    lmapi = api.LabManager(api.create_soap_client(api_config),
+                           stream_lists=(mode == 'stream'))
+    config_id = lmapi.list_workspace_configurations()[0]['id']
+    results = {
+        'configurations': timed(lmapi.list_workspace_configurations,
+                                repeat),
+        'machines': timed(lambda: lmapi.list_machines(config_id), repeat),
+    }
+    results['first configuration'] = timed(
+        lambda: lmapi.stream_configurations(
+            lmapi.WORKSPACE_CONFIGURATION).next(), repeat)
+    # In kilobytes on Linux.
+    memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return results, memory
+
+
+def run_mode(hostname, mode, repeat):
+    output = subprocess.Popen(
+        [sys.executable, __file__, '--child', mode, '--hostname', hostname,
+         '--repeat', str(repeat)], stdout=subprocess.PIPE).communicate()[0]
+    return json.loads(output)
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print
+    print "%-28s %12s %12s %8s" % ('benchmark', 'baseline ms', 'median ms',
+                                   'change')
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        old = baseline[name]['median']
+        new = results[name]['median']
+        change = (new - old) / old
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print "%-28s %12.1f %12.1f %+7.0f%%%s" % (
+            name, 1000 * old, 1000 * new, 100 * change, flag)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark listing through suds and streamed.")
+    parser.add_argument('--configurations', type=int, default=10000)
+    parser.add_argument('--machines', type=int, default=3,
+                        help="Machines per configuration.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', help="Write the results to this file.")
+    parser.add_argument('--compare', help="Compare against results saved "
+                        "with --save.")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="The slowdown (0.2 is 20%%) reported as a "
+                        "regression.")
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--hostname', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        json.dump(bench_mode(args.hostname, args.child, args.repeat),
+                  sys.stdout)
+        return
+
+    process, hostname = start_server(args)
+    try:
+        results = {}
+        memory = {}
+        for mode in MODES:
+            mode_results, memory[mode] = run_mode(hostname, mode,
+                                                  args.repeat)
+            for name, result in mode_results.items():
+                results['%s %s' % (mode, name)] = result
+    finally:
+        process.terminate()
+        process.wait()
+
+    print "%d configurations, %d machines each" % (args.configurations,
+                                                   args.machines)
+    print "%-28s %10s %10s %10s" % ('benchmark', 'min ms', 'median ms',
+                                    'max ms')
+    for name in sorted(results):
+        print "%-28s %10.1f %10.1f %10.1f" % (
+            name, 1000 * results[name]['min'],
+            1000 * results[name]['median'], 1000 * results[name]['max'])
+    for mode in MODES:
+        print "%s peak memory: %.1f MB" % (mode, memory[mode] / 1024.0)
+
+    if args.save:
+        json.dump({'parameters': vars(args), 'results': results,
+                   'memory': memory},
+                  open(args.save, 'w'), indent=2, sort_keys=True)
+    if args.compare:
+        saved = json.load(open(args.compare))
+        for name in ('configurations', 'machines'):
+            if saved['parameters'].get(name) != getattr(args, name):
+                print "warning: %s was %s in %s" % (
+                    name, saved['parameters'].get(name), args.compare)
+        if compare(results, saved['results'], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Compare converting suds objects with asdict against records.
+
+Usage: python benchmarks/bench_records.py [num_objects]
+
+"""
+import sys
+import time
+
+from suds.sudsobject import Factory, asdict
+
+from labmanager import records
+from labmanager.shell import LMShell
+
+
+def create_configurations(count):
+    return [Factory.object('Configuration', {
+        'id': i, 'name': 'Configuration%s' % i, 'description': '',
+        'isPublic': False, 'isDeployed': bool(i % 2), 'fenceMode': 1,
+        'type': 1 + i % 2, 'owner': 'testowner%s' % (i % 10),
+        'dateCreated': '2011-12-17T00:00:00', 'autoDeleteInMilliSeconds': 0,
+        'bucketName': 'Main', 'mustBeFenced': 'NotSpecified',
+        'autoDeleteDateTime': '0001-01-01T00:00:00'})
+        for i in xrange(count)]
+
+
+def old_get_rows(objects, columns):
+    # The row building code before records were introduced.
+    rows = []
+    for obj in objects:
+        row = []
+        for col in columns:
+            if col in LMShell.ENUM_TYPES:
+                row.append(LMShell.ENUM_TYPES[col].get(obj[col], obj[col]))
+            elif col in obj:
+                row.append(obj[col])
+        rows.append(row)
+    return rows
+
+
+def best_of(func, repeat=5):
+    times = []
+    for i in xrange(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    configurations = create_configurations(count)
+    columns = LMShell.LIST_CFG_COLUMNS
+    shell = LMShell(None)
+
+    as_dicts = lambda: [asdict(c) for c in configurations]
+    as_records = lambda: [records.from_suds(c) for c in configurations]
+    dicts, recs = as_dicts(), as_records()
+    results = [
+        ('convert asdict', best_of(as_dicts)),
+        ('convert records', best_of(as_records)),
+        ('rows from dicts (old)',
+         best_of(lambda: old_get_rows(dicts, columns))),
+        ('rows from records',
+         best_of(lambda: shell._get_rows(recs, columns))),
+    ]
+    print "%d configurations" % count
+    for name, seconds in results:
+        print "%-25s %8.2f ms" % (name, seconds * 1000)
+    # Only the containers, the field values are shared by both.
+    print "%-25s %8.2f KB" % ('memory dicts',
+                              sum(map(sys.getsizeof, dicts)) / 1024.0)
+    print "%-25s %8.2f KB" % ('memory records',
+                              sum(map(sys.getsizeof, recs)) / 1024.0)
+
+
+if __name__ == '__main__':
+    main()
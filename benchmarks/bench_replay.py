@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""Benchmark lmsh commands against a recorded cassette.
+
+Usage: python benchmarks/bench_replay.py CASSETTE [options]
+
+Record a cassette against a real server first, running the commands
+you want to benchmark (their replies are what gets replayed):
+
+  lmsh --record-cassette prod.cassette list
+  lmsh --record-cassette prod.cassette machines --all
+
+(each run overwrites the file, so record all the commands in one
+interactive session, or use --batch).  The commands are then run
+--repeat times against a labmanager.cassette.ReplayTransport, without
+the response cache.  With the default --time-scale of 0 the replies
+are served straight away, so only lmsh's own work (parsing,
+conversion and rendering) is timed.  With --time-scale 1 every reply
+takes as long as it did on the real server, which is what to use for
+concurrency changes.
+
+--save and --compare work like they do for bench_e2e.py.
+
+"""
+import sys
+import json
+import argparse
+from urlparse import urlparse
+
+from labmanager import api
+from labmanager import cassette
+from labmanager import config
+from labmanager.shell import LMShell
+
+from bench_e2e import NullStream, compare, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark lmsh commands against a cassette.")
+    parser.add_argument('cassette')
+    parser.add_argument('--command', action='append', dest='commands',
+                        help="A command to time (the default is list "
+                        "and machines --all).  Can be given more than "
+                        "once.")
+    parser.add_argument('--time-scale', type=float, default=0.0)
+    parser.add_argument('--max-workers', type=int, default=4)
+    parser.add_argument('--stream-lists', action='store_true')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', help="Write the results to this file.")
+    parser.add_argument('--compare', help="Compare against results saved "
+                        "with --save.")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="The slowdown (0.2 is 20%%) reported as a "
+                        "regression.")
+    args = parser.parse_args()
+    commands = args.commands or ['list', 'machines --all']
+
+    # The WSDL url says which server the cassette was recorded from.
+    url = urlparse(cassette.Cassette.load(args.cassette)
+                   .interactions[0]['url'])
+    api_config = config.APIConfig(
+        url.netloc, 'user', None, 'org', 'Main', wsdl_cache_dir=None,
+        max_workers=args.max_workers, scheme=url.scheme,
+        replay_cassette=args.cassette, replay_time_scale=args.time_scale)
+    lmapi = api.LabManager(api.create_soap_client(api_config),
+                           args.max_workers, stream_lists=args.stream_lists)
+    lmsh = LMShell(lmapi, stdout=NullStream())
+    results = {}
+    stdout = sys.stdout
+    sys.stdout = NullStream()
+    try:
+        for command in commands:
+            results[command] = timed(lambda: lmsh.onecmd(command),
+                                     args.repeat)
+    finally:
+        sys.stdout = stdout
+
+    print "%s, time scale %s" % (args.cassette, args.time_scale)
+    print "%-16s %10s %10s %10s" % ('command', 'min ms', 'median ms',
+                                    'max ms')
+    for name in sorted(results):
+        print "%-16s %10.1f %10.1f %10.1f" % (
+            name, 1000 * results[name]['min'],
+            1000 * results[name]['median'], 1000 * results[name]['max'])
+
+    if args.save:
+        json.dump({'parameters': vars(args), 'results': results},
+                  open(args.save, 'w'), indent=2, sort_keys=True)
+    if args.compare:
+        saved = json.load(open(args.compare))
+        if compare(results, saved['results'], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""Startup benchmarks for lmsh.
+
+Usage: python benchmarks/bench_startup.py [options]
+
+Each benchmark times a new Python process from start to exit, so they
+include the interpreter's own startup (shown as 'python' for
+reference):
+
+  python          python -c pass
+  import shell    importing labmanager.shell
+  import api      importing labmanager.shell and creating the suds
+                  client classes (what every command talking to the
+                  server has to import)
+  list-sections   lmsh --list-sections
+  help            lmsh help deploy
+
+None of these talk to a server.  The number of modules imported by
+each is shown as well.  --save and --compare work the same way as
+they do for bench_e2e.py, so a startup regression can be caught by
+saving the results before a change and comparing after it.
+
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from bench_e2e import compare, summarize
+
+
+# Each script writes the number of modules loaded to stderr.
+SCRIPT = """
+import sys
+%s
+sys.stderr.write('\\nmodules: %%d' %% len(sys.modules))
+"""
+LMSH = """
+from labmanager.shell import main
+sys.argv = ['lmsh'] + %r
+try:
+    main()
+except SystemExit:
+    pass
+"""
+BENCHMARKS = [
+    ('python', 'pass'),
+    ('import shell', 'import labmanager.shell'),
+    ('import api', 'import labmanager.shell\nimport suds.client\n'
+                   'import labmanager.transport'),
+    ('list-sections', LMSH % (['--list-sections'],)),
+    ('help', LMSH % (['help', 'deploy'],)),
+]
+
+
+def bench(code, env, repeat):
+    wall_times = []
+    for i in xrange(repeat):
+        start = time.time()
+        process = subprocess.Popen(
+            [sys.executable, '-c', SCRIPT % code], env=env,
+            stdin=open(os.devnull), stdout=open(os.devnull, 'w'),
+            stderr=subprocess.PIPE)
+        stderr = process.communicate()[1]
+        wall_times.append(time.time() - start)
+        if 'modules: ' not in stderr:
+            raise RuntimeError("benchmark failed: %s" % stderr)
+    result = summarize(wall_times)
+    result['modules'] = int(stderr.split('modules: ')[-1])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lmsh startup.")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--save', help="Write the results to this file.")
+    parser.add_argument('--compare', help="Compare against results saved "
+                        "with --save.")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="The slowdown (0.2 is 20%%) reported as a "
+                        "regression.")
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env['HOME'] = home
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))
+    try:
+        open(os.path.join(home, '.lmshrc'), 'w').write(
+            '[default]\nusername=user\npassword=password\n')
+        results = {}
+        for name, code in BENCHMARKS:
+            results[name] = bench(code, env, args.repeat)
+    finally:
+        shutil.rmtree(home)
+
+    print "%-16s %10s %10s %10s %8s" % ('benchmark', 'min ms', 'median ms',
+                                        'max ms', 'modules')
+    for name, code in BENCHMARKS:
+        print "%-16s %10.1f %10.1f %10.1f %8d" % (
+            name, 1000 * results[name]['min'],
+            1000 * results[name]['median'], 1000 * results[name]['max'],
+            results[name]['modules'])
+
+    if args.save:
+        json.dump({'parameters': vars(args), 'results': results},
+                  open(args.save, 'w'), indent=2, sort_keys=True)
+    if args.compare:
+        saved = json.load(open(args.compare))
+        if compare(results, saved['results'], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Compare per call latency of the default suds transport and the pooled one.
+
+Usage: python benchmarks/bench_transport.py [num_calls]
+
+A local HTTP/1.1 server stands in for Lab Manager and replies to every
+POST with a fixed SOAP envelope.  Over loopback the cost of opening a
+connection is small, against a real server the difference also includes
+the network round trips and the TLS handshake for each new connection.
+
+"""
+import sys
+import time
+import threading
+import BaseHTTPServer
+import SocketServer
+
+from suds.transport import Request
+from suds.transport.http import HttpAuthenticated
+
+from labmanager.transport import PooledHttpTransport
+
+
+REPLY = ('<?xml version="1.0" encoding="utf-8"?>'
+         '<soap:Envelope '
+         'xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+         '<soap:Body><GetMachineResponse xmlns="http://vmware.com/labmanager">'
+         '<GetMachineResult><id>9601</id><name>web1</name></GetMachineResult>'
+         '</GetMachineResponse></soap:Body></soap:Envelope>')
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send the whole response in one write, like a real web server.
+    wbufsize = -1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(REPLY)))
+        self.end_headers()
+        self.wfile.write(REPLY)
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def time_calls(transport, url, num_calls):
+    times = []
+    for i in xrange(num_calls):
+        start = time.time()
+        transport.send(Request(url, '<request/>'))
+        times.append(time.time() - start)
+    times.sort()
+    return times
+
+
+def main():
+    num_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    server = Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    url = 'http://127.0.0.1:%s/LabManager/SOAP/LabManager.asmx' % \
+        server.server_address[1]
+    print "%d sequential calls" % num_calls
+    print "%-22s %10s %10s %10s" % ('transport', 'mean ms', 'p50 ms',
+                                    'p99 ms')
+    for name, transport in [('urllib2 (default)', HttpAuthenticated()),
+                            ('pooled keep-alive', PooledHttpTransport())]:
+        times = time_calls(transport, url, num_calls)
+        if hasattr(transport, 'close'):
+            transport.close()
+        print "%-22s %10.3f %10.3f %10.3f" % (
+            name, 1000 * sum(times) / len(times),
+            1000 * times[len(times) // 2],
+            1000 * times[int(len(times) * 0.99)])
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Adaptive concurrency for bulk operations.
+
+Deploying or undeploying many configurations at once is limited by
+the Lab Manager server (and the hosts behind it), not by lmsh.  A
+fixed number of concurrent calls is either too few for a quiet server
+or too many for a busy one.  AIMDController adjusts the number of
+calls in flight the way TCP adjusts its congestion window: it grows
+by about one call for every round of calls that succeed quickly, and
+halves as soon as a call fails or takes much longer than calls have
+been taking.
+
+run_adaptive() runs a call for every item, as many at once as the
+controller allows.
+
+"""
+import time
+import Queue
+
+from labmanager import parallel
+
+
+class AIMDController(object):
+    """Additive increase, multiplicative decrease concurrency limit.
+
+    The limit starts at initial and stays between minimum and maximum.
+    Every call that succeeds without being slow adds increase / limit
+    to it, so a whole round of successful calls adds about increase.
+    A call that fails or is slow multiplies it by decrease.  A call is
+    slow if it takes longer than latency_target seconds or, without a
+    latency_target, longer than slow_factor times the smoothed latency:
+    an exponentially weighted moving average of the successful calls so
+    far, with the newest call weighted by smoothing.  One unusually fast
+    call can't make every normal call after it slow.
+
+    Only one decrease is made per round: the outcome of a call that
+    was started before the last decrease doesn't decrease the limit
+    again, since it was started at the higher limit.
+
+    A controller is not thread safe, run_adaptive() only uses it from
+    the thread that called it.
+
+    """
+    def __init__(self, maximum, initial=1, minimum=1, increase=1.0,
+                 decrease=0.5, slow_factor=3.0, latency_target=None,
+                 smoothing=0.2):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_factor = slow_factor
+        self.latency_target = latency_target
+        self.smoothing = smoothing
+        self._limit = float(max(minimum, min(initial, maximum)))
+        # Bumped on every decrease, see started().
+        self._generation = 0
+        self.latency = None
+        self.lowest = self.highest = self.limit
+
+    @property
+    def limit(self):
+        """The number of calls that can be in flight."""
+        return int(self._limit)
+
+    def started(self):
+        """Call when a call starts, pass the return value to finished()."""
+        return self._generation
+
+    def finished(self, token, latency, ok):
+        """Adjust the limit for a call that took latency seconds."""
+        slow = self.is_slow(latency)
+        if ok:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.smoothing * (latency - self.latency)
+        if ok and not slow:
+            self._limit = min(self.maximum,
+                              self._limit + self.increase / self._limit)
+        elif token == self._generation:
+            self._limit = max(self.minimum, self._limit * self.decrease)
+            self._generation += 1
+        self.lowest = min(self.lowest, self.limit)
+        self.highest = max(self.highest, self.limit)
+
+    def is_slow(self, latency):
+        if self.latency_target is not None:
+            return latency > self.latency_target
+        return self.latency is not None and \
+            latency > self.slow_factor * self.latency
+
+
+def run_adaptive(func, items, controller, progress=None, clock=time.time):
+    """Call func(item) for every item, up to controller.limit at a time.
+
+    A list of parallel.Result objects is returned in the same order as
+    items.  If given, progress(result, latency, done, total, limit) is
+    called (from the calling thread) as each call finishes, with the
+    number of calls finished so far and the controller's new limit.
+
+    """
+    items = list(items)
+    results = [None] * len(items)
+    finished = Queue.Queue()
+    executor = parallel.Executor(controller.maximum)
+    next_index = 0
+    in_flight = 0
+    try:
+        for done in xrange(1, len(items) + 1):
+            while next_index < len(items) and in_flight < controller.limit:
+                _start(executor, func, items, next_index, controller,
+                       finished, clock)
+                next_index += 1
+                in_flight += 1
+            index, token, latency, future = parallel.interruptible_get(
+                finished)
+            in_flight -= 1
+            result = future.result()
+            results[index] = result
+            controller.finished(token, latency, result.ok)
+            if progress is not None:
+                progress(result, latency, done, len(items), controller.limit)
+    finally:
+        # See parallel.imap_unordered(), only wait if nothing is still
+        # running.
+        executor.shutdown(wait=not in_flight)
+    return results
+
+
+def _start(executor, func, items, index, controller, finished, clock):
+    token = controller.started()
+    start = clock()
+    future = executor.submit(parallel.call_with_result, func, items[index])
+    future.add_done_callback(
+        lambda future: finished.put((index, token, clock() - start,
+                                     future)))
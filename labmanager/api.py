@@ -1,5 +1,22 @@
-from suds.client import Client
-from suds.sudsobject import asdict
+import os
+import sys
+import json
+import time
+import hashlib
+import functools
+import threading
+
+from labmanager import adaptive
+from labmanager import backoff
+from labmanager import parallel
+from labmanager import records
+from labmanager import singleflight
+from labmanager import streaming
+
+# suds (and labmanager.transport, which is built on it) is only
+# imported when a client is created.  Importing it takes longer than
+# everything else lmsh does for commands like 'lmsh help', which
+# never talk to the server.
 
 # TODO: These are the API calls not yet implemented.
 # ConfigurationCapture
@@ -20,9 +37,34 @@ from suds.sudsobject import asdict
 #   seems to be an issue with trying to do this via the API.
 
 
-def create_soap_client(config):
+# Bump this whenever the way we build the client changes in a
+# way that makes previously cached WSDL objects unusable.
+WSDL_CACHE_VERSION = 1
+
+
+def create_soap_client(config, stats=None):
     # config is an instance of config.APIConfig
-    client = Client(config.url, timeout=config.timeout)
+    # cachingpolicy=1 means suds caches the fully built (pickled)
+    # WSDL object model instead of the raw XML documents, so a warm
+    # start skips both the download and the schema parsing.
+    # If stats (a stats.Stats) is given, the time to load the WSDL
+    # and the size of every SOAP message are recorded.
+    from suds.client import Client
+    kwargs = {}
+    transport = create_cassette_transport(config)
+    if transport is None and config.keep_alive:
+        transport = create_transport(config)
+    if transport is not None:
+        kwargs['transport'] = transport
+    if stats is not None:
+        kwargs['plugins'] = [stats.plugin()]
+    start = time.time()
+    client = Client(config.url, timeout=config.timeout,
+                    cache=create_wsdl_cache(config), cachingpolicy=1,
+                    **kwargs)
+    if stats is not None:
+        stats.record('wsdl.load', time.time() - start)
+    _make_replies_thread_safe(client)
     headers = client.factory.create('AuthenticationHeader')
     headers.username = config.username
     headers.password = config.password
@@ -32,31 +74,524 @@ def create_soap_client(config):
     return client
 
 
+class _MultiRefPerReply(object):
+    # suds keeps a single MultiRef per binding, shared by every clone
+    # of a client, and MultiRef.process() keeps the reply it's working
+    # on in instance attributes.  Two replies processed at the same
+    # time could end up with each other's contents, so use a new
+    # MultiRef for every reply.
+    def process(self, body):
+        from suds.bindings.multiref import MultiRef
+        return MultiRef().process(body)
+
+
+def _make_replies_thread_safe(client):
+    for service in client.wsdl.services:
+        for port in service.ports:
+            for method in port.methods.values():
+                method.binding.input.multiref = _MultiRefPerReply()
+                method.binding.output.multiref = _MultiRefPerReply()
+
+
+def create_wsdl_cache(config):
+    """Create the on disk WSDL cache for the given APIConfig.
+
+    Each WSDL url gets its own directory, and the directory
+    name is versioned so that upgrading lmsh or suds never loads
+    a stale pickled object model.  If config.refresh_wsdl is set,
+    any existing cache entries for the url are removed first.
+
+    """
+    import suds
+    from suds.cache import ObjectCache, NoCache
+    # A recording always downloads the WSDL, so the cassette can be
+    # replayed without a cached one.
+    if not config.wsdl_cache_dir or config.record_cassette:
+        return NoCache()
+    location = os.path.join(
+        config.wsdl_cache_dir,
+        'v%s-suds-%s' % (WSDL_CACHE_VERSION, suds.__version__),
+        hashlib.sha1(config.url).hexdigest())
+    # suds treats a duration of 0 as "never expires".
+    cache = ObjectCache(location=location, days=config.wsdl_cache_days)
+    if config.refresh_wsdl:
+        cache.clear()
+    return cache
+
+
+def create_transport(config):
+    from labmanager import transport
+    pool_size = config.pool_size
+    if pool_size is None:
+        pool_size = config.max_workers
+    return transport.PooledHttpTransport(
+        pool_size=pool_size, idle_timeout=config.pool_idle_timeout)
+
+
+def create_cassette_transport(config):
+    """The transport for config.record_cassette or replay_cassette.
+
+    Returns None if neither is set.  See labmanager.cassette.
+
+    """
+    if not config.record_cassette and not config.replay_cassette:
+        return None
+    from labmanager import cassette
+    if config.replay_cassette:
+        return cassette.ReplayTransport(
+            cassette.Cassette.load(config.replay_cassette),
+            config.replay_time_scale)
+    from suds.transport.https import HttpAuthenticated
+    if config.keep_alive:
+        transport = create_transport(config)
+    else:
+        transport = HttpAuthenticated()
+    return cassette.RecordingTransport(
+        transport, cassette.Cassette(config.record_cassette))
+
+
 def suds_to_dict_type(suds_type):
     # sudsobject is magic.  Let's give the user
     # something that's simpler to work with.  Hopefully
     # they don't miss the types.
+    from suds.sudsobject import asdict
     return asdict(suds_type)
 
 
+# The decorators below convert to records.Record rather than
+# dicts.  Records behave like read only dicts, but are much
+# cheaper to create and hold on to.
 def list_of_dicts(func):
-    def _convert_to_list_of_dicts(*args, **kwargs):
-        collection_suds_type = func(*args, **kwargs)
-        simple_list = []
-        for suds_type in collection_suds_type:
-            simple_list.append(suds_to_dict_type(suds_type))
-        return simple_list
+    @functools.wraps(func)
+    def _convert_to_list_of_dicts(self, *args, **kwargs):
+        collection_suds_type = func(self, *args, **kwargs)
+        start = time.time()
+        rval = [records.from_suds(suds_type) for suds_type in
+                collection_suds_type]
+        self._record('convert.' + func.__name__, start, len(rval))
+        return rval
     return _convert_to_list_of_dicts
 
 
 def single_dict(func):
-    def _convert_to_dict(*args, **kwargs):
-        suds_type = func(*args, **kwargs)
-        return suds_to_dict_type(suds_type)
+    @functools.wraps(func)
+    def _convert_to_dict(self, *args, **kwargs):
+        suds_type = func(self, *args, **kwargs)
+        start = time.time()
+        rval = records.from_suds(suds_type)
+        self._record('convert.' + func.__name__, start, 1)
+        return rval
     return _convert_to_dict
 
 
-class LabManager(object):
+def coalesced(func):
+    # Concurrent calls with the same arguments share one SOAP call
+    # and its converted result, see singleflight.SingleFlight.  This
+    # goes above list_of_dicts and single_dict so the conversion is
+    # shared as well.
+    @functools.wraps(func)
+    def _coalesce(self, *args):
+        # The shell passes IDs as strings, python code using the
+        # api will likely pass ints; both make the same SOAP call.
+        key = (func.__name__,) + tuple([str(arg) for arg in args])
+        start = time.time()
+        rval, shared = self._flights.call(key, func, self, *args)
+        if shared:
+            self._record('coalesced.' + func.__name__, start, 0)
+            if isinstance(rval, list):
+                # Each caller gets their own list.
+                rval = list(rval)
+        return rval
+    return _coalesce
+
+
+def writes(func):
+    # Once a write has finished, reads never share a call that
+    # started before it, see coalesced.  Even a failed write may have
+    # changed something.
+    @functools.wraps(func)
+    def _write(self, *args):
+        try:
+            return func(self, *args)
+        finally:
+            self._flights.invalidate()
+    return _write
+
+
+class WaitTimeoutError(Exception):
+    pass
+
+
+class Changes(object):
+    """What changed between two listings of the same objects.
+
+    added and changed are lists of the new records, removed is a
+    list of the records that are gone.  Each list is sorted by id.
+
+    """
+    def __init__(self, added, removed, changed):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __len__(self):
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+
+class Snapshot(object):
+    """The records from the last listing of a set of objects.
+
+    update() compares a new listing with the last one.  Only the
+    objects that are new or changed are converted to records, the
+    records of unchanged objects are reused.  A Snapshot should only
+    be updated by one thread at a time.
+
+    A Snapshot can be saved to a file and loaded by a later process.
+    The loaded records are plain dicts in their JSON form (datetimes
+    become strings), so the first update() after a load converts
+    every object to compare it.
+
+    """
+    VERSION = 1
+
+    def __init__(self):
+        # id -> record, or a dict if loaded from a file
+        self.records = {}
+
+    def update(self, suds_objects):
+        """Replace the snapshot with suds_objects, returns a Changes."""
+        previous = self.records
+        current = {}
+        added = []
+        changed = []
+        for suds_type in suds_objects:
+            old = previous.get(suds_type.id)
+            if old is None:
+                record = records.from_suds(suds_type)
+                added.append(record)
+            elif isinstance(old, dict):
+                record = records.from_suds(suds_type)
+                if _json_form(record) != old:
+                    changed.append(record)
+            elif records.same_as_suds(old, suds_type):
+                record = old
+            else:
+                record = records.from_suds(suds_type)
+                changed.append(record)
+            current[suds_type.id] = record
+        removed = [record for record_id, record in previous.items()
+                   if record_id not in current]
+        self.records = current
+        return Changes(_sorted_by_id(added), _sorted_by_id(removed),
+                       _sorted_by_id(changed))
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        data = {'version': self.VERSION,
+                'records': [_json_form(record) for record in
+                            self.records.values()]}
+        # Like inventory.Inventory.save(), never leave a truncated
+        # file behind.
+        temp_path = path + '.tmp'
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        f = os.fdopen(fd, 'w')
+        try:
+            json.dump(data, f)
+        finally:
+            f.close()
+        os.rename(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved Snapshot, or a new one if there isn't one."""
+        snapshot = cls()
+        if not os.path.exists(path):
+            return snapshot
+        try:
+            data = json.load(open(path))
+        except ValueError:
+            return snapshot
+        if data.get('version') == cls.VERSION:
+            snapshot.records = dict([(record['id'], record)
+                                     for record in data['records']])
+        return snapshot
+
+
+def _json_form(record):
+    return json.loads(json.dumps(records.as_dict(record), default=unicode))
+
+
+def _sorted_by_id(objects):
+    return sorted(objects, key=lambda obj: obj['id'])
+
+
+class ClientPool(object):
+    """A bounded pool of suds clients.
+
+    A suds client keeps per request state, so a single client can't
+    be used by more than one thread at a time.  The pool hands out
+    the original client first and creates clones (which share the
+    already parsed WSDL) on demand, up to max_size clients.  Once
+    max_size clients are in use, acquire() blocks until one is
+    released.
+
+    """
+    def __init__(self, client, max_size=parallel.DEFAULT_MAX_WORKERS):
+        self.max_size = max_size
+        self._prototype = client
+        self._idle = [client]
+        self._size = 1
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        self._condition.acquire()
+        try:
+            while not self._idle:
+                if self._size < self.max_size:
+                    self._size += 1
+                    return self._prototype.clone()
+                self._condition.wait()
+            # Most recently released first, its connection is
+            # the one most likely to still be usable.
+            return self._idle.pop()
+        finally:
+            self._condition.release()
+
+    def release(self, client):
+        self._condition.acquire()
+        try:
+            self._idle.append(client)
+            self._condition.notify()
+        finally:
+            self._condition.release()
+
+
+# How long (in seconds) each SOAP call may take, including any
+# retries.  Lookups are quick, deploys and checkouts can take as long
+# as copying the disks of every machine.  Methods not listed here use
+# the default deadline of the CallPolicy.
+DEFAULT_DEADLINES = {
+    'GetConfiguration': 30,
+    'GetSingleConfigurationByName': 30,
+    'GetMachine': 30,
+    'GetMachineByName': 30,
+    'ListMachines': 60,
+    'ListConfigurations': 120,
+    'MachinePerformAction': 300,
+    'ConfigurationDelete': 300,
+    'ConfigurationUndeploy': 900,
+    'ConfigurationDeploy': 1800,
+    'ConfigurationCheckout': 1800,
+}
+# The suds default, used for anything else.
+DEFAULT_DEADLINE = 90
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_DELAY = 0.5
+DEFAULT_BREAKER_FAILURES = 5
+DEFAULT_BREAKER_RESET = 30
+# The calls that can be made again if they fail, because making them
+# twice has the same effect as making them once.  Deploys, checkouts
+# and deletes are never retried: if the server did the work but the
+# reply was lost, retrying would fail (or worse, do it twice).
+RETRY_SAFE_METHODS = frozenset([
+    'ListConfigurations',
+    'GetConfiguration',
+    'GetSingleConfigurationByName',
+    'ListMachines',
+    'GetMachine',
+    'GetMachineByName',
+])
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker(object):
+    """Fail fast while the server is down.
+
+    After failure_threshold calls in a row fail to reach the server,
+    the breaker opens and every call fails with CircuitOpenError
+    without being made.  Once reset_timeout seconds have passed, a
+    single call is let through: if it reaches the server the breaker
+    closes again, otherwise it stays open for another reset_timeout.
+
+    """
+    def __init__(self, failure_threshold=DEFAULT_BREAKER_FAILURES,
+                 reset_timeout=DEFAULT_BREAKER_RESET, clock=time.time):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        # When the breaker opened, None if it's closed.
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def before_call(self):
+        self._lock.acquire()
+        try:
+            if self._opened_at is None:
+                return
+            waited = self._clock() - self._opened_at
+            if waited >= self.reset_timeout and not self._trial_running:
+                self._trial_running = True
+                return
+            raise CircuitOpenError(
+                "not calling the server, the last %s calls to it failed "
+                "(trying again in %d seconds)" % (
+                    self._failures,
+                    max(1, self.reset_timeout - waited)))
+        finally:
+            self._lock.release()
+
+    def record_success(self):
+        self._lock.acquire()
+        try:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+        finally:
+            self._lock.release()
+
+    def record_failure(self):
+        self._lock.acquire()
+        try:
+            self._failures += 1
+            if self._trial_running or \
+                    self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial_running = False
+        finally:
+            self._lock.release()
+
+
+class CallPolicy(object):
+    """How long SOAP calls may take and which ones are retried.
+
+    Every call gets the deadline for its method (see DEFAULT_DEADLINES).
+    Calls in RETRY_SAFE_METHODS, and machine actions in
+    RETRY_SAFE_ACTIONS, are retried up to retries times when they fail
+    to reach the server or the server returns a fault, with an
+    exponential backoff starting at retry_delay seconds, as long as
+    the deadline hasn't passed.  If a CircuitBreaker is given, every
+    call goes through it.
+
+    """
+    def __init__(self, deadlines=None, default_deadline=DEFAULT_DEADLINE,
+                 retries=DEFAULT_RETRIES, retry_delay=DEFAULT_RETRY_DELAY,
+                 breaker=None, clock=time.time, sleep=time.sleep):
+        if deadlines is None:
+            deadlines = DEFAULT_DEADLINES
+        self.deadlines = deadlines
+        self.default_deadline = default_deadline
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.breaker = breaker
+        self._clock = clock
+        self._sleep = sleep
+
+    def deadline_for(self, method_name):
+        return self.deadlines.get(method_name, self.default_deadline)
+
+    def is_retry_safe(self, method_name, args):
+        if method_name == 'MachinePerformAction':
+            # The args are (machine_id, action).
+            return args[1] in LabManagerConstants.RETRY_SAFE_ACTIONS
+        return method_name in RETRY_SAFE_METHODS
+
+    def call(self, method_name, args, attempt):
+        """Call attempt(timeout) until it succeeds or can't be retried.
+
+        timeout is the number of seconds left before the deadline.
+
+        """
+        deadline = self.deadline_for(method_name)
+        start = self._clock()
+        retries = 0
+        if self.is_retry_safe(method_name, args):
+            retries = self.retries
+        delays = backoff.exponential_backoff(self.retry_delay)
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                rval = attempt(deadline - (self._clock() - start))
+            except Exception, e:
+                exc_info = sys.exc_info()
+                unreachable = is_connection_error(e)
+                if self.breaker is not None:
+                    # A fault means the server is up and answering.
+                    if unreachable:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                if not retries or not (unreachable or is_server_fault(e)):
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                delay = delays.next()
+                if self._clock() - start + delay >= deadline:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                retries -= 1
+                self._sleep(delay)
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return rval
+
+
+def create_call_policy(config):
+    """Create the CallPolicy for the given APIConfig."""
+    deadlines = dict(DEFAULT_DEADLINES)
+    default_deadline = DEFAULT_DEADLINE
+    if config.timeout:
+        # An explicit timeout replaces every default deadline.
+        deadlines = {}
+        default_deadline = config.timeout
+    deadlines.update(config.deadlines)
+    breaker = None
+    if config.breaker_failures:
+        breaker = CircuitBreaker(config.breaker_failures,
+                                 config.breaker_reset)
+    return CallPolicy(deadlines, default_deadline, config.retries,
+                      config.retry_delay, breaker)
+
+
+def is_connection_error(e):
+    """Return True if e means the server couldn't be reached.
+
+    This includes timeouts and HTTP errors without a SOAP fault
+    (from a proxy or load balancer in front of the server).
+
+    """
+    import socket
+    import httplib
+    import urllib2
+    from suds.transport import TransportError
+    return isinstance(e, (TransportError, urllib2.URLError, socket.error,
+                          httplib.HTTPException))
+
+
+def is_server_fault(e):
+    """Return True if e is a SOAP fault the server might not repeat.
+
+    Faults blaming the request (soap:Client) will happen again.
+
+    """
+    from suds import WebFault
+    if not isinstance(e, WebFault):
+        return False
+    code = getattr(e.fault, 'faultcode', None) or ''
+    return not code.split(':')[-1].startswith('Client')
+
+
+class LabManagerConstants(object):
+    # Shared by LabManager and asyncapi.AsyncLabManager.
     WORKSPACE_CONFIGURATION = 1
     LIBRARY_CONFIGURATIONS = 2
     NON_FENCED = 1
@@ -73,58 +608,327 @@ class LabManager(object):
     SNAPSHOT = 6
     REVERT = 7
     SHUTDOWN = 8
+    # The actions that leave a machine in the same state however
+    # many times they are performed, see CallPolicy.
+    RETRY_SAFE_ACTIONS = frozenset([POWER_ON, POWER_OFF, SUSPEND, RESUME,
+                                    SHUTDOWN])
+    # These are the machine statuses returned in the
+    # 'status' field of a machine.
+    STATUS_OFF = 1
+    STATUS_ON = 2
+    STATUS_SUSPENDED = 3
+    STATUS_STUCK = 4
+    STATUS_INVALID = 128
+    DEFAULT_WAIT_TIMEOUT = 600
 
-    def __init__(self, client):
+
+class LabManager(LabManagerConstants):
+    def __init__(self, client, max_clients=parallel.DEFAULT_MAX_WORKERS,
+                 stats=None, policy=None, stream_lists=False):
         self._client = client
+        self._pool = ClientPool(client, max_clients)
+        # An optional stats.Stats that every call is recorded in.
+        # Message sizes are only known if the client was created
+        # with the same stats, see create_soap_client.
+        self._stats = stats
+        # An optional CallPolicy.  Without one, calls use the
+        # client's timeout and are never retried.
+        self._policy = policy
+        self._flights = singleflight.SingleFlight()
+        # If stream_lists is set (and the WSDL allows it), the replies
+        # to ListConfigurations and ListMachines are parsed straight
+        # into records instead of going through suds.
+        self._streaming = None
+        if stream_lists:
+            self._streaming = streaming.create(client)
+
+    @property
+    def max_clients(self):
+        return self._pool.max_size
+
+    def flight_stats(self):
+        """Return a dict of method name -> (calls, coalesced).
+
+        calls is the number of read calls made to the server, and
+        coalesced the number of calls that shared the result of an
+        identical call already in progress.
+
+        """
+        return self._flights.stats()
 
+    def _call(self, method_name, *args):
+        return self._call_with(method_name, args, None)
+
+    def _call_with(self, method_name, args, send):
+        # send(client) makes the call, by default through suds.
+        if send is None:
+            send = lambda client: getattr(client.service,
+                                          method_name)(*args)
+        if self._policy is None:
+            return self._call_once(method_name, send, None)
+        return self._policy.call(
+            method_name, args,
+            lambda timeout: self._call_once(method_name, send, timeout))
+
+    def _call_once(self, method_name, send, timeout):
+        client = self._pool.acquire()
+        try:
+            if timeout is not None:
+                client.set_options(timeout=timeout)
+            if self._stats is None:
+                return send(client)
+            return self._timed_call(client, method_name, send)
+        finally:
+            self._pool.release(client)
+
+    def _timed_call(self, client, method_name, send):
+        self._stats.start_call()
+        start = time.time()
+        error = True
+        try:
+            rval = send(client)
+            error = False
+            return rval
+        finally:
+            end = time.time()
+            bytes_sent, bytes_received, received_at = \
+                self._stats.call_sizes()
+            self._stats.record('soap.' + method_name, end - start,
+                               bytes_sent, bytes_received, error=error)
+            if received_at is not None:
+                self._stats.record('xml.' + method_name, end - received_at)
+
+    def _record(self, name, start, objects):
+        if self._stats is not None:
+            self._stats.record(name, time.time() - start, objects=objects)
+
+    def _call_parallel(self, calls, call=None):
+        """Make several independent SOAP calls concurrently.
+
+        calls is a list of (method_name, args) tuples, each made with
+        call(method_name, *args), which defaults to _call.  The return
+        values are returned in the same order as calls.  If any of
+        the calls fail, the first failure (in calls order) is raised.
+
+        """
+        if call is None:
+            call = self._call
+        results = parallel.run_parallel(
+            lambda method_and_args: call(method_and_args[0],
+                                         *method_and_args[1]),
+            calls, self._pool.max_size)
+        return [result.get() for result in results]
+
+    def _list(self, method_name, arg):
+        # The objects in a ListConfigurations or ListMachines reply,
+        # as sudsobjects, or as records if they were streamed.
+        if self._streaming is None:
+            return self._call(method_name, arg)[0]
+        return list(self._stream(method_name, arg))
+
+    def _stream(self, method_name, *args):
+        body = self._call_with(
+            method_name, args, lambda client: self._streaming.send(
+                client, method_name, args, self._stats))
+        return self._streaming.iter_records(method_name, body)
+
+    @coalesced
     @list_of_dicts
     def list_library_configurations(self):
-        rval = self._client.service.ListConfigurations(
-            self.LIBRARY_CONFIGURATIONS)[0]
-        return rval
+        return self._list_configurations(self.LIBRARY_CONFIGURATIONS)
 
+    @coalesced
     @list_of_dicts
     def list_workspace_configurations(self):
-        return self._client.service.ListConfigurations(
-            self.WORKSPACE_CONFIGURATION)[0]
+        return self._list_configurations(self.WORKSPACE_CONFIGURATION)
 
+    @coalesced
     @list_of_dicts
     def list_all_configurations(self):
-        workspace = self._client.service.ListConfigurations(
-            self.WORKSPACE_CONFIGURATION)[0]
-        library = self._client.service.ListConfigurations(
-            self.LIBRARY_CONFIGURATIONS)[0]
+        return self._list_configurations(None)
+
+    def _list_configurations(self, config_type):
+        # A config_type of None lists both types.
+        if config_type is not None:
+            return self._list('ListConfigurations', config_type)
+        workspace, library = self._call_parallel([
+            ('ListConfigurations', (self.WORKSPACE_CONFIGURATION,)),
+            ('ListConfigurations', (self.LIBRARY_CONFIGURATIONS,)),
+        ], self._list)
         return workspace + library
 
+    def stream_configurations(self, config_type):
+        """Return an iterator of the configurations of a type.
+
+        With stream_lists, the configurations are converted to
+        records as the reply is parsed, so the first ones can be used
+        before the rest are parsed, and the whole list is never held
+        in memory.  Otherwise this is the same as iterating over
+        list_workspace_configurations or list_library_configurations.
+
+        @param config_type: WORKSPACE_CONFIGURATION or
+            LIBRARY_CONFIGURATIONS.
+
+        """
+        if self._streaming is None:
+            return iter([records.from_suds(suds_type) for suds_type in
+                         self._call('ListConfigurations', config_type)[0]])
+        return self._stream('ListConfigurations', config_type)
+
+    def list_configuration_changes(self, snapshot, config_type=None):
+        """List the configurations that changed since the last listing.
+
+        @param snapshot: A Snapshot, updated with the new listing.
+            Use a new Snapshot the first time, every configuration
+            is then reported as added.
+        @param config_type: WORKSPACE_CONFIGURATION,
+            LIBRARY_CONFIGURATIONS, or None for both.
+        @return: A Changes object.
+
+        """
+        return self._update_snapshot(
+            'list_configuration_changes', snapshot,
+            self._list_configurations(config_type))
+
+    def list_machine_changes(self, snapshot, config_id):
+        """Like list_configuration_changes, for the machines in a config."""
+        return self._update_snapshot(
+            'list_machine_changes', snapshot,
+            self._list('ListMachines', config_id))
+
+    def _update_snapshot(self, method_name, snapshot, suds_objects):
+        start = time.time()
+        changes = snapshot.update(suds_objects)
+        # Only the added and changed objects were converted.
+        self._record('convert.' + method_name, start,
+                     len(changes.added) + len(changes.changed))
+        return changes
+
+    @coalesced
     @single_dict
     def show_configuration(self, config_id):
-        return self._client.service.GetConfiguration(config_id)
+        return self._call('GetConfiguration', config_id)
 
+    @coalesced
     @single_dict
     def show_configuration_by_name(self, name):
         # I am assuming that by calling this API your'e looking
         # for a specific configuration by name, not all configurations
         # matching this name.
-        return self._client.service.GetSingleConfigurationByName(name)
+        return self._call('GetSingleConfigurationByName', name)
 
+    @coalesced
     @list_of_dicts
     def list_machines(self, config_id):
-        return self._client.service.ListMachines(config_id)[0]
+        return self._list('ListMachines', config_id)
+
+    def stream_machines(self, config_id):
+        """Like stream_configurations, for the machines in a config."""
+        if self._streaming is None:
+            return iter([records.from_suds(suds_type) for suds_type in
+                         self._call('ListMachines', config_id)[0]])
+        return self._stream('ListMachines', config_id)
+
+    def iter_machines(self, config_ids, max_workers=None):
+        """List the machines of many configurations concurrently.
+
+        @param config_ids: The ids of the configurations.
+        @param max_workers: The maximum number of concurrent requests
+            to make.  Defaults to the size of the client pool.
+        @return: An iterator of parallel.Result objects, one per
+            configuration, in the order the ListMachines calls finish.
+            Each result's item is the config id and its value is the
+            list of machines.
 
+        """
+        if max_workers is None:
+            max_workers = self._pool.max_size
+        return parallel.imap_unordered(self.list_machines, config_ids,
+                                       max_workers)
+
+    def show_configurations(self, config_ids, max_workers=None):
+        """Show many configurations concurrently.
+
+        @param config_ids: The ids of the configurations.  Each
+            configuration is only fetched once, however many times
+            its id is repeated.
+        @param max_workers: The maximum number of concurrent requests
+            to make.  Defaults to the size of the client pool.
+        @return: A list of parallel.Result objects, in the same
+            order as config_ids.  A configuration that can't be
+            fetched doesn't stop the others from being fetched.
+
+        """
+        return self._get_many(self.show_configuration, config_ids,
+                              max_workers)
+
+    @coalesced
     @single_dict
     def get_machine(self, machine_id):
-        return self._client.service.GetMachine(machine_id)
+        return self._call('GetMachine', machine_id)
 
+    @coalesced
     @single_dict
     def get_machine_by_name(self, config_id, name):
-        return self._client.service.GetMachineByName(config_id, name)
+        return self._call('GetMachineByName', config_id, name)
+
+    def get_machines(self, machine_ids, max_workers=None):
+        """Like show_configurations, for machines."""
+        return self._get_many(self.get_machine, machine_ids, max_workers)
+
+    def get_machines_by_name(self, config_id, names, max_workers=None):
+        """Like show_configurations, for machines in config_id by name."""
+        return self._get_many(
+            lambda name: self.get_machine_by_name(config_id, name), names,
+            max_workers)
+
+    def _get_many(self, func, keys, max_workers):
+        if max_workers is None:
+            max_workers = self._pool.max_size
+        # The shell passes IDs as strings, so '5' and 5 are the
+        # same object.
+        return parallel.run_parallel_unique(func, keys, max_workers, key=str)
 
+    @writes
     def undeploy_configuration(self, config_id):
-        self._client.service.ConfigurationUndeploy(config_id)
+        self._call('ConfigurationUndeploy', config_id)
 
+    @writes
     def deploy_configuration(self, config_id, fence_mode):
-        self._client.service.ConfigurationDeploy(config_id, False, fence_mode)
+        self._call('ConfigurationDeploy', config_id, False, fence_mode)
 
+    def deploy_configurations(self, config_ids, fence_mode, progress=None,
+                              controller=None):
+        """Deploy many configurations, adapting how many run at once.
+
+        @param config_ids: The ids of the configurations.
+        @param fence_mode: The fence mode, see deploy_configuration.
+        @param progress: An optional function called as each deploy
+            finishes, see adaptive.run_adaptive.
+        @param controller: An adaptive.AIMDController.  Defaults to
+            one that starts at one deploy at a time and goes up to
+            the size of the client pool.
+        @return: A list of parallel.Result objects, in the same order
+            as config_ids.  A failed deploy doesn't stop the others.
+
+        """
+        return self._run_adaptive(
+            lambda config_id: self.deploy_configuration(config_id,
+                                                        fence_mode),
+            config_ids, progress, controller)
+
+    def undeploy_configurations(self, config_ids, progress=None,
+                                controller=None):
+        """Like deploy_configurations, for undeploys."""
+        return self._run_adaptive(self.undeploy_configuration, config_ids,
+                                  progress, controller)
+
+    def _run_adaptive(self, func, items, progress, controller):
+        if controller is None:
+            controller = adaptive.AIMDController(self._pool.max_size)
+        return adaptive.run_adaptive(func, items, controller, progress)
+
+    @writes
     def checkout_configuration(self, config_id, name):
         # This is likely not to be terribly useful.  If you keep
         # the default workspace of "Main", you'll run into errors
@@ -137,11 +941,13 @@ class LabManager(object):
 
         # Return type is an int so we don't need to do any custom
         # conversions.
-        return self._client.service.ConfigurationCheckout(config_id, name)
+        return self._call('ConfigurationCheckout', config_id, name)
 
+    @writes
     def delete_configuration(self, config_id):
-        self._client.service.ConfigurationDelete(config_id)
+        self._call('ConfigurationDelete', config_id)
 
+    @writes
     def perform_machine_action(self, action, machine_id):
         """Perform an action on a machine.
 
@@ -154,4 +960,72 @@ class LabManager(object):
         """
         # This is not a typo, the pdf docs are wrong, the args
         # are actually switched.
-        self._client.service.MachinePerformAction(machine_id, action)
+        self._call('MachinePerformAction', machine_id, action)
+
+    def perform_machine_actions(self, action, machine_ids, max_workers=None):
+        """Perform an action on many machines concurrently.
+
+        @param action: The action to perform, see perform_machine_action.
+        @param machine_ids: The ids of the machines.
+        @param max_workers: The maximum number of concurrent requests
+            to make.  Defaults to the size of the client pool.
+        @return: A list of parallel.Result objects, in the same
+            order as machine_ids, one per machine.  A failure
+            on one machine does not stop the action from being
+            performed on the other machines.
+
+        """
+        if max_workers is None:
+            max_workers = self._pool.max_size
+        return parallel.run_parallel(
+            lambda machine_id: self.perform_machine_action(action,
+                                                           machine_id),
+            machine_ids, max_workers)
+
+    def wait_for_machines(self, config_id, status,
+                          timeout=LabManagerConstants.DEFAULT_WAIT_TIMEOUT,
+                          initial_delay=2, max_delay=30, sleep=time.sleep,
+                          clock=time.time):
+        """Wait until every machine in a configuration has a status.
+
+        @param config_id: The id of the configuration.
+        @param status: One of the class attributes STATUS_ON,
+            STATUS_OFF, etc.  When waiting for STATUS_ON, the
+            machines must also have an internal IP address.
+        @param timeout: The maximum number of seconds to wait.
+        @return: A tuple of the list of machines and the number of
+            seconds it took for them to reach the status.
+        @raise WaitTimeoutError: If the machines didn't reach the
+            status before the timeout.
+
+        All the machines are checked with a single ListMachines call
+        per poll.  The time between polls backs off exponentially
+        (with jitter) from initial_delay to max_delay seconds.
+
+        """
+        start = clock()
+        delays = backoff.exponential_backoff(initial_delay, max_delay)
+        while True:
+            machines = self.list_machines(config_id)
+            if machines_have_status(machines, status):
+                return machines, clock() - start
+            remaining = timeout - (clock() - start)
+            if remaining <= 0:
+                raise WaitTimeoutError(
+                    "timed out after %s seconds waiting for the machines "
+                    "in configuration %s" % (timeout, config_id))
+            sleep(min(delays.next(), remaining))
+
+
+def machines_have_status(machines, status):
+    """Return True if there are machines and they all have status."""
+    if not machines:
+        return False
+    for machine in machines:
+        if machine.get('status') != status:
+            return False
+        if status == LabManager.STATUS_ON and not machine.get('internalIP'):
+            # The machines are reported as on a little
+            # while before they have an IP.
+            return False
+    return True
@@ -0,0 +1,164 @@
+"""A LabManager whose calls return futures instead of blocking.
+
+Code that drives many configurations at once (deploying a whole test
+fleet, for example) wants to start hundreds of operations and react as
+each one finishes.  AsyncLabManager has the same methods as
+api.LabManager, but each one returns a parallel.Future right away.
+The calls themselves run on a bounded executor, so no matter how many
+operations are submitted, at most max_concurrency requests are in
+flight against the server::
+
+    lmapi = api.LabManager(client, max_clients=16)
+    async_lmapi = asyncapi.AsyncLabManager(lmapi, max_concurrency=16)
+    futures = [async_lmapi.deploy_configuration(config_id,
+                                                async_lmapi.NON_FENCED)
+               for config_id in config_ids]
+    for future in parallel.as_completed(futures):
+        future.result()
+
+The wrapped LabManager should have at least max_concurrency clients in
+its pool, otherwise the extra calls just wait for a client.
+
+This is not non-blocking I/O.  Every call still goes through suds,
+which blocks, so each call in flight holds one of the executor's
+threads until its reply arrives.  What it saves is the caller managing
+those threads, and a thread for every operation that is merely
+queued.  Only wait_for_machines() holds no thread between polls.
+
+"""
+import sys
+import time
+import threading
+
+from labmanager import api
+from labmanager import backoff
+from labmanager import parallel
+
+
+class AsyncLabManager(api.LabManagerConstants):
+    def __init__(self, lmapi, max_concurrency=parallel.DEFAULT_MAX_WORKERS):
+        self._lmapi = lmapi
+        self._executor = parallel.Executor(max_concurrency)
+
+    def _submit(self, method_name, *args):
+        return self._executor.submit(getattr(self._lmapi, method_name),
+                                     *args)
+
+    def list_library_configurations(self):
+        return self._submit('list_library_configurations')
+
+    def list_workspace_configurations(self):
+        return self._submit('list_workspace_configurations')
+
+    def list_all_configurations(self):
+        return self._submit('list_all_configurations')
+
+    def list_configuration_changes(self, snapshot, config_type=None):
+        return self._submit('list_configuration_changes', snapshot,
+                            config_type)
+
+    def show_configuration(self, config_id):
+        return self._submit('show_configuration', config_id)
+
+    def show_configuration_by_name(self, name):
+        return self._submit('show_configuration_by_name', name)
+
+    def show_configurations(self, config_ids):
+        return self._submit('show_configurations', config_ids)
+
+    def list_machines(self, config_id):
+        return self._submit('list_machines', config_id)
+
+    def list_machine_changes(self, snapshot, config_id):
+        return self._submit('list_machine_changes', snapshot, config_id)
+
+    def get_machine(self, machine_id):
+        return self._submit('get_machine', machine_id)
+
+    def get_machine_by_name(self, config_id, name):
+        return self._submit('get_machine_by_name', config_id, name)
+
+    def get_machines(self, machine_ids):
+        return self._submit('get_machines', machine_ids)
+
+    def get_machines_by_name(self, config_id, names):
+        return self._submit('get_machines_by_name', config_id, names)
+
+    def undeploy_configuration(self, config_id):
+        return self._submit('undeploy_configuration', config_id)
+
+    def deploy_configuration(self, config_id, fence_mode):
+        return self._submit('deploy_configuration', config_id, fence_mode)
+
+    def deploy_configurations(self, config_ids, fence_mode, progress=None,
+                              controller=None):
+        return self._submit('deploy_configurations', config_ids, fence_mode,
+                            progress, controller)
+
+    def undeploy_configurations(self, config_ids, progress=None,
+                                controller=None):
+        return self._submit('undeploy_configurations', config_ids,
+                            progress, controller)
+
+    def checkout_configuration(self, config_id, name):
+        return self._submit('checkout_configuration', config_id, name)
+
+    def delete_configuration(self, config_id):
+        return self._submit('delete_configuration', config_id)
+
+    def perform_machine_action(self, action, machine_id):
+        return self._submit('perform_machine_action', action, machine_id)
+
+    def perform_machine_actions(self, action, machine_ids):
+        """Return a list of futures, one per machine id."""
+        return [self.perform_machine_action(action, machine_id)
+                for machine_id in machine_ids]
+
+    def wait_for_machines(self, config_id, status,
+                          timeout=api.LabManagerConstants.DEFAULT_WAIT_TIMEOUT,
+                          initial_delay=2, max_delay=30):
+        """Return a future for LabManager.wait_for_machines().
+
+        The future's result is the same (machines, elapsed) tuple, or
+        it raises api.WaitTimeoutError.  Unlike the other methods, a
+        wait doesn't hold on to one of the executor's threads: each
+        poll is a separate ListMachines call, and the time between
+        polls is spent on a timer, so any number of configurations can
+        be waited on at once.
+
+        """
+        future = parallel.Future()
+        start = time.time()
+        delays = backoff.exponential_backoff(initial_delay, max_delay)
+
+        def _poll():
+            self.list_machines(config_id).add_done_callback(_check)
+
+        def _check(poll):
+            try:
+                machines = poll.result()
+            except Exception:
+                future.set_result(parallel.Result(
+                    config_id, exc_info=sys.exc_info()))
+                return
+            elapsed = time.time() - start
+            if api.machines_have_status(machines, status):
+                future.set_result(parallel.Result(
+                    config_id, value=(machines, elapsed)))
+            elif elapsed >= timeout:
+                error = api.WaitTimeoutError(
+                    "timed out after %s seconds waiting for the machines "
+                    "in configuration %s" % (timeout, config_id))
+                future.set_result(parallel.Result(
+                    config_id, exc_info=(api.WaitTimeoutError, error, None)))
+            else:
+                timer = threading.Timer(
+                    min(delays.next(), timeout - elapsed), _poll)
+                timer.setDaemon(True)
+                timer.start()
+        _poll()
+        return future
+
+    def close(self, wait=True):
+        """Stop the executor once the submitted calls are done."""
+        self._executor.shutdown(wait)
@@ -0,0 +1,18 @@
+"""Exponential backoff with jitter."""
+import random
+
+
+def exponential_backoff(initial=1.0, maximum=30.0, factor=2.0, jitter=0.5,
+                        rand=random.random):
+    """Yield an endless sequence of delays (in seconds).
+
+    The delays start at initial and are multiplied by factor each
+    time, up to maximum.  Each delay is then reduced by a random
+    amount of up to jitter * delay, so that many clients started at
+    the same time don't all hit the server at the same moments.
+
+    """
+    delay = initial
+    while True:
+        yield delay * (1 - jitter * rand())
+        delay = min(delay * factor, maximum)
@@ -0,0 +1,257 @@
+"""Run a plan of lmsh commands, in parallel where they don't conflict.
+
+A plan is a text file with one lmsh command per line (blank lines and
+lines starting with # are ignored), or a JSON list of commands::
+
+    checkout 191 web-copy
+    deploy --wait unfenced 289
+    deploy --wait unfenced 1393
+    machines 289 1393
+    undeploy 289
+
+Every step depends on the step before it that uses any of the same
+configurations (or, for checkout, the same new configuration name), so
+the steps for each configuration run in order, and the steps for
+unrelated configurations run at the same time.  Commands whose
+configurations can't be told from their arguments (list, find, action
+with machine IDs, machines --all, ...) are barriers: they run after
+every step before them has finished, and every step after them waits
+for them.
+
+If a step fails, the steps that depend on it are skipped.
+
+"""
+import sys
+import json
+import time
+import Queue
+import threading
+
+from labmanager import output
+from labmanager import parallel
+
+
+# The commands whose configurations are known, and the position of
+# the config ID in their arguments (None if every argument is one).
+# With --many, every argument from the config ID's position on is one.
+CONFIG_ARG_POSITIONS = {
+    'show': None,
+    'deploy': 1,
+    'undeploy': None,
+    'wait': 0,
+    'delete': 0,
+    'checkout': 0,
+    'machines': None,
+}
+# Options that take a value.
+VALUE_OPTIONS = ['--format', '--config']
+
+
+class PlanError(Exception):
+    pass
+
+
+class Step(object):
+    def __init__(self, number, line, keys):
+        self.number = number
+        self.line = line
+        # The configurations (and names) the step uses, or None
+        # if it's a barrier.
+        self.keys = keys
+        # The numbers of the steps that have to succeed first.
+        self.depends_on = set()
+
+    def __repr__(self):
+        return 'Step(%s, %r)' % (self.number, self.line)
+
+
+def load_plan(path):
+    """Load the commands of a plan file."""
+    contents = open(path).read()
+    if path.endswith('.json') or contents.lstrip().startswith('['):
+        try:
+            commands = json.loads(contents)
+        except ValueError, e:
+            raise PlanError("invalid JSON plan %s: %s" % (path, e))
+        if not isinstance(commands, list):
+            raise PlanError("a JSON plan must be a list of commands")
+        return [_command_from_json(command) for command in commands]
+    return [line.strip() for line in contents.splitlines()
+            if line.strip() and not line.strip().startswith('#')]
+
+
+def _command_from_json(command):
+    if isinstance(command, dict):
+        command = command.get('command')
+    if not isinstance(command, basestring):
+        raise PlanError("not a command: %r" % (command,))
+    return command
+
+
+def create_steps(commands):
+    """Return the Steps for a list of commands, with their dependencies."""
+    steps = []
+    last_step_for_key = {}
+    since_barrier = []
+    barrier = None
+    for number, line in enumerate(commands, 1):
+        step = Step(number, line, step_keys(line))
+        if barrier is not None:
+            step.depends_on.add(barrier.number)
+        if step.keys is None:
+            step.depends_on.update([s.number for s in since_barrier])
+            barrier = step
+            since_barrier = []
+            last_step_for_key = {}
+        else:
+            for key in step.keys:
+                if key in last_step_for_key:
+                    step.depends_on.add(last_step_for_key[key].number)
+                last_step_for_key[key] = step
+            since_barrier.append(step)
+        steps.append(step)
+    return steps
+
+
+def step_keys(line):
+    """Return the set of configurations a command uses.
+
+    None is returned if it can't be told from the command.
+
+    """
+    words = line.split()
+    if not words:
+        return None
+    command = words[0]
+    args = _positional_args(words[1:])
+    if command == 'action' and '--config' in words[:-1]:
+        return set([('config', words[words.index('--config') + 1])])
+    if command not in CONFIG_ARG_POSITIONS:
+        return None
+    if command == 'machines' and ('--all' in words or '--deployed' in words):
+        return None
+    position = CONFIG_ARG_POSITIONS[command]
+    if position is None:
+        config_ids = args
+    elif '--many' in words:
+        config_ids = args[position:]
+    else:
+        config_ids = args[position:position + 1]
+    if not config_ids:
+        return None
+    keys = set([('config', config_id) for config_id in config_ids])
+    if command == 'checkout' and len(args) > 1:
+        keys.add(('name', args[1]))
+    return keys
+
+
+def _positional_args(words):
+    args = []
+    words = iter(words)
+    for word in words:
+        if word in VALUE_OPTIONS:
+            next(words, None)
+        elif not word.startswith('--'):
+            args.append(word)
+    return args
+
+
+def run_steps(lmshell, steps, max_workers=parallel.DEFAULT_MAX_WORKERS):
+    """Run the steps with lmshell, up to max_workers at a time.
+
+    The output of each step is prefixed with its step number, and a
+    line is written for every step that finishes, fails or is skipped.
+    Returns 0 if every step succeeded, and otherwise the highest
+    return code of any step (1 for skipped steps).
+
+    """
+    from labmanager.shell import ReturnCode
+    stdout, stderr = sys.stdout, sys.stderr
+    lock = threading.Lock()
+    finished = Queue.Queue()
+    executor = parallel.Executor(max_workers)
+
+    def _report(message):
+        lock.acquire()
+        try:
+            stdout.write(message + '\n')
+            stdout.flush()
+        finally:
+            lock.release()
+
+    def _run(step):
+        streams = [output.PrefixedStream(stdout, '[%s] ' % step.number, lock),
+                   output.PrefixedStream(stderr, '[%s] ' % step.number, lock)]
+        sys.stdout.set_stream(streams[0])
+        sys.stderr.set_stream(streams[1])
+        start = time.time()
+        try:
+            try:
+                result = lmshell.onecmd(step.line)
+            except Exception, e:
+                sys.stderr.write("ERROR: %s\n" % e)
+                result = ReturnCode(1)
+        finally:
+            for stream in streams:
+                stream.flush()
+        if isinstance(result, ReturnCode):
+            return result.return_code, time.time() - start
+        return 0, time.time() - start
+
+    return_codes = {}
+    skipped = set()
+    waiting = list(steps)
+    running = 0
+    sys.stdout = output.ThreadLocalStream(stdout)
+    sys.stderr = output.ThreadLocalStream(stderr)
+    try:
+        while waiting or running:
+            still_waiting = []
+            for step in waiting:
+                failed = [number for number in sorted(step.depends_on)
+                          if return_codes.get(number)]
+                if failed:
+                    return_codes[step.number] = 1
+                    skipped.add(step.number)
+                    if failed[0] in skipped:
+                        reason = 'step %s was skipped' % failed[0]
+                    else:
+                        reason = 'step %s failed' % failed[0]
+                    _report("[%s] skipped (%s): %s" % (
+                        step.number, reason, step.line))
+                elif step.depends_on.issubset(return_codes):
+                    running += 1
+                    future = executor.submit(_run, step)
+                    future.add_done_callback(
+                        lambda future, step=step: finished.put(
+                            (step, future)))
+                else:
+                    still_waiting.append(step)
+            if len(still_waiting) < len(waiting):
+                # A skipped step means the steps that depend on it
+                # can be skipped too, without waiting for anything.
+                waiting = still_waiting
+                continue
+            if not running:
+                break
+            step, future = parallel.interruptible_get(finished)
+            running -= 1
+            try:
+                return_code, elapsed = future.result()
+            except Exception:
+                return_code, elapsed = 1, 0
+            return_codes[step.number] = return_code
+            if return_code:
+                _report("[%s] FAILED (return code %s): %s" % (
+                    step.number, return_code, step.line))
+            else:
+                _report("[%s] ok (%.1fs): %s" % (step.number, elapsed,
+                                                step.line))
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        # See parallel.imap_unordered(), only wait if nothing is still
+        # running.
+        executor.shutdown(wait=not running)
+    if not return_codes:
+        return 0
+    return max(return_codes.values())
@@ -0,0 +1,331 @@
+"""A read-through response cache for LabManager.
+
+An interactive session tends to run the same ``list`` and ``machines``
+commands over and over again.  CachingLabManager wraps a LabManager and
+answers repeated reads from memory until they expire, and drops the
+affected entries whenever a call changes state on the server.
+
+"""
+import time
+import threading
+
+from labmanager import parallel
+
+
+class _Node(object):
+    __slots__ = ('key', 'value', 'expires', 'prev', 'next')
+
+    def __init__(self, key=None, value=None, expires=None):
+        self.key = key
+        self.value = value
+        self.expires = expires
+        self.prev = self
+        self.next = self
+
+
+class LRUCache(object):
+    """A thread safe, size bounded LRU cache with per entry expiry.
+
+    Entries are kept in a circular doubly linked list ordered from most
+    recently used to least recently used, so lookups, inserts and
+    evictions are all constant time.
+
+    """
+    def __init__(self, max_size=1000, clock=time.time):
+        self.max_size = max_size
+        self._clock = clock
+        self._nodes = {}
+        self._root = _Node()
+        self._lock = threading.Lock()
+        # Bumped by every invalidate(), see put().
+        self.generation = 0
+
+    def get(self, key):
+        """Return a (found, value) tuple for key."""
+        self._lock.acquire()
+        try:
+            node = self._nodes.get(key)
+            if node is None:
+                return False, None
+            if node.expires <= self._clock():
+                self._remove(node)
+                return False, None
+            self._unlink(node)
+            self._link_first(node)
+            return True, node.value
+        finally:
+            self._lock.release()
+
+    def put(self, key, value, ttl, generation=None):
+        """Cache value for ttl seconds.
+
+        If generation is given, value is only cached if nothing has
+        been invalidated since self.generation was that.  Read it
+        before making the call that returns value, so a result that
+        was in flight when an invalidate() happened isn't cached.
+
+        """
+        self._lock.acquire()
+        try:
+            if generation is not None and generation != self.generation:
+                return
+            node = self._nodes.get(key)
+            if node is not None:
+                self._remove(node)
+            node = _Node(key, value, self._clock() + ttl)
+            self._nodes[key] = node
+            self._link_first(node)
+            if len(self._nodes) > self.max_size:
+                self._remove(self._root.prev)
+        finally:
+            self._lock.release()
+
+    def invalidate(self, predicate):
+        """Remove every entry whose key matches predicate(key)."""
+        self._lock.acquire()
+        try:
+            self.generation += 1
+            for key in [k for k in self._nodes if predicate(k)]:
+                self._remove(self._nodes[key])
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self.invalidate(lambda key: True)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def _remove(self, node):
+        self._unlink(node)
+        del self._nodes[node.key]
+
+    def _unlink(self, node):
+        node.prev.next = node.next
+        node.next.prev = node.prev
+
+    def _link_first(self, node):
+        node.prev = self._root
+        node.next = self._root.next
+        self._root.next.prev = node
+        self._root.next = node
+
+
+class CachingLabManager(object):
+    """Cache the results of LabManager read calls.
+
+    Every read call is cached for a per method TTL (in seconds).  Calls
+    that change state on the server invalidate any cached results they
+    could have changed.  Anything not explicitly handled here (the
+    class constants, for example) is delegated to the wrapped
+    LabManager.
+
+    """
+    DEFAULT_TTLS = {
+        'list_library_configurations': 60,
+        'list_workspace_configurations': 30,
+        'list_all_configurations': 30,
+        'show_configuration': 30,
+        'show_configuration_by_name': 30,
+        'list_machines': 15,
+        'get_machine': 15,
+        'get_machine_by_name': 15,
+    }
+    CONFIGURATION_READS = ('list_library_configurations',
+                           'list_workspace_configurations',
+                           'list_all_configurations',
+                           'show_configuration_by_name')
+    MACHINE_READS = ('get_machine', 'get_machine_by_name')
+
+    def __init__(self, lmapi, ttls=None, max_size=1000):
+        self._lmapi = lmapi
+        self._ttls = self.DEFAULT_TTLS.copy()
+        if ttls is not None:
+            unknown = set(ttls) - set(self.DEFAULT_TTLS)
+            if unknown:
+                raise ValueError("not a cached method: %s (choose from %s)"
+                                 % (', '.join(sorted(unknown)),
+                                    ', '.join(sorted(self.DEFAULT_TTLS))))
+            self._ttls.update(ttls)
+        self._cache = LRUCache(max_size)
+        self._hits = {}
+        self._misses = {}
+        self._stats_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._lmapi, name)
+
+    @property
+    def uncached(self):
+        """The wrapped LabManager, for reads that must be up to date."""
+        return self._lmapi
+
+    def _cached(self, method_name, *args):
+        # The shell passes IDs as strings, but python code
+        # using the api will likely pass ints.
+        key = (method_name, tuple([str(arg) for arg in args]))
+        generation = self._cache.generation
+        found, value = self._cache.get(key)
+        self._record(method_name, found)
+        if not found:
+            value = getattr(self._lmapi, method_name)(*args)
+            self._cache.put(key, value, self._ttls[method_name],
+                            generation)
+        return _copy(value)
+
+    def _record(self, method_name, hit):
+        if hit:
+            counts = self._hits
+        else:
+            counts = self._misses
+        self._stats_lock.acquire()
+        try:
+            counts[method_name] = counts.get(method_name, 0) + 1
+        finally:
+            self._stats_lock.release()
+
+    def list_library_configurations(self):
+        return self._cached('list_library_configurations')
+
+    def list_workspace_configurations(self):
+        return self._cached('list_workspace_configurations')
+
+    def list_all_configurations(self):
+        return self._cached('list_all_configurations')
+
+    def show_configuration(self, config_id):
+        return self._cached('show_configuration', config_id)
+
+    def show_configuration_by_name(self, name):
+        return self._cached('show_configuration_by_name', name)
+
+    def list_machines(self, config_id):
+        return self._cached('list_machines', config_id)
+
+    def iter_machines(self, config_ids, max_workers=None):
+        # Go through our own list_machines so the results
+        # are cached.
+        if max_workers is None:
+            max_workers = self._lmapi.max_clients
+        return parallel.imap_unordered(self.list_machines, config_ids,
+                                       max_workers)
+
+    def get_machine(self, machine_id):
+        return self._cached('get_machine', machine_id)
+
+    def get_machine_by_name(self, config_id, name):
+        return self._cached('get_machine_by_name', config_id, name)
+
+    # The batch lookups go through our own single lookups so the
+    # results are cached.
+    def show_configurations(self, config_ids, max_workers=None):
+        return self._get_many(self.show_configuration, config_ids,
+                              max_workers)
+
+    def get_machines(self, machine_ids, max_workers=None):
+        return self._get_many(self.get_machine, machine_ids, max_workers)
+
+    def get_machines_by_name(self, config_id, names, max_workers=None):
+        return self._get_many(
+            lambda name: self.get_machine_by_name(config_id, name), names,
+            max_workers)
+
+    def _get_many(self, func, keys, max_workers):
+        if max_workers is None:
+            max_workers = self._lmapi.max_clients
+        return parallel.run_parallel_unique(func, keys, max_workers, key=str)
+
+    def undeploy_configuration(self, config_id):
+        try:
+            return self._lmapi.undeploy_configuration(config_id)
+        finally:
+            self._invalidate_configuration(config_id)
+
+    def deploy_configuration(self, config_id, fence_mode):
+        try:
+            return self._lmapi.deploy_configuration(config_id, fence_mode)
+        finally:
+            self._invalidate_configuration(config_id)
+
+    def deploy_configurations(self, config_ids, fence_mode, progress=None,
+                              controller=None):
+        try:
+            return self._lmapi.deploy_configurations(
+                config_ids, fence_mode, progress, controller)
+        finally:
+            for config_id in config_ids:
+                self._invalidate_configuration(config_id)
+
+    def undeploy_configurations(self, config_ids, progress=None,
+                                controller=None):
+        try:
+            return self._lmapi.undeploy_configurations(config_ids, progress,
+                                                       controller)
+        finally:
+            for config_id in config_ids:
+                self._invalidate_configuration(config_id)
+
+    def checkout_configuration(self, config_id, name):
+        try:
+            return self._lmapi.checkout_configuration(config_id, name)
+        finally:
+            self._invalidate_configuration(config_id)
+
+    def delete_configuration(self, config_id):
+        try:
+            return self._lmapi.delete_configuration(config_id)
+        finally:
+            self._invalidate_configuration(config_id)
+
+    def perform_machine_action(self, action, machine_id):
+        try:
+            return self._lmapi.perform_machine_action(action, machine_id)
+        finally:
+            self._invalidate_machines()
+
+    def perform_machine_actions(self, action, machine_ids, max_workers=None):
+        try:
+            return self._lmapi.perform_machine_actions(action, machine_ids,
+                                                       max_workers)
+        finally:
+            self._invalidate_machines()
+
+    def _invalidate_configuration(self, config_id):
+        config_id = str(config_id)
+
+        def _affected(key):
+            method_name, args = key
+            if method_name in self.CONFIGURATION_READS or \
+                    method_name in self.MACHINE_READS:
+                return True
+            return method_name in ('show_configuration', 'list_machines') \
+                and args[0] == config_id
+        self._cache.invalidate(_affected)
+
+    def _invalidate_machines(self):
+        # We don't know which configuration a machine belongs
+        # to, so every machine listing has to go.
+        self._cache.invalidate(
+            lambda key: key[0] in self.MACHINE_READS or
+            key[0] == 'list_machines')
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def cache_stats(self):
+        """Return a dict of method name -> (hits, misses)."""
+        stats = {}
+        for method_name in self._ttls:
+            stats[method_name] = (self._hits.get(method_name, 0),
+                                  self._misses.get(method_name, 0))
+        return stats
+
+
+def _copy(value):
+    # Give each caller their own list/dict so modifying a
+    # result doesn't modify what's in the cache.
+    if isinstance(value, list):
+        return list(value)
+    elif isinstance(value, dict):
+        return dict(value)
+    return value
@@ -0,0 +1,290 @@
+"""Record real Lab Manager traffic and replay it later.
+
+RecordingTransport wraps the transport of a client (see
+api.create_soap_client) and writes every request it sends, with the
+reply and how long the server took, to a cassette file.  The username
+and password in the AuthenticationHeader are scrubbed before anything
+is written.
+
+ReplayTransport serves the replies from a cassette instead of talking
+to a server, after the recorded time multiplied by time_scale (0 for
+no delay at all).  The replies have the real sizes and shapes of the
+recorded server's data, so conversion, rendering and concurrency
+changes can be benchmarked offline and get the same replies every
+time.
+
+A cassette is a file with one JSON object per line, one line for each
+request, in the order the replies were received.
+
+"""
+import re
+import copy
+import json
+import time
+import socket
+import httplib
+import threading
+from StringIO import StringIO
+from urlparse import urlparse
+from xml.etree import cElementTree
+
+from suds.transport import Transport, TransportError, Reply
+from suds.properties import Unskin
+
+
+CASSETTE_VERSION = 1
+SCRUBBED = 'SCRUBBED'
+# The prefix groups match an empty string rather than nothing, so the
+# closing tags can refer to them.
+_AUTHENTICATION_HEADER = re.compile(
+    r'<([\w.-]+:|)AuthenticationHeader\b.*?</\1AuthenticationHeader>',
+    re.DOTALL)
+_CREDENTIAL = re.compile(
+    r'(<([\w.-]+:|)(username|password)>)[^<]*(</\2\3>)')
+
+
+class CassetteError(Exception):
+    pass
+
+
+def scrub(message):
+    """Replace the credentials in a SOAP message's AuthenticationHeader."""
+    return _AUTHENTICATION_HEADER.sub(
+        lambda header: _CREDENTIAL.sub(r'\1%s\4' % SCRUBBED,
+                                       header.group(0)),
+        message)
+
+
+def request_key(method, url, headers, message):
+    """The key replies are matched to requests with.
+
+    suds and labmanager.streaming format their envelopes differently,
+    so a SOAP request is matched by its SOAPAction and the values in
+    its body, not by the exact message.
+
+    """
+    parsed = urlparse(url)
+    path = parsed.path
+    if parsed.query:
+        path += '?' + parsed.query
+    if not message:
+        return (method, path)
+    action = (headers or {}).get('SOAPAction', '').strip('"')
+    return (method, path, action, _body_values(message))
+
+
+def _body_values(message):
+    try:
+        root = cElementTree.fromstring(message)
+    except SyntaxError:
+        return message
+    values = []
+    for body in root:
+        if not body.tag.endswith('}Body'):
+            continue
+        for elem in body.getiterator():
+            if len(elem) == 0:
+                values.append((elem.tag.split('}')[-1], elem.text or ''))
+    return tuple(values)
+
+
+class Cassette(object):
+    """The interactions recorded to, or loaded from, a file.
+
+    Each interaction is a dict with the request's method, url,
+    SOAPAction and (scrubbed) message, and the reply's status, headers
+    and body, or the error if there was no reply, and the seconds it
+    took.  Messages and bodies are stored as latin-1 decoded strings,
+    which turns any bytes back into the same bytes.
+
+    """
+    def __init__(self, path, interactions=None):
+        self.path = path
+        if interactions is None:
+            interactions = []
+        self.interactions = interactions
+        self._file = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        interactions = []
+        for line in open(path):
+            if line.strip():
+                interactions.append(json.loads(line))
+        for interaction in interactions:
+            if interaction.get('version') != CASSETTE_VERSION:
+                raise CassetteError("%s is not a version %s cassette" %
+                                    (path, CASSETTE_VERSION))
+        return cls(path, interactions)
+
+    def record(self, request, method, status, headers, body, elapsed,
+               error=None):
+        message = request.message
+        if message is not None:
+            message = scrub(message).decode('latin-1')
+        if body is not None:
+            body = body.decode('latin-1')
+        interaction = {
+            'version': CASSETTE_VERSION,
+            'method': method,
+            'url': request.url,
+            'action': (request.headers or {}).get('SOAPAction'),
+            'request': message,
+            'status': status,
+            'headers': headers,
+            'body': body,
+            'error': error,
+            'elapsed': elapsed,
+        }
+        self._lock.acquire()
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'w')
+            self._file.write(json.dumps(interaction, sort_keys=True) + '\n')
+            # So an interrupted session still leaves a usable cassette.
+            self._file.flush()
+            self.interactions.append(interaction)
+        finally:
+            self._lock.release()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __deepcopy__(self, memo={}):
+        # Shared by every clone of a client, see RecordingTransport.
+        return self
+
+
+class RecordingTransport(Transport):
+    """Send requests with transport, recording them to cassette."""
+    def __init__(self, transport, cassette, clock=time.time):
+        Transport.__init__(self)
+        self.transport = transport
+        self.cassette = cassette
+        self.clock = clock
+
+    def open(self, request):
+        status, body, headers = self._record(
+            request, 'GET', lambda: self.transport.open(request).read())
+        return StringIO(body)
+
+    def send(self, request):
+        status, body, headers = self._record(
+            request, 'POST', lambda: self.transport.send(request))
+        if body is None:
+            return None
+        return Reply(status, headers, body)
+
+    def _record(self, request, method, send):
+        # suds links the options (timeout and so on) of a client to
+        # the options of its transport, which is this one.
+        Unskin(self.transport.options).update(Unskin(self.options))
+        start = self.clock()
+        try:
+            reply = send()
+        except TransportError, e:
+            body = None
+            if e.fp is not None:
+                body = e.fp.read()
+            self.cassette.record(request, method, e.httpcode, None, body,
+                                 self.clock() - start, str(e))
+            # e.fp has been read, pass on a fresh copy of it.
+            raise TransportError(str(e), e.httpcode,
+                                 body is not None and StringIO(body) or None)
+        except (socket.error, httplib.HTTPException), e:
+            # No reply at all, see transport.PooledHttpTransport.
+            self.cassette.record(request, method, None, None, None,
+                                 self.clock() - start,
+                                 str(e) or e.__class__.__name__)
+            raise
+        elapsed = self.clock() - start
+        if reply is None:
+            status, headers, body = 202, {}, None
+        elif isinstance(reply, Reply):
+            status, headers, body = reply.code, reply.headers, reply.message
+        else:
+            status, headers, body = 200, {}, reply
+        self.cassette.record(request, method, status, dict(headers or {}),
+                             body, elapsed)
+        return status, body, headers
+
+    def __deepcopy__(self, memo={}):
+        clone = RecordingTransport(copy.deepcopy(self.transport, memo),
+                                   self.cassette, self.clock)
+        Unskin(clone.options).update(Unskin(self.options))
+        return clone
+
+
+class ReplayTransport(Transport):
+    """Serve the replies recorded in a cassette.
+
+    Requests with the same key (see request_key) get the replies
+    recorded for that key in the order they were recorded, and the
+    last one again once they've all been served, so a cassette can
+    be replayed as many times as a benchmark needs.  Each reply is
+    served after its recorded time multiplied by time_scale.
+
+    """
+    def __init__(self, cassette, time_scale=1.0, sleep=time.sleep):
+        Transport.__init__(self)
+        self.cassette = cassette
+        self.time_scale = time_scale
+        self.sleep = sleep
+        # key -> [interactions, index of the next one]
+        self._replies = {}
+        for interaction in cassette.interactions:
+            request = interaction['request']
+            if request is not None:
+                request = request.encode('latin-1')
+            key = request_key(interaction['method'], interaction['url'],
+                              {'SOAPAction': interaction['action'] or ''},
+                              request)
+            self._replies.setdefault(key, [[], 0])[0].append(interaction)
+        self._lock = threading.Lock()
+
+    def open(self, request):
+        return StringIO(self._replay(request, 'GET')['body'])
+
+    def send(self, request):
+        interaction = self._replay(request, 'POST')
+        if interaction['body'] is None:
+            return None
+        return Reply(interaction['status'], interaction['headers'],
+                     interaction['body'])
+
+    def _replay(self, request, method):
+        key = request_key(method, request.url, request.headers,
+                          request.message)
+        self._lock.acquire()
+        try:
+            replies = self._replies.get(key)
+            if replies is None:
+                raise CassetteError("%s has no reply for %s %s" % (
+                    self.cassette.path, method, request.url))
+            interactions, index = replies
+            interaction = interactions[index]
+            replies[1] = min(index + 1, len(interactions) - 1)
+        finally:
+            self._lock.release()
+        if self.time_scale:
+            self.sleep(interaction['elapsed'] * self.time_scale)
+        body = interaction['body']
+        if body is not None:
+            body = body.encode('latin-1')
+        if interaction['error'] is not None and \
+                interaction['status'] is None:
+            raise socket.error(interaction['error'])
+        if interaction['error'] is not None:
+            raise TransportError(interaction['error'], interaction['status'],
+                                 body is not None and StringIO(body) or None)
+        return dict(interaction, body=body)
+
+    def __deepcopy__(self, memo={}):
+        # Clones share the replies, and where each key is up to.
+        clone = copy.copy(self)
+        Transport.__init__(clone)
+        Unskin(clone.options).update(Unskin(self.options))
+        return clone
@@ -0,0 +1,109 @@
+"""A local index of config and machine IDs used for tab completion.
+
+Querying the server on every tab press would make completion unusable,
+so the index is refreshed from a background thread and completion only
+ever looks at what's already in memory.
+
+"""
+import bisect
+import threading
+
+from labmanager import parallel
+
+
+class _Snapshot(object):
+    def __init__(self, configs=(), machines=()):
+        self.config_ids = sorted(set([str(c['id']) for c in configs]))
+        self.config_names = _NameIndex(configs)
+        self.machine_ids = sorted(set([str(m['id']) for m in machines]))
+        self.machine_names = _NameIndex(machines)
+
+
+class _NameIndex(object):
+    # Two parallel lists sorted by lowercase name, so a prefix
+    # lookup is a pair of binary searches.
+    def __init__(self, objects):
+        pairs = sorted(set([(o['name'].lower(), str(o['id']))
+                            for o in objects if o.get('name')]))
+        self.names = [name for name, object_id in pairs]
+        self.ids = [object_id for name, object_id in pairs]
+
+    def ids_with_prefix(self, prefix):
+        start, end = _prefix_range(self.names, prefix.lower())
+        return sorted(set(self.ids[start:end]))
+
+
+class CompletionIndex(object):
+    """Config and machine IDs for completion, refreshed in the background.
+
+    Machines are only indexed for deployed configurations, since those
+    are the only machines that actions can be performed on.  Typing the
+    start of a config or machine name completes to its ID.
+
+    """
+    def __init__(self, lmapi, refresh_interval=300):
+        self._lmapi = lmapi
+        self.refresh_interval = refresh_interval
+        self._snapshot = _Snapshot()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def refresh(self):
+        configs = self._lmapi.list_all_configurations()
+        deployed = [c['id'] for c in configs if c.get('isDeployed')]
+        machines = []
+        for result in parallel.run_parallel(self._lmapi.list_machines,
+                                            deployed):
+            if result.ok:
+                machines.extend(result.value)
+        # Swapping in a whole new snapshot means completion
+        # never sees a half built index.
+        self._snapshot = _Snapshot(configs, machines)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._refresh_loop)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def request_refresh(self):
+        """Refresh the index now instead of waiting for the interval."""
+        self._wakeup.set()
+
+    def _refresh_loop(self):
+        while not self._stopped:
+            try:
+                self.refresh()
+            except Exception:
+                # Completion is best effort, keep whatever we
+                # had and try again later.
+                pass
+            self._wakeup.wait(self.refresh_interval)
+            self._wakeup.clear()
+
+    def complete_config_id(self, text):
+        snapshot = self._snapshot
+        return _complete(snapshot.config_ids, snapshot.config_names, text)
+
+    def complete_machine_id(self, text):
+        snapshot = self._snapshot
+        return _complete(snapshot.machine_ids, snapshot.machine_names, text)
+
+
+def _complete(ids, names, text):
+    if not text:
+        return list(ids)
+    if text.isdigit():
+        start, end = _prefix_range(ids, text)
+        return ids[start:end]
+    return names.ids_with_prefix(text)
+
+
+def _prefix_range(sorted_values, prefix):
+    start = bisect.bisect_left(sorted_values, prefix)
+    end = bisect.bisect_left(sorted_values, prefix + u'\uffff', start)
+    return start, end
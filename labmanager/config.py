@@ -1,8 +1,21 @@
 import os
+import hashlib
 from ConfigParser import SafeConfigParser
 
 
 USER_CONFIG_FILE = os.path.expanduser('~/.lmshrc')
+WSDL_CACHE_DIR = os.path.expanduser('~/.lmsh/wsdl')
+WSDL_CACHE_DAYS = 7
+INVENTORY_DIR = os.path.expanduser('~/.lmsh/inventory')
+MAX_WORKERS = 4
+POOL_IDLE_TIMEOUT = 60
+# These match the defaults in labmanager.api, which isn't imported
+# here so that reading the config stays quick.
+RETRIES = 2
+RETRY_DELAY = 0.5
+BREAKER_FAILURES = 5
+BREAKER_RESET = 30
+REPLAY_TIME_SCALE = 1.0
 SECRET_KEYS = ['password']
 
 
@@ -39,9 +52,94 @@ def load_config(parser, args, cfgparser=None):
     timeout = full_config.get('timeout')
     if timeout:
         timeout = int(timeout)
+    wsdl_cache_days = full_config.get('wsdl_cache_days')
+    if wsdl_cache_days is None:
+        wsdl_cache_days = WSDL_CACHE_DAYS
+    wsdl_cache_dir = full_config.get('wsdl_cache_dir', WSDL_CACHE_DIR)
+    if wsdl_cache_dir:
+        wsdl_cache_dir = os.path.expanduser(wsdl_cache_dir)
+    if _to_bool(full_config.get('no_wsdl_cache')):
+        wsdl_cache_dir = None
     return APIConfig(full_config['hostname'], full_config['username'],
                      full_config.get('password'), full_config['organization'],
-                     full_config['workspace'], timeout)
+                     full_config['workspace'], timeout,
+                     wsdl_cache_dir=wsdl_cache_dir,
+                     wsdl_cache_days=int(wsdl_cache_days),
+                     # Only for this run, never from the config file,
+                     # or every run would download the WSDL again.
+                     refresh_wsdl=bool(cmd_line_cfg_values.get(
+                         'refresh_wsdl')),
+                     max_workers=int(full_config.get('max_workers',
+                                                     MAX_WORKERS)),
+                     keep_alive=not _to_bool(full_config.get('no_keep_alive')),
+                     pool_size=_get_int(full_config, 'pool_size', None),
+                     pool_idle_timeout=_get_int(full_config,
+                                                'pool_idle_timeout',
+                                                POOL_IDLE_TIMEOUT),
+                     scheme=full_config.get('scheme') or 'https',
+                     deadlines=parse_deadlines(full_config.get('deadlines')),
+                     cache_ttls=parse_cache_ttls(
+                         full_config.get('cache_ttls')),
+                     retries=_get_int(full_config, 'retries', RETRIES),
+                     retry_delay=float(full_config.get('retry_delay',
+                                                       RETRY_DELAY)),
+                     breaker_failures=_get_int(full_config,
+                                               'breaker_failures',
+                                               BREAKER_FAILURES),
+                     breaker_reset=_get_int(full_config, 'breaker_reset',
+                                            BREAKER_RESET),
+                     stream_lists=_to_bool(full_config.get('stream_lists')),
+                     record_cassette=_get_path(full_config,
+                                               'record_cassette'),
+                     replay_cassette=_get_path(full_config,
+                                               'replay_cassette'),
+                     replay_time_scale=float(full_config.get(
+                         'replay_time_scale', REPLAY_TIME_SCALE)))
+
+
+def parse_deadlines(value):
+    """Parse per method deadlines, e.g. 'GetMachine=10,ListMachines=30'.
+
+    Returns a dict of method name to seconds.
+
+    """
+    return _parse_seconds(value, 'deadline')
+
+
+def parse_cache_ttls(value):
+    """Parse per method cache lifetimes, e.g. 'list_machines=5'.
+
+    Returns a dict of LabManager method name to seconds, see
+    cache.CachingLabManager.DEFAULT_TTLS for the methods.
+
+    """
+    return _parse_seconds(value, 'cache ttl')
+
+
+def _parse_seconds(value, what):
+    seconds_by_method = {}
+    if not value:
+        return seconds_by_method
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        method_name, sep, seconds = item.partition('=')
+        if not sep:
+            raise ValueError("invalid %s %r, expected "
+                             "METHOD=SECONDS" % (what, item.strip()))
+        seconds_by_method[method_name.strip()] = float(seconds)
+    return seconds_by_method
+
+
+def inventory_path(api_config, directory=INVENTORY_DIR):
+    """Return the file the inventory for api_config is saved in.
+
+    Each server, organization and workspace has its own inventory.
+
+    """
+    key = '|'.join([api_config.url, api_config.organization or '',
+                    api_config.workspace or ''])
+    return os.path.join(directory, hashlib.sha1(key).hexdigest() + '.json')
 
 
 def load_config_from_config_file(cfgparser, section, valid_keys):
@@ -64,6 +162,28 @@ def load_config_from_config_file(cfgparser, section, valid_keys):
     return loaded_cfg
 
 
+def _get_int(full_config, key, default):
+    value = full_config.get(key)
+    if value is None:
+        return default
+    return int(value)
+
+
+def _get_path(full_config, key):
+    value = full_config.get(key)
+    if value:
+        return os.path.expanduser(value)
+    return None
+
+
+def _to_bool(value):
+    # Values from the config file are strings, values from
+    # the command line are already bools.
+    if isinstance(value, basestring):
+        return value.strip().lower() in ('1', 'yes', 'true', 'on')
+    return bool(value)
+
+
 def _default_cmd_line_options(parser, args):
     return dict([(k, v) for k, v in vars(args).items()
                  if parser.get_default(k) == v])
@@ -78,15 +198,71 @@ def _non_default_cmd_line_options(parser, args):
 
 class APIConfig(object):
     def __init__(self, hostname, username, password,
-                 organization, workspace, timeout=None):
+                 organization, workspace, timeout=None,
+                 wsdl_cache_dir=WSDL_CACHE_DIR,
+                 wsdl_cache_days=WSDL_CACHE_DAYS, refresh_wsdl=False,
+                 max_workers=MAX_WORKERS, keep_alive=True, pool_size=None,
+                 pool_idle_timeout=POOL_IDLE_TIMEOUT, scheme='https',
+                 deadlines=None, cache_ttls=None, retries=RETRIES,
+                 retry_delay=RETRY_DELAY,
+                 breaker_failures=BREAKER_FAILURES,
+                 breaker_reset=BREAKER_RESET, stream_lists=False,
+                 record_cassette=None, replay_cassette=None,
+                 replay_time_scale=REPLAY_TIME_SCALE):
         self.hostname = hostname
         self.username = username
         self.password = password
         self.organization = organization
         self.workspace = workspace
         self.timeout = timeout
+        # A wsdl_cache_dir of None disables the WSDL cache, and
+        # a wsdl_cache_days of 0 means cached entries never expire.
+        self.wsdl_cache_dir = wsdl_cache_dir
+        self.wsdl_cache_days = wsdl_cache_days
+        self.refresh_wsdl = refresh_wsdl
+        # The maximum number of concurrent requests made
+        # to the server.
+        self.max_workers = max_workers
+        # Whether to keep connections to the server open between
+        # requests, and if so, how many idle connections to keep
+        # (defaults to max_workers) and for how long.
+        self.keep_alive = keep_alive
+        self.pool_size = pool_size
+        self.pool_idle_timeout = pool_idle_timeout
+        # Real Lab Manager servers are always https, http is
+        # for talking to tests/fakeserver.py.
+        self.scheme = scheme
+        # Per method deadlines (method name -> seconds) on top of the
+        # defaults in api.DEFAULT_DEADLINES.  How many times read
+        # calls are retried, and how long to wait before the first
+        # retry.  After breaker_failures calls in a row fail to reach
+        # the server, calls fail straight away for breaker_reset
+        # seconds.  A breaker_failures of 0 disables this.
+        if deadlines is None:
+            deadlines = {}
+        self.deadlines = deadlines
+        self.retries = retries
+        self.retry_delay = retry_delay
+        # Per method lifetimes (method name -> seconds) of cached
+        # results, on top of cache.CachingLabManager.DEFAULT_TTLS.
+        if cache_ttls is None:
+            cache_ttls = {}
+        self.cache_ttls = cache_ttls
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        # Parse the configuration and machine lists straight into
+        # records as they're read, see labmanager.streaming.
+        self.stream_lists = stream_lists
+        # Record every request and reply to the record_cassette file,
+        # or serve the replies recorded in replay_cassette instead of
+        # talking to the server, taking replay_time_scale times as
+        # long as the server did (0 doesn't wait at all).  See
+        # labmanager.cassette.
+        self.record_cassette = record_cassette
+        self.replay_cassette = replay_cassette
+        self.replay_time_scale = replay_time_scale
 
     @property
     def url(self):
-        return 'https://%s/LabManager/SOAP/LabManager.asmx?WSDL' % \
-            self.hostname
+        return '%s://%s/LabManager/SOAP/LabManager.asmx?WSDL' % (
+            self.scheme, self.hostname)
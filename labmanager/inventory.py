@@ -0,0 +1,317 @@
+"""A searchable local copy of every configuration and machine.
+
+The Inventory is built from list_all_configurations() and the
+machines of every configuration, and keeps an index of the values of
+the fields people search by (name, owner, IP, MAC, deployed state,
+type, ...) so a search never has to go back to the server.
+
+Refreshing is incremental: the configuration list is always fetched
+again, but machines are only listed again for configurations that are
+new, changed, or deployed (the machines of a deployed configuration
+can change state at any time, those of an undeployed one can't).
+
+The inventory can be saved to and loaded from a JSON file, so a new
+lmsh process can answer searches before it has talked to the server.
+
+"""
+import os
+import json
+import time
+import bisect
+import fnmatch
+
+from labmanager import records
+
+
+INVENTORY_VERSION = 1
+
+# Search field -> the record fields it matches.
+CONFIGURATION_FIELDS = {
+    'id': ('id',),
+    'name': ('name',),
+    'owner': ('owner',),
+    'deployed': ('isDeployed',),
+    'type': ('type',),
+    'public': ('isPublic',),
+}
+MACHINE_FIELDS = {
+    'id': ('id',),
+    'name': ('name',),
+    'ip': ('internalIP', 'externalIP'),
+    'mac': ('macAddress',),
+    'deployed': ('isDeployed',),
+    'status': ('status',),
+    'config': ('configID',),
+}
+# Fields that only make sense for machines, a search using any of
+# them is a machine search.
+MACHINE_ONLY_FIELDS = set(MACHINE_FIELDS) - set(CONFIGURATION_FIELDS)
+WILDCARDS = '*?['
+
+
+class InvalidQueryError(Exception):
+    pass
+
+
+class _FieldIndex(object):
+    # Maps the normalized values of one search field to the ids of the
+    # objects with that value.  The values are also kept sorted so a
+    # wildcard pattern only has to look at the values that share its
+    # literal prefix.
+    def __init__(self):
+        self.ids_by_value = {}
+        self._sorted_values = None
+
+    def add(self, value, object_id):
+        self.ids_by_value.setdefault(value, set()).add(object_id)
+
+    def match(self, pattern):
+        if not _has_wildcard(pattern):
+            return self.ids_by_value.get(pattern, set())
+        if self._sorted_values is None:
+            self._sorted_values = sorted(self.ids_by_value)
+        prefix = _literal_prefix(pattern)
+        start = bisect.bisect_left(self._sorted_values, prefix)
+        end = bisect.bisect_left(self._sorted_values, prefix + u'\uffff',
+                                 start)
+        ids = set()
+        for value in self._sorted_values[start:end]:
+            if fnmatch.fnmatchcase(value, pattern):
+                ids.update(self.ids_by_value[value])
+        return ids
+
+
+class _Index(object):
+    def __init__(self, objects, fields, enum_names):
+        self.objects = dict([(obj['id'], obj) for obj in objects])
+        self.fields = fields
+        self._indexes = {}
+        for name, record_fields in fields.items():
+            index = self._indexes[name] = _FieldIndex()
+            for obj in objects:
+                for record_field in record_fields:
+                    value = obj.get(record_field)
+                    if value is None or value == '':
+                        continue
+                    for key in _keys(value, enum_names.get(record_field)):
+                        index.add(key, obj['id'])
+
+    def find(self, terms):
+        ids = None
+        for name, pattern in terms:
+            if name not in self._indexes:
+                raise InvalidQueryError("unknown field: %s (choose from %s)"
+                                        % (name, ', '.join(sorted(
+                                            self.fields))))
+            matches = self._indexes[name].match(pattern.lower())
+            if ids is None:
+                ids = set(matches)
+            else:
+                ids &= matches
+            if not ids:
+                break
+        if ids is None:
+            ids = self.objects
+        return [self.objects[object_id] for object_id in sorted(ids)]
+
+
+class Inventory(object):
+    """Every configuration and machine, indexed for searching.
+
+    enum_names optionally maps record fields to {value: name} dicts,
+    like LMShell.ENUM_TYPES, so that a search can use names such as
+    type=library as well as the raw values.
+
+    """
+    def __init__(self, lmapi, path=None, enum_names=None):
+        self._lmapi = lmapi
+        self.path = path
+        self._enum_names = enum_names or {}
+        # config id -> list of machines
+        self._machines = {}
+        self._fingerprints = {}
+        self.updated = None
+        # The saved inventory is only read the first time it's needed,
+        # not by every lmsh command.
+        self._loaded = path is None
+        self._build([])
+
+    def __len__(self):
+        self._load_once()
+        return len(self._config_index.objects)
+
+    def age(self):
+        """Seconds since the inventory was last refreshed, or None."""
+        self._load_once()
+        if self.updated is None:
+            return None
+        return time.time() - self.updated
+
+    def expire(self):
+        """Mark the inventory as out of date.
+
+        A saved inventory is marked as well, so the next lmsh process
+        refreshes it before searching it.
+
+        """
+        self._load_once()
+        self.updated = None
+        if self.path is not None and os.path.exists(self.path):
+            self.save()
+
+    def refresh(self):
+        """Bring the inventory up to date with the server.
+
+        Returns a (number of configurations, number of configurations
+        whose machines were listed, list of errors) tuple.
+
+        """
+        self._load_once()
+        configs = self._lmapi.list_all_configurations()
+        fingerprints = dict([(c['id'], _fingerprint(c)) for c in configs])
+        stale = [c['id'] for c in configs if c.get('isDeployed') or
+                 self._fingerprints.get(c['id']) != fingerprints[c['id']]]
+        machines = dict([(c['id'], self._machines.get(c['id'], []))
+                         for c in configs])
+        errors = []
+        for result in self._lmapi.iter_machines(stale):
+            if result.ok:
+                machines[result.item] = result.value
+            else:
+                # Keep what we had, and make sure it's listed
+                # again next time.
+                fingerprints.pop(result.item, None)
+                errors.append(result)
+        self._machines = machines
+        self._fingerprints = fingerprints
+        self._build(configs)
+        self.updated = time.time()
+        if self.path is not None:
+            self.save()
+        return len(configs), len(stale), errors
+
+    def _build(self, configs):
+        all_machines = []
+        for config_machines in self._machines.values():
+            all_machines.extend(config_machines)
+        # Build the new indexes before swapping them in, so
+        # a search never sees a half built index.
+        self._config_index, self._machine_index = (
+            _Index(configs, CONFIGURATION_FIELDS, self._enum_names),
+            _Index(all_machines, MACHINE_FIELDS, self._enum_names))
+
+    def find(self, terms, kind=None):
+        """Find configurations or machines.
+
+        terms is a list of (field, pattern) tuples, all of which have
+        to match.  Patterns are case insensitive and can use shell
+        style wildcards (*, ? and [...]).  kind is 'configs' or
+        'machines', if it's None then the search is for machines if
+        any of the fields only apply to machines, and configurations
+        otherwise.  Returns a (kind, list of matches) tuple.
+
+        """
+        self._load_once()
+        if kind is None:
+            kind = 'configs'
+            if [name for name, pattern in terms
+                    if name in MACHINE_ONLY_FIELDS]:
+                kind = 'machines'
+        if kind == 'configs':
+            return kind, self._config_index.find(terms)
+        elif kind == 'machines':
+            return kind, self._machine_index.find(terms)
+        raise InvalidQueryError("unknown kind: %s" % kind)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        data = {
+            'version': INVENTORY_VERSION,
+            'updated': self.updated,
+            'configurations': [records.as_dict(c) for c in
+                               self._config_index.objects.values()],
+            'machines': [[config_id, [records.as_dict(m) for m in machines]]
+                         for config_id, machines in self._machines.items()],
+            'fingerprints': self._fingerprints.items(),
+        }
+        # Write to a temporary file first so a crash never
+        # leaves a truncated inventory behind.
+        temp_path = self.path + '.tmp'
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        f = os.fdopen(fd, 'w')
+        try:
+            json.dump(data, f, default=unicode)
+        finally:
+            f.close()
+        os.rename(temp_path, self.path)
+
+    def _load_once(self):
+        if not self._loaded:
+            self.load()
+
+    def load(self):
+        """Load a saved inventory, returns False if there isn't one."""
+        self._loaded = True
+        if self.path is None or not os.path.exists(self.path):
+            return False
+        try:
+            data = json.load(open(self.path))
+        except ValueError:
+            return False
+        if data.get('version') != INVENTORY_VERSION:
+            return False
+        self._machines = dict([(config_id, machines) for config_id, machines
+                               in data['machines']])
+        self._fingerprints = dict([(config_id, fingerprint) for
+                                   config_id, fingerprint in
+                                   data['fingerprints']])
+        self._build(data['configurations'])
+        self.updated = data['updated']
+        return True
+
+
+def parse_terms(args):
+    """Parse ['field=pattern', ...] into a list of (field, pattern)."""
+    terms = []
+    for arg in args:
+        if '=' not in arg:
+            raise InvalidQueryError("expected field=value, got: %s" % arg)
+        name, pattern = arg.split('=', 1)
+        terms.append((name.lower(), pattern))
+    return terms
+
+
+def _keys(value, enum_names):
+    keys = [_normalize(value)]
+    if enum_names is not None and value in enum_names:
+        keys.append(enum_names[value].lower())
+    return keys
+
+
+def _normalize(value):
+    if isinstance(value, bool):
+        return value and u'true' or u'false'
+    return unicode(value).lower()
+
+
+def _fingerprint(config):
+    # Saved inventories have strings where the server returns
+    # datetimes, so compare the JSON form of both.
+    return json.dumps(records.as_dict(config), sort_keys=True,
+                      default=unicode)
+
+
+def _has_wildcard(pattern):
+    for char in WILDCARDS:
+        if char in pattern:
+            return True
+    return False
+
+
+def _literal_prefix(pattern):
+    for i, char in enumerate(pattern):
+        if char in WILDCARDS:
+            return pattern[:i]
+    return pattern
@@ -0,0 +1,283 @@
+"""Writers that stream command output one row at a time.
+
+Every writer is created with the stream to write to and a row function
+that turns an object (a configuration or machine record) into the list
+of values to show.  write() is called once per object as soon as it is
+available, and close() once at the end, so nothing needs to hold the
+complete output in memory.
+
+"""
+import json
+import textwrap
+import threading
+
+
+FORMATS = ['table', 'tsv', 'json', 'ndjson']
+
+
+class TableWriter(object):
+    """A text table with fixed column widths.
+
+    The table looks the same as a Texttable with HEADER | VLINES
+    decoration.  Because the column widths are fixed up front, each
+    row can be written as soon as it's available.  Values longer than
+    their column are wrapped onto multiple lines.
+
+    """
+    def __init__(self, stream, row_func, headers, widths):
+        self._stream = stream
+        self._row_func = row_func
+        self._headers = headers
+        self._widths = widths
+        self._wrote_header = False
+
+    def write_header(self):
+        self._write_line([_center(h, w) for h, w in
+                          zip(self._headers, self._widths)])
+        self._stream.write('=+='.join(['=' * w for w in self._widths]))
+        self._stream.write('\n')
+        self._wrote_header = True
+
+    def write(self, obj):
+        if not self._wrote_header:
+            self.write_header()
+        cells = [_wrap(value, width) for value, width in
+                 zip(self._row_func(obj), self._widths)]
+        for i in xrange(max([len(c) for c in cells])):
+            self._write_line([_line(cell, i).ljust(width) for cell, width
+                              in zip(cells, self._widths)])
+
+    def close(self):
+        pass
+
+    def _write_line(self, cells):
+        self._stream.write(' | '.join(cells))
+        self._stream.write('\n')
+
+
+class TSVWriter(object):
+    """Tab separated values with no header, for use with cut, awk, etc."""
+    def __init__(self, stream, row_func, headers=None, widths=None):
+        self._stream = stream
+        self._row_func = row_func
+
+    def write(self, obj):
+        self._stream.write('\t'.join([_single_line(value) for value in
+                                      self._row_func(obj)]))
+        self._stream.write('\n')
+
+    def close(self):
+        pass
+
+
+class NDJSONWriter(object):
+    """One JSON object per line, with every field of the object."""
+    def __init__(self, stream, row_func=None, headers=None, widths=None):
+        self._stream = stream
+
+    def write(self, obj):
+        self._stream.write(_to_json(obj))
+        self._stream.write('\n')
+
+    def close(self):
+        pass
+
+
+class JSONWriter(object):
+    """A single JSON list of objects, written one object at a time."""
+    def __init__(self, stream, row_func=None, headers=None, widths=None):
+        self._stream = stream
+        self._count = 0
+
+    def write(self, obj):
+        if self._count == 0:
+            self._stream.write('[\n')
+        else:
+            self._stream.write(',\n')
+        self._stream.write(_to_json(obj))
+        self._count += 1
+
+    def close(self):
+        if self._count == 0:
+            self._stream.write('[')
+        self._stream.write('\n]\n')
+
+
+_WRITERS = {
+    'table': TableWriter,
+    'tsv': TSVWriter,
+    'json': JSONWriter,
+    'ndjson': NDJSONWriter,
+}
+
+
+def create_writer(output_format, stream, row_func, headers, widths):
+    """Create a writer for one of the names in FORMATS."""
+    try:
+        writer_cls = _WRITERS[output_format]
+    except KeyError:
+        raise ValueError("unknown output format: %s" % output_format)
+    return writer_cls(stream, row_func, headers, widths)
+
+
+class MergedWriter(object):
+    """Merge the output of several sources into one, with a source column.
+
+    Used when one command is run against several servers at once.
+    Each server's objects are passed to write() from its own thread,
+    and every object is written as soon as it arrives, with the name
+    of its source in an extra first column (or 'source' field, for
+    the json formats).  The columns of the first write() are used for
+    every source.
+
+    """
+    def __init__(self, output_format, stream, source_width):
+        self._output_format = output_format
+        self._stream = stream
+        self._source_width = source_width
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def write(self, source, objects, columns, headers, widths, row_builder):
+        """Write objects from source.
+
+        row_builder(columns) returns the function that turns an object
+        into a row of values for columns.  Returns the number of
+        objects written.
+
+        """
+        self._lock.acquire()
+        try:
+            if self._writer is None:
+                build_row = row_builder(columns)
+                self._writer = create_writer(
+                    self._output_format, self._stream,
+                    lambda sourced: [sourced.source] +
+                    build_row(sourced.obj),
+                    ['source'] + headers, [self._source_width] + widths)
+        finally:
+            self._lock.release()
+        count = 0
+        for obj in objects:
+            self._lock.acquire()
+            try:
+                self._writer.write(_SourcedObject(source, obj))
+            finally:
+                self._lock.release()
+            count += 1
+        return count
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class _SourcedObject(object):
+    __slots__ = ('source', 'obj')
+
+    def __init__(self, source, obj):
+        self.source = source
+        self.obj = obj
+
+    def items(self):
+        return [('source', self.source)] + list(self.obj.items())
+
+
+class PrefixedStream(object):
+    """Write whole lines to stream, each one starting with prefix.
+
+    Writes from several PrefixedStreams sharing the same lock never
+    interleave within a line.
+
+    """
+    def __init__(self, stream, prefix, lock):
+        self._stream = stream
+        self._prefix = prefix
+        self._lock = lock
+        self._partial = ''
+
+    def write(self, data):
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        if lines:
+            self._lock.acquire()
+            try:
+                for line in lines:
+                    self._stream.write('%s%s\n' % (self._prefix, line))
+            finally:
+                self._lock.release()
+
+    def flush(self):
+        if self._partial:
+            self.write('\n')
+        self._stream.flush()
+
+
+class ThreadLocalStream(object):
+    """A stream that writes to a different stream on each thread.
+
+    Threads that haven't called set_stream() write to default.  This
+    lets sys.stdout be replaced for the threads running commands
+    without affecting any other thread.
+
+    """
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
+
+    def set_stream(self, stream):
+        self._local.stream = stream
+
+    def _current(self):
+        return getattr(self._local, 'stream', self._default)
+
+    def write(self, data):
+        self._current().write(data)
+
+    def flush(self):
+        self._current().flush()
+
+    # print keeps track of whether it needs a space before the next
+    # item in the file's softspace attribute.  That has to be per
+    # thread too, or concurrent prints lose or gain spaces.
+    def _get_softspace(self):
+        return getattr(self._local, 'softspace', 0)
+
+    def _set_softspace(self, value):
+        self._local.softspace = value
+
+    softspace = property(_get_softspace, _set_softspace)
+
+
+def _to_json(obj):
+    # Dates and anything else json doesn't know about
+    # are written as strings.
+    return json.dumps(dict(obj.items()), default=unicode, sort_keys=True)
+
+
+def _to_text(value):
+    if isinstance(value, basestring):
+        return value
+    return str(value)
+
+
+def _single_line(value):
+    return ' '.join(_to_text(value).split())
+
+
+def _wrap(value, width):
+    return textwrap.wrap(_to_text(value), width) or ['']
+
+
+def _line(lines, index):
+    if index < len(lines):
+        return lines[index]
+    return ''
+
+
+def _center(text, width):
+    # Texttable puts the extra space on the right, str.center()
+    # doesn't always.
+    padding = max(width - len(text), 0)
+    left = padding // 2
+    return ' ' * left + text + ' ' * (padding - left)
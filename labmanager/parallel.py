@@ -0,0 +1,325 @@
+"""Helpers for running independent SOAP calls concurrently.
+
+The Lab Manager API has no batch calls, so anything that touches more
+than one object is a series of independent round trips.  These helpers
+run those round trips on a small, bounded set of threads so the total
+time is closer to the slowest call than to the sum of all of them.
+
+run_parallel() is for a known list of items.  For work that's
+submitted as it comes along, an Executor returns a Future for each
+call, and as_completed() gives the futures back as they finish.
+
+"""
+import sys
+import time
+import threading
+import Queue
+
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class Result(object):
+    """The outcome of calling a function with a single item.
+
+    Exceptions are captured instead of raised so that one failing
+    item doesn't hide the results of all the other items.  Use
+    get() to either return the value or re-raise the original
+    exception.
+
+    """
+    def __init__(self, item, value=None, exc_info=None):
+        self.item = item
+        self.value = value
+        self.exc_info = exc_info
+
+    @property
+    def ok(self):
+        return self.exc_info is None
+
+    @property
+    def error(self):
+        if self.exc_info is not None:
+            return self.exc_info[1]
+
+    def get(self):
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+
+    def __repr__(self):
+        if self.ok:
+            return '<Result %r: %r>' % (self.item, self.value)
+        return '<Result %r: error %r>' % (self.item, self.error)
+
+
+def call_with_result(func, item):
+    try:
+        return Result(item, value=func(item))
+    except Exception:
+        return Result(item, exc_info=sys.exc_info())
+
+
+def run_parallel(func, items, max_workers=DEFAULT_MAX_WORKERS):
+    """Call func(item) for every item using up to max_workers threads.
+
+    A list of Result objects is returned in the same order as items,
+    regardless of the order in which the calls finished.
+
+    """
+    items = list(items)
+    results = [None] * len(items)
+    num_workers = min(max_workers, len(items))
+    if num_workers <= 1:
+        # Not worth starting a thread for.
+        return [call_with_result(func, item) for item in items]
+    work = Queue.Queue()
+    for index, item in enumerate(items):
+        work.put((index, item))
+
+    def _worker():
+        while True:
+            try:
+                index, item = work.get_nowait()
+            except Queue.Empty:
+                return
+            results[index] = call_with_result(func, item)
+
+    threads = [threading.Thread(target=_worker) for i in range(num_workers)]
+    for thread in threads:
+        thread.setDaemon(True)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_parallel_unique(func, items, max_workers=DEFAULT_MAX_WORKERS,
+                        key=None):
+    """Like run_parallel(), but func is only called once per distinct item.
+
+    Two items are the same if key(item) is the same (by default, if
+    the items are equal).  Every item still gets its own Result, in
+    the same order as items, with the value or exception of the one
+    call made for it.
+
+    """
+    items = list(items)
+    if key is None:
+        key = lambda item: item
+    unique = []
+    first_items = {}
+    for item in items:
+        if key(item) not in first_items:
+            first_items[key(item)] = item
+            unique.append(key(item))
+    results = dict(zip(unique, run_parallel(
+        func, [first_items[k] for k in unique], max_workers)))
+    return [Result(item, results[key(item)].value,
+                   results[key(item)].exc_info) for item in items]
+
+
+def imap_unordered(func, items, max_workers=DEFAULT_MAX_WORKERS):
+    """Like run_parallel(), but yield each Result as soon as it's ready.
+
+    The results come back in the order the calls finish, not in the
+    order of items.
+
+    """
+    executor = Executor(max_workers)
+    finished = False
+    try:
+        futures = [executor.submit(call_with_result, func, item)
+                   for item in items]
+        for future in as_completed(futures):
+            yield future.result()
+        finished = True
+    finally:
+        # Once every call is done, waiting only lets the threads see
+        # the shutdown, so none is left blocked in Queue.get() when
+        # the interpreter exits.  Callers that stop early don't wait
+        # for the calls still in flight.
+        executor.shutdown(wait=finished)
+
+
+class TimeoutError(Exception):
+    pass
+
+
+class Future(object):
+    """The pending result of a call submitted to an Executor."""
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._result = None
+        self._callbacks = []
+
+    def done(self):
+        return self._result is not None
+
+    def result(self, timeout=None):
+        """Wait for the call to finish and return its value.
+
+        If the call raised an exception, it's re-raised here.
+
+        """
+        return self._wait(timeout).get()
+
+    def exception(self, timeout=None):
+        """Wait for the call to finish and return its exception or None."""
+        return self._wait(timeout).error
+
+    def add_done_callback(self, func):
+        """Call func(future) when the call finishes.
+
+        If the call has already finished, func is called right away.
+        Otherwise it's called from the thread that ran the call.
+
+        """
+        self._condition.acquire()
+        try:
+            if self._result is None:
+                self._callbacks.append(func)
+                return
+        finally:
+            self._condition.release()
+        func(self)
+
+    def set_result(self, result):
+        """Finish the future with a Result."""
+        self._condition.acquire()
+        try:
+            self._result = result
+            callbacks, self._callbacks = self._callbacks, []
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+        for func in callbacks:
+            func(self)
+
+    def _wait(self, timeout):
+        self._condition.acquire()
+        try:
+            if self._result is None:
+                self._condition.wait(timeout)
+            if self._result is None:
+                raise TimeoutError("call did not finish in %s seconds" %
+                                   timeout)
+            return self._result
+        finally:
+            self._condition.release()
+
+
+class Executor(object):
+    """Run calls on up to max_workers threads.
+
+    Any number of calls can be submitted, the ones that don't have a
+    free thread wait in a queue, so max_workers is also the maximum
+    number of requests in flight.  Threads are started as they're
+    needed and are daemon threads, so an executor that isn't shut down
+    doesn't keep the process alive.
+
+    """
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._work = Queue.Queue()
+        self._threads = []
+        self._idle = 0
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, func, *args, **kwargs):
+        """Schedule func(*args, **kwargs) and return a Future."""
+        future = Future()
+        self._lock.acquire()
+        try:
+            if self._shutdown:
+                raise RuntimeError("cannot submit after shutdown")
+            self._work.put((future, func, args, kwargs))
+            if not self._idle and len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._worker)
+                thread.setDaemon(True)
+                thread.start()
+                self._threads.append(thread)
+            else:
+                self._idle -= 1
+        finally:
+            self._lock.release()
+        return future
+
+    def map(self, func, items):
+        """Submit func(item) for every item and return the futures."""
+        return [self.submit(func, item) for item in items]
+
+    def shutdown(self, wait=True):
+        """Stop the threads once the calls already submitted are done."""
+        self._lock.acquire()
+        try:
+            self._shutdown = True
+            threads = list(self._threads)
+        finally:
+            self._lock.release()
+        for thread in threads:
+            self._work.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _worker(self):
+        while True:
+            work = self._work.get()
+            if work is None:
+                return
+            future, func, args, kwargs = work
+            try:
+                result = Result(None, value=func(*args, **kwargs))
+            except Exception:
+                result = Result(None, exc_info=sys.exc_info())
+            future.set_result(result)
+            self._lock.acquire()
+            try:
+                self._idle += 1
+            finally:
+                self._lock.release()
+
+
+def interruptible_get(queue):
+    """Return queue.get(), waiting in a way ctrl-c can interrupt."""
+    while True:
+        try:
+            # Queue.get() without a timeout can't be
+            # interrupted with ctrl-c.
+            return queue.get(True, 3600)
+        except Queue.Empty:
+            pass
+
+
+def as_completed(futures, timeout=None):
+    """Yield the futures as they finish, fastest first.
+
+    TimeoutError is raised if they haven't all finished within
+    timeout seconds.
+
+    """
+    finished = Queue.Queue()
+    futures = list(futures)
+    for future in futures:
+        future.add_done_callback(finished.put)
+    if timeout is not None:
+        deadline = time.time() + timeout
+    remaining = len(futures)
+    while remaining:
+        if timeout is None:
+            # Queue.get() without a timeout can't be
+            # interrupted with ctrl-c.
+            wait = 3600
+        else:
+            wait = max(deadline - time.time(), 0)
+        try:
+            future = finished.get(True, wait)
+        except Queue.Empty:
+            if timeout is None:
+                continue
+            raise TimeoutError("%s of %s calls did not finish in %s "
+                               "seconds" % (remaining, len(futures), timeout))
+        remaining -= 1
+        yield future
@@ -0,0 +1,188 @@
+"""Compact, read only records for the objects returned by the SOAP API.
+
+suds returns a sudsobject for every configuration and machine, and
+converting each of those to a dict with suds.sudsobject.asdict is a
+noticeable amount of work once an organization has thousands of
+configurations.  A Record is a tuple subclass (so it has no per instance
+__dict__) whose class is created once per type and set of fields, along
+with a precompiled extractor that pulls all the field values out of a
+sudsobject in a single call.
+
+Records look like read only dicts, ``record['name']``, ``'name' in
+record``, ``record.get('name')``, ``dict(record)`` and comparing equal to
+a dict all work, so existing code that expects dicts keeps working.
+Fields are also available as attributes, ``record.name``.
+
+"""
+import operator
+
+
+_RECORD_TYPES = {}
+_RESERVED_NAMES = ('get', 'keys', 'values', 'items', 'iterkeys',
+                   'itervalues', 'iteritems', 'has_key')
+
+
+class Record(tuple):
+    __slots__ = ()
+    _fields = ()
+    _positions = {}
+
+    def __getitem__(self, key):
+        try:
+            return tuple.__getitem__(self, self._positions[key])
+        except (KeyError, TypeError):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def has_key(self, key):
+        return key in self._positions
+
+    def get(self, key, default=None):
+        try:
+            return tuple.__getitem__(self, self._positions[key])
+        except (KeyError, TypeError):
+            return default
+
+    def keys(self):
+        return list(self._fields)
+
+    def values(self):
+        return list(tuple.__iter__(self))
+
+    def items(self):
+        return zip(self._fields, tuple.__iter__(self))
+
+    def iterkeys(self):
+        return iter(self._fields)
+
+    def itervalues(self):
+        return tuple.__iter__(self)
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self._fields == other._fields and \
+                tuple.__eq__(self, other)
+        elif isinstance(other, dict):
+            return dict(self.items()) == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash((self._fields, tuple(tuple.__iter__(self))))
+
+    def __getnewargs__(self):
+        return (tuple(tuple.__iter__(self)),)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, ', '.join(
+            ['%s=%r' % item for item in self.items()]))
+
+
+def record_type(name, fields):
+    """Return the Record subclass for a type name and tuple of fields."""
+    key = (name, fields)
+    cls = _RECORD_TYPES.get(key)
+    if cls is None:
+        cls = _create_record_type(name, fields)
+        # Two threads could both get here, in which case one
+        # of the two (identical) classes wins, which is fine.
+        _RECORD_TYPES[key] = cls
+    return cls
+
+
+def _create_record_type(name, fields):
+    namespace = {
+        '__slots__': (),
+        '_fields': fields,
+        '_positions': dict([(f, i) for i, f in enumerate(fields)]),
+    }
+    for position, field in enumerate(fields):
+        if field not in _RESERVED_NAMES and not field.startswith('_'):
+            namespace[field] = property(_field_getter(position))
+    cls = type(str(name), (Record,), namespace)
+    if len(fields) == 1:
+        # attrgetter with a single name returns the value, not a tuple.
+        getter = operator.attrgetter(fields[0])
+        cls._extract = staticmethod(
+            lambda obj: tuple.__new__(cls, (getter(obj),)))
+        cls._values = staticmethod(lambda obj: (getter(obj),))
+    elif fields:
+        getter = operator.attrgetter(*fields)
+        cls._extract = staticmethod(
+            lambda obj: tuple.__new__(cls, getter(obj)))
+        cls._values = staticmethod(getter)
+    else:
+        cls._extract = staticmethod(lambda obj: tuple.__new__(cls, ()))
+        cls._values = staticmethod(lambda obj: ())
+    return cls
+
+
+def _field_getter(position):
+    return lambda self: tuple.__getitem__(self, position)
+
+
+def row_getter(cls, fields):
+    """Return a function that gets the values of fields from a cls object.
+
+    The returned function returns a list of values in the same order
+    as fields, with '' for any field the object doesn't have.  For
+    Record types the field positions are looked up once, up front.
+
+    """
+    if not issubclass(cls, Record):
+        return lambda obj: [obj.get(field, '') for field in fields]
+    positions = [cls._positions.get(field) for field in fields]
+    getitem = tuple.__getitem__
+    if None in positions:
+        return lambda obj: [getitem(obj, p) if p is not None else ''
+                            for p in positions]
+    return lambda obj: [getitem(obj, p) for p in positions]
+
+
+def make_record(cls, values):
+    """Create a record of type cls (see record_type) from its values."""
+    return tuple.__new__(cls, values)
+
+
+def from_suds(suds_type):
+    """Convert a sudsobject to a Record.
+
+    Records (from streaming.StreamingCalls) are returned as they are.
+
+    """
+    if isinstance(suds_type, Record):
+        return suds_type
+    cls = record_type(suds_type.__class__.__name__,
+                      tuple(suds_type.__keylist__))
+    return cls._extract(suds_type)
+
+
+def as_dict(obj):
+    """Return a plain dict for a Record (or anything dict like)."""
+    return dict(obj.items())
+
+
+def same_as_suds(record, suds_type):
+    """Return True if converting suds_type would give an equal record.
+
+    This is cheaper than converting, no new record is created.
+
+    """
+    if isinstance(suds_type, Record):
+        return record == suds_type
+    cls = type(record)
+    return cls._fields == tuple(suds_type.__keylist__) and \
+        tuple.__eq__(record, cls._values(suds_type))
@@ -0,0 +1,138 @@
+"""Run lmsh commands in a long lived process over a local unix socket.
+
+Running ``lmsh --serve`` creates a single LabManager client and then
+waits for commands on a unix socket.  ``lmsh --connect <command>``
+sends the command to the server and prints the output, so scripts that
+run many single commands only pay for python startup and one SOAP
+round trip per command instead of loading the config, the WSDL, and
+creating the client every time.
+
+The protocol is a single line of JSON in each direction.  The request
+is ``{"command": "<line>"}`` and the response is
+``{"stdout": "...", "stderr": "...", "return_code": <int>}``.
+
+"""
+import os
+import sys
+import json
+import socket
+import SocketServer
+from StringIO import StringIO
+
+
+DEFAULT_SOCKET_PATH = os.path.expanduser('~/.lmsh/lmsh.sock')
+
+
+class ServerNotRunningError(Exception):
+    pass
+
+
+class _CommandHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            command = json.loads(line)['command']
+        except (ValueError, KeyError, TypeError):
+            response = {'stdout': '', 'stderr': 'invalid request\n',
+                        'return_code': 1}
+        else:
+            response = self.server.run_command(command)
+        self.wfile.write(json.dumps(response) + '\n')
+
+
+class LMShellServer(SocketServer.UnixStreamServer):
+    """Serve LMShell.onecmd() over a unix socket.
+
+    Commands are handled one at a time.  The shell writes its output
+    with print statements, so sys.stdout and sys.stderr are swapped
+    out while a command runs, which is not something that can be done
+    from multiple threads at once.
+
+    """
+    def __init__(self, path, lmshell):
+        self.lmshell = lmshell
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        if os.path.exists(path):
+            # A stale socket from a server that didn't shut down
+            # cleanly, or a server that's still running.
+            if _is_listening(path):
+                raise socket.error("lmsh server already running: %s"
+                                   % path)
+            os.remove(path)
+        # Only the current user should be able to run
+        # commands with their credentials.
+        old_umask = os.umask(0077)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, path,
+                                                   _CommandHandler)
+        finally:
+            os.umask(old_umask)
+
+    def run_command(self, command):
+        # Imported here to avoid a circular import, the shell
+        # module imports this module.
+        from labmanager.shell import ReturnCode
+        stdout, stderr = StringIO(), StringIO()
+        original = sys.stdout, sys.stderr, self.lmshell.stdout
+        sys.stdout, sys.stderr, self.lmshell.stdout = stdout, stderr, stdout
+        try:
+            try:
+                result = self.lmshell.onecmd(command)
+            except Exception, e:
+                sys.stderr.write("ERROR: %s\n" % e)
+                result = ReturnCode(1)
+        finally:
+            sys.stdout, sys.stderr, self.lmshell.stdout = original
+        if isinstance(result, ReturnCode):
+            return_code = result.return_code
+        else:
+            return_code = 0
+        return {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(),
+                'return_code': return_code}
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+
+def _is_listening(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+            return True
+        except socket.error:
+            return False
+    finally:
+        sock.close()
+
+
+def send_command(command, path=DEFAULT_SOCKET_PATH):
+    """Send a single command to a running lmsh server.
+
+    The response dict is returned, see the module docstring for
+    its format.
+
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except socket.error, e:
+            raise ServerNotRunningError(
+                "could not connect to lmsh server at %s: %s" % (path, e))
+        sock.sendall(json.dumps({'command': command}) + '\n')
+        response = sock.makefile('rb').readline()
+    finally:
+        sock.close()
+    if not response:
+        raise ServerNotRunningError("lmsh server at %s closed the "
+                                    "connection" % path)
+    return json.loads(response)
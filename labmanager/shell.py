@@ -1,20 +1,31 @@
 import argparse
 import getpass
 import cmd
+import copy
+import os
 import sys
-from pprint import pprint
+import time
+import socket
+import threading
 import textwrap
-import rlcompleter
-import readline
+import itertools
 import logging
 import ConfigParser
-import urllib2
-
-from texttable import Texttable
-import suds
 
+# suds, readline and urllib2 are imported when they're first needed,
+# so that 'lmsh --list-sections', 'lmsh --help' and 'lmsh help' don't
+# pay for importing them.
 from labmanager import api
+from labmanager import batch
+from labmanager import cache
+from labmanager import completion
 from labmanager import config
+from labmanager import inventory
+from labmanager import output
+from labmanager import parallel
+from labmanager import records
+from labmanager import server
+from labmanager import stats
 from labmanager.loghandler import NullHandler
 
 # A mapping from the SOAP returned names
@@ -31,23 +42,49 @@ DISPLAY_TYPE_MAP = {
     'OwnerFullName': 'owner',
     'configID': 'config',
 }
-SOAP_API_EXCEPTION = (
-    suds.MethodNotFound,
-    suds.PortNotFound,
-    suds.ServiceNotFound,
-    suds.TypeNotFound,
-    suds.BuildError,
-    suds.SoapHeadersNotPermitted,
-    suds.WebFault,
-    suds.transport.TransportError,
-)
+
+
+def soap_api_exceptions():
+    import httplib
+    import urllib2
+    import suds
+    import suds.transport
+    from labmanager import cassette
+    return (
+        suds.MethodNotFound,
+        suds.PortNotFound,
+        suds.ServiceNotFound,
+        suds.TypeNotFound,
+        suds.BuildError,
+        suds.SoapHeadersNotPermitted,
+        suds.WebFault,
+        suds.transport.TransportError,
+        httplib.HTTPException,
+        # A passed deadline, see api.is_connection_error().
+        socket.error,
+        urllib2.URLError,
+        api.CircuitOpenError,
+        cassette.CassetteError,
+    )
 
 
 class LMShell(cmd.Cmd):
     prompt = '(lmsh) '
     LIST_CFG_COLUMNS = ['id', 'name', 'isDeployed', 'type', 'owner']
+    LIST_CFG_WIDTHS = [6, 30, 8, 10, 15]
     LIST_MACHINES_COLUMNS = ['id', 'name', 'internalIP', 'externalIP',
                              'macAddress', 'memory', 'configID']
+    # Not every machine has every column, so the widths
+    # are looked up by column name.
+    LIST_MACHINES_WIDTHS = {
+        'id': 6,
+        'name': 20,
+        'internalIP': 15,
+        'externalIP': 15,
+        'macAddress': 17,
+        'memory': 6,
+        'configID': 6,
+    }
     ENUM_TYPES = {
         'type': {
             1: 'workspace',
@@ -61,13 +98,65 @@ class LMShell(cmd.Cmd):
             128: 'invalid',
         }
     }
+    # The config type for each of the list subcommands.
+    CONFIG_TYPES = {
+        'library': api.LabManager.LIBRARY_CONFIGURATIONS,
+        'workspace': api.LabManager.WORKSPACE_CONFIGURATION,
+    }
+    WAIT_STATES = {
+        'on': api.LabManager.STATUS_ON,
+        'off': api.LabManager.STATUS_OFF,
+    }
+    # A mapping from the action names used with the
+    # 'action' command to the LabManager action constants.
+    MACHINE_ACTIONS = {
+        'poweron': api.LabManager.POWER_ON,
+        'poweroff': api.LabManager.POWER_OFF,
+        'suspend': api.LabManager.SUSPEND,
+        'resume': api.LabManager.RESUME,
+        'reset': api.LabManager.RESET,
+        'snapshot': api.LabManager.SNAPSHOT,
+        'revert': api.LabManager.REVERT,
+        'shutdown': api.LabManager.SHUTDOWN,
+    }
+
+    # Searches refresh the inventory when it's older than this
+    # many seconds.
+    INVENTORY_MAX_AGE = 300
+    # Commands after which the inventory and the completion index
+    # are out of date.
+    INVENTORY_CHANGING_COMMANDS = ['checkout', 'delete', 'deploy',
+                                   'undeploy', 'action']
 
-    def __init__(self, lmapi, stdin=None, stdout=None):
+    def __init__(self, lmapi, stdin=None, stdout=None,
+                 completion_index=None, output_format='table',
+                 stats=None, inventory=None):
         cmd.Cmd.__init__(self, '', stdin, stdout)
         self._lmapi = lmapi
+        # The default for the --format option of list and machines.
+        self.output_format = output_format
+        # An optional completion.CompletionIndex used to complete
+        # config and machine IDs.
+        self.completion_index = completion_index
+        # The api.Snapshot used by 'list --changes', for each of
+        # the list subcommands.
+        self._change_snapshots = {}
+        # An optional stats.Stats, output rendering is recorded
+        # in it and the 'stats' command shows it.
+        self.stats = stats
+        # When a command is run against several servers at once, the
+        # output.MergedWriter that objects are written to, and the
+        # name of this shell's server (its .lmshrc section).
+        self.merged_output = None
+        self.source = None
+        # The inventory.Inventory searched by the 'find' command,
+        # created when it's first needed if not given.
+        self.inventory = inventory
 
     def complete_list(self, text, line, begidx, endidx):
         subcommands = ['library', 'workspace']
+        if text.startswith('-'):
+            subcommands = ['--changes']
         if not text:
             return subcommands
         return [c for c in subcommands if c.startswith(text)]
@@ -77,7 +166,7 @@ class LMShell(cmd.Cmd):
         List configurations.
         Syntax:
 
-        list [library | workspace]
+        list [--format <format>] [library | workspace]
 
         List all library and workspace configurations:
 
@@ -92,20 +181,66 @@ class LMShell(cmd.Cmd):
 
             list workspace
 
+        The output format can be one of table (the default), tsv,
+        json, or ndjson:
+
+            list --format tsv workspace
+
+        With --changes, only the configurations that were added,
+        removed or changed since the last 'list --changes' (of the
+        same configurations, by this or an earlier lmsh) are shown,
+        with an extra change column.  The first 'list --changes'
+        shows every configuration as added:
+
+            list --changes workspace
+
         """
-        configs = self._get_configs(line.strip())
+        args, output_format = self._parse_format(line.split())
+        if output_format is None:
+            return
+        if _pop_flag(args, '--changes'):
+            return self._list_changes(' '.join(args), output_format)
+        configs = self._get_configs(' '.join(args))
         if not configs:
             return
-        columns = self.LIST_CFG_COLUMNS
+        self._write_objects(configs, self.LIST_CFG_COLUMNS,
+                            self.LIST_CFG_WIDTHS, output_format,
+                            'render.list')
 
-        table = Texttable(max_width=120)
-        table.set_deco(Texttable.HEADER | Texttable.VLINES)
-        table.set_cols_align(['l' for l in columns])
-        table.set_cols_width([6, 30, 8, 10, 15])
-        table.header([DISPLAY_TYPE_MAP.get(c, c) for c in columns])
-        rows = self._get_rows(configs, columns)
-        table.add_rows(rows, header=False)
-        print table.draw()
+    def _list_changes(self, config_type, output_format):
+        # Saved next to the inventory, so one-shot commands (from
+        # cron, say) see the changes since the last run.
+        path = None
+        if self.inventory is not None and self.inventory.path is not None:
+            path = '%s.changes-%s.json' % (
+                os.path.splitext(self.inventory.path)[0],
+                config_type or 'all')
+        snapshot = self._change_snapshots.get(config_type)
+        if snapshot is None:
+            if path is not None:
+                snapshot = api.Snapshot.load(path)
+            else:
+                snapshot = api.Snapshot()
+            self._change_snapshots[config_type] = snapshot
+        changes = self._lmapi.list_configuration_changes(
+            snapshot, self.CONFIG_TYPES.get(config_type))
+        if path is not None:
+            snapshot.save(path)
+        if not changes:
+            return
+        # Only the changed records are copied and rendered.
+        rows = []
+        for change, configs in [('added', changes.added),
+                                ('removed', changes.removed),
+                                ('changed', changes.changed)]:
+            for config in configs:
+                row = records.as_dict(config)
+                row['change'] = change
+                rows.append(row)
+        rows.sort(key=lambda row: row['id'])
+        self._write_objects(rows, ['change'] + self.LIST_CFG_COLUMNS,
+                            [7] + self.LIST_CFG_WIDTHS, output_format,
+                            'render.list')
 
     def _get_configs(self, config_type):
         if config_type == 'library':
@@ -116,73 +251,321 @@ class LMShell(cmd.Cmd):
             configs = self._lmapi.list_all_configurations()
         return configs
 
+    def complete_show(self, text, line, begidx, endidx):
+        return self._complete_config_id(text)
+
     def do_show(self, line):
         """
-        Show all information for a single configuration.
+        Show all information for one or more configurations.
         Syntax:
 
-        show <configid>
+        show <configid> [<configid> ...]
 
-        The config ID can be obtained from the 'list' command.
+        The config IDs can be obtained from the 'list' command.
+        Several configurations are fetched concurrently, and shown
+        in the order given.
         """
-        configuration = self._lmapi.show_configuration(line.strip())
-        pprint(configuration)
+        from pprint import pprint
+        config_ids = line.split()
+        if len(config_ids) < 2:
+            configuration = self._lmapi.show_configuration(line.strip())
+            pprint(records.as_dict(configuration))
+            return
+        failed = False
+        for result in self._lmapi.show_configurations(config_ids):
+            if result.ok:
+                pprint(records.as_dict(result.value))
+            else:
+                failed = True
+                print "%s: ERROR: %s" % (result.item, result.error)
+        if failed:
+            return ReturnCode(1)
+
+    def complete_machines(self, text, line, begidx, endidx):
+        return self._complete_config_id(text)
 
     def do_machines(self, line):
         """
-        List all machines in a configuration.
+        List the machines in one or more configurations.
         Syntax:
 
-        machines <configid>
+        machines [--format <format>] <configid> [<configid> ...]
+        machines [--format <format>] --all | --deployed
+
+        The config IDs can be obtained from the 'list' command.
+        With --all, the machines in every configuration are listed,
+        and with --deployed, the machines in every deployed
+        configuration.  When there's more than one configuration,
+        the machines are listed concurrently and shown as each
+        configuration's machines arrive, so the order of the
+        configurations can vary.
 
-        The config ID can be obtained from the 'list' command.
+        The output format can be one of table (the default), tsv,
+        json, or ndjson.
 
         """
-        machines = self._lmapi.list_machines(line.strip())
+        args, output_format = self._parse_format(line.split())
+        if output_format is None:
+            return
+        all_configs = _pop_flag(args, '--all')
+        deployed_only = _pop_flag(args, '--deployed')
+        if all_configs or deployed_only:
+            if args:
+                print "wrong number of args"
+                return
+            config_ids = [c['id'] for c in
+                          self._uncached().list_all_configurations()
+                          if all_configs or c.get('isDeployed')]
+            return self._write_machines_for(config_ids, output_format)
+        elif not args:
+            print "wrong number of args"
+            return
+        elif len(args) > 1:
+            return self._write_machines_for(args, output_format)
+        machines = self._lmapi.list_machines(args[0])
         if not machines:
             return
         columns = self._get_machine_output_columns(machines)
-        table = Texttable(max_width=140)
-        table.set_deco(Texttable.HEADER | Texttable.VLINES)
-        table.set_cols_align(['l' for l in columns])
-        table.header([DISPLAY_TYPE_MAP.get(c, c) for c in columns])
-        rows = self._get_rows(machines, columns)
-        table.add_rows(rows, header=False)
-        print table.draw()
+        self._write_objects(machines, columns,
+                            [self.LIST_MACHINES_WIDTHS[c] for c in columns],
+                            output_format, 'render.machines')
+
+    def _write_machines_for(self, config_ids, output_format):
+        failed = []
+
+        def _machines():
+            for result in self._lmapi.iter_machines(config_ids):
+                if not result.ok:
+                    failed.append(result.item)
+                    sys.stderr.write("ERROR: config %s: %s\n" % (
+                        result.item, result.error))
+                    continue
+                for machine in result.value:
+                    yield machine
+        machines = _machines()
+        first = next(machines, None)
+        if first is not None:
+            columns = self._get_machine_output_columns([first])
+            self._write_objects(
+                itertools.chain([first], machines), columns,
+                [self.LIST_MACHINES_WIDTHS[c] for c in columns],
+                output_format, 'render.machines')
+        if failed:
+            return ReturnCode(1)
+
+    def complete_find(self, text, line, begidx, endidx):
+        if _arg_index(line, begidx) == 0:
+            choices = ['configs', 'machines']
+        else:
+            choices = []
+        choices += ['%s=' % name for name in
+                    sorted(set(inventory.CONFIGURATION_FIELDS) |
+                           set(inventory.MACHINE_FIELDS))]
+        return [c for c in choices if c.startswith(text)]
+
+    def do_find(self, line):
+        """
+        Search for configurations or machines.
+        Syntax:
+
+        find [--refresh] [--format <format>] [configs | machines]
+             <field>=<value> ...
+
+        The configuration fields are id, name, owner, deployed,
+        type and public, and the machine fields are id, name, ip,
+        mac, deployed, status and config.  Values are case
+        insensitive and can use shell style wildcards.  Every
+        field given has to match:
+
+            find owner=jsmith deployed=true
+            find ip=10.20.30.*
+            find machines name=web*
+
+        A search using ip, mac, status or config finds machines,
+        any other search finds configurations unless 'machines'
+        is given.
+
+        Searches use a local inventory of every configuration and
+        machine.  It's refreshed from the server when it's more
+        than 5 minutes old, after commands that change
+        configurations, or with --refresh.  A refresh only lists
+        the machines of configurations that are deployed, new or
+        changed.
+
+        """
+        args, output_format = self._parse_format(line.split())
+        if output_format is None:
+            return
+        refresh = _pop_flag(args, '--refresh')
+        kind = None
+        if args and args[0] in ('configs', 'machines'):
+            kind = args.pop(0)
+        try:
+            terms = inventory.parse_terms(args)
+        except inventory.InvalidQueryError, e:
+            print e
+            return
+        index = self._get_inventory()
+        age = index.age()
+        failed = False
+        if refresh or age is None or age > self.INVENTORY_MAX_AGE:
+            failed = self._refresh_inventory(index)
+        try:
+            kind, matches = index.find(terms, kind)
+        except inventory.InvalidQueryError, e:
+            print e
+            return
+        if matches:
+            if kind == 'configs':
+                columns = self.LIST_CFG_COLUMNS
+                widths = self.LIST_CFG_WIDTHS
+            else:
+                columns = self._get_machine_output_columns(matches)
+                widths = [self.LIST_MACHINES_WIDTHS[c] for c in columns]
+            self._write_objects(matches, columns, widths, output_format,
+                                'render.find')
+        if failed:
+            return ReturnCode(1)
+
+    def _uncached(self):
+        # The configurations that bulk commands act on are always
+        # listed by the server, a cached list could be out of date.
+        return getattr(self._lmapi, 'uncached', self._lmapi)
+
+    def _get_inventory(self):
+        if self.inventory is None:
+            self.inventory = inventory.Inventory(
+                self._lmapi, enum_names=self.ENUM_TYPES)
+        return self.inventory
+
+    def _refresh_inventory(self, index):
+        # Returns True if the machines of any configuration
+        # could not be listed.
+        count, listed, errors = index.refresh()
+        for result in errors:
+            sys.stderr.write("ERROR: config %s: %s\n" % (
+                result.item, result.error))
+        return bool(errors)
 
     def _get_machine_output_columns(self, machines):
         return [c for c in self.LIST_MACHINES_COLUMNS if
                 c in machines[0]]
 
+    def _parse_format(self, args):
+        # Returns the args without the --format option and the
+        # output format to use, or None if the format is invalid.
+        output_format = self.output_format
+        remaining = []
+        args = iter(args)
+        for arg in args:
+            if arg == '--format':
+                output_format = next(args, None)
+            elif arg.startswith('--format='):
+                output_format = arg[len('--format='):]
+            else:
+                remaining.append(arg)
+        if output_format not in output.FORMATS:
+            print "unknown format: %s (choose from %s)" % (
+                output_format, ', '.join(output.FORMATS))
+            return remaining, None
+        return remaining, output_format
+
+    def _write_objects(self, objects, columns, widths, output_format,
+                       stats_name=None):
+        start = time.time()
+        headers = [DISPLAY_TYPE_MAP.get(c, c) for c in columns]
+        if self.merged_output is not None:
+            count = self.merged_output.write(self.source, objects, columns,
+                                             headers, widths,
+                                             self._row_builder)
+        else:
+            writer = output.create_writer(
+                output_format, sys.stdout, self._row_builder(columns),
+                headers, widths)
+            count = 0
+            for obj in objects:
+                writer.write(obj)
+                count += 1
+            writer.close()
+        if self.stats is not None and stats_name is not None:
+            self.stats.record(stats_name, time.time() - start,
+                              objects=count)
+
     def _get_rows(self, objects, columns):
-        rows = []
-        for obj in objects:
-            row = []
-            for col in columns:
-                if col in self.ENUM_TYPES:
-                    # Using .get() here because sometimes
-                    # labmanager returned non documented
-                    # types/statuses/etc.
-                    row.append(self.ENUM_TYPES[col].get(
-                        obj[col], obj[col]))
-                elif col in obj:
-                    row.append(obj[col])
-            rows.append(row)
-        return rows
+        build_row = self._row_builder(columns)
+        return [build_row(obj) for obj in objects]
+
+    def _row_builder(self, columns):
+        enums = [(i, self.ENUM_TYPES[col]) for i, col in enumerate(columns)
+                 if col in self.ENUM_TYPES]
+        row_getters = {}
+
+        def _build_row(obj):
+            get_row = row_getters.get(type(obj))
+            if get_row is None:
+                get_row = records.row_getter(type(obj), columns)
+                row_getters[type(obj)] = get_row
+            row = get_row(obj)
+            for i, enum in enums:
+                # Using .get() here because sometimes
+                # labmanager returned non documented
+                # types/statuses/etc.
+                row[i] = enum.get(row[i], row[i])
+            return row
+        return _build_row
+
+    def complete_undeploy(self, text, line, begidx, endidx):
+        return self._complete_config_id(text)
 
     def do_undeploy(self, line):
         """
         Undeploying a configuration.
         Syntax:
 
-        undeploy <configid>
+        undeploy [--wait] <configid>
+        undeploy --many <configid> [<configid> ...]
+        undeploy --all-workspace
+
+        With --wait, the command doesn't return until all the
+        machines in the configuration are off.
+
+        With --many, or --all-workspace for every deployed
+        configuration in the workspace, the configurations are
+        undeployed concurrently.  How many are undeployed at once
+        starts at one and adapts to how quickly the server responds,
+        up to --max-workers.
 
         """
-        config_id = line.strip()
+        args = line.split()
+        wait = _pop_flag(args, '--wait')
+        if _pop_flag(args, '--all-workspace'):
+            if args or wait:
+                print "wrong number of args"
+                return
+            config_ids = [c['id'] for c in
+                          self._uncached().list_workspace_configurations()
+                          if c['isDeployed']]
+            return self._run_bulk('undeploy',
+                                  self._lmapi.undeploy_configurations,
+                                  config_ids)
+        if _pop_flag(args, '--many'):
+            if not args or wait:
+                print "wrong number of args"
+                return
+            return self._run_bulk('undeploy',
+                                  self._lmapi.undeploy_configurations, args)
+        if len(args) != 1:
+            print "wrong number of args"
+            return
+        config_id = args[0]
         print "Undeploying config..."
         self._lmapi.undeploy_configuration(config_id)
+        if wait:
+            return self._wait_for(config_id, self._lmapi.STATUS_OFF)
 
     def complete_deploy(self, text, line, begidx, endidx):
+        if _arg_index(line, begidx) == 1:
+            return self._complete_config_id(text)
         subcommands = ['unfenced', 'fenced']
         if not text:
             return subcommands
@@ -193,14 +576,34 @@ class LMShell(cmd.Cmd):
         Deploy a configuration in a workspace.
         Syntax:
 
-        deploy <fenced|unfenced> <configid>
+        deploy [--wait] <fenced|unfenced> <configid>
+        deploy --many <fenced|unfenced> <configid> [<configid> ...]
 
         After the configuration has been deployed, you
         can use the 'machines' command to get a list of
         the IP addresses of the machines.
 
+        With --wait, the command doesn't return until all the
+        machines in the configuration are on and have an IP
+        address.
+
+        With --many, the configurations are deployed concurrently,
+        see 'help undeploy'.
+
         """
         args = line.split()
+        wait = _pop_flag(args, '--wait')
+        if _pop_flag(args, '--many'):
+            if len(args) < 2 or wait:
+                print "wrong number of args"
+                return
+            fence_mode = self._get_fence_mode_from(args[0])
+            return self._run_bulk(
+                'deploy',
+                lambda config_ids, progress:
+                self._lmapi.deploy_configurations(config_ids, fence_mode,
+                                                  progress),
+                args[1:])
         if len(args) != 2:
             print "wrong number of args"
             return
@@ -208,6 +611,88 @@ class LMShell(cmd.Cmd):
         config_id = args[1]
         print "Deploying config..."
         self._lmapi.deploy_configuration(config_id, fence_mode)
+        if wait:
+            return self._wait_for(config_id, self._lmapi.STATUS_ON)
+
+    def _run_bulk(self, verb, method, config_ids):
+        # method(config_ids, progress) is one of the adaptive
+        # LabManager methods, verb is 'deploy' or 'undeploy'.
+        if not config_ids:
+            print "no configurations to %s" % verb
+            return
+        print "%sing %s configurations..." % (verb.capitalize(),
+                                              len(config_ids))
+        limits = []
+
+        def _progress(result, latency, finished, total, limit):
+            limits.append(limit)
+            if result.ok:
+                print "[%s/%s] %s: ok (%.1fs, %s at once)" % (
+                    finished, total, result.item, latency, limit)
+            else:
+                print "[%s/%s] %s: ERROR: %s" % (finished, total,
+                                                 result.item, result.error)
+            sys.stdout.flush()
+        start = time.time()
+        results = method(config_ids, progress=_progress)
+        elapsed = time.time() - start
+        succeeded = len([result for result in results if result.ok])
+        print "%s of %s configurations %s in %.1f seconds " \
+            "(%.2f per second, %s to %s at once)" % (
+                succeeded, len(results), verb + 'ed', elapsed,
+                succeeded / max(elapsed, 0.001), min(limits), max(limits))
+        if succeeded < len(results):
+            return ReturnCode(1)
+
+    def complete_wait(self, text, line, begidx, endidx):
+        arg_index = _arg_index(line, begidx)
+        if arg_index == 0:
+            return self._complete_config_id(text)
+        elif arg_index == 1:
+            return [s for s in sorted(self.WAIT_STATES) if s.startswith(text)]
+        return []
+
+    def do_wait(self, line):
+        """
+        Wait for all the machines in a configuration to be on or off.
+        Syntax:
+
+        wait <configid> <on|off> [<timeout>]
+
+        Waiting for 'on' also waits for every machine to have an
+        IP address.  The timeout is in seconds and defaults to 600.
+        The machines are polled less often the longer the wait.
+
+        """
+        args = line.split()
+        if len(args) not in (2, 3):
+            print "wrong number of args"
+            return
+        status = self.WAIT_STATES.get(args[1])
+        if status is None:
+            print "unknown state: %s" % args[1]
+            return
+        if len(args) == 3:
+            try:
+                timeout = int(args[2])
+            except ValueError:
+                sys.stderr.write("ERROR: timeout must be a number of "
+                                 "seconds: %s\n" % args[2])
+                return ReturnCode(1)
+        else:
+            timeout = self._lmapi.DEFAULT_WAIT_TIMEOUT
+        return self._wait_for(args[0], status, timeout)
+
+    def _wait_for(self, config_id, status,
+                  timeout=api.LabManager.DEFAULT_WAIT_TIMEOUT):
+        print "Waiting for machines..."
+        try:
+            machines, elapsed = self._lmapi.wait_for_machines(
+                config_id, status, timeout)
+        except api.WaitTimeoutError, e:
+            sys.stderr.write("ERROR: %s\n" % e)
+            return ReturnCode(1)
+        print "%s machines ready in %.1f seconds" % (len(machines), elapsed)
 
     def _get_fence_mode_from(self, mode):
         if mode == 'fenced':
@@ -215,6 +700,11 @@ class LMShell(cmd.Cmd):
         elif mode == 'unfenced':
             return self._lmapi.NON_FENCED
 
+    def complete_checkout(self, text, line, begidx, endidx):
+        if _arg_index(line, begidx) == 0:
+            return self._complete_config_id(text)
+        return []
+
     def do_checkout(self, line):
         """
         Checkout a configuration from the library to the workspace.
@@ -250,6 +740,9 @@ class LMShell(cmd.Cmd):
                                                          workspace_name)
         print "Config ID of checked out configuration:", checkout_id
 
+    def complete_delete(self, text, line, begidx, endidx):
+        return self._complete_config_id(text)
+
     def do_delete(self, line):
         """
         Delete a configuration.
@@ -261,6 +754,148 @@ class LMShell(cmd.Cmd):
         print "Deleting config..."
         self._lmapi.delete_configuration(line.strip())
 
+    def complete_action(self, text, line, begidx, endidx):
+        if _arg_index(line, begidx) > 0:
+            if line[:begidx].split()[-1] == '--config':
+                return self._complete_config_id(text)
+            return self._complete_machine_id(text)
+        subcommands = sorted(self.MACHINE_ACTIONS)
+        if not text:
+            return subcommands
+        return [c for c in subcommands if c.startswith(text)]
+
+    def do_action(self, line):
+        """
+        Perform an action on one or more machines.
+        Syntax:
+
+        action <action> <machineid> [<machineid> ...]
+        action <action> --config <configid>
+
+        Where action is one of poweron, poweroff, suspend, resume,
+        reset, snapshot, revert, or shutdown.  The machine IDs can
+        be obtained from the 'machines' command.  Use --config to
+        perform the action on every machine in a configuration:
+
+            action revert 9601 9602 9603
+            action poweroff --config 289
+
+        The action is performed on the machines concurrently and
+        the result is shown for each machine.
+
+        """
+        args = line.split()
+        if len(args) < 2:
+            print "wrong number of args"
+            return
+        action = self.MACHINE_ACTIONS.get(args[0])
+        if action is None:
+            print "unknown action: %s" % args[0]
+            return
+        if args[1] == '--config':
+            if len(args) != 3:
+                print "wrong number of args"
+                return
+            machine_ids = [m['id'] for m in
+                           self._lmapi.list_machines(args[2])]
+        else:
+            machine_ids = args[1:]
+        results = self._lmapi.perform_machine_actions(action, machine_ids)
+        failed = False
+        for result in results:
+            if result.ok:
+                print "%s: ok" % result.item
+            else:
+                failed = True
+                print "%s: ERROR: %s" % (result.item, result.error)
+        if failed:
+            return ReturnCode(1)
+
+    def complete_cache(self, text, line, begidx, endidx):
+        subcommands = ['clear', 'stats']
+        if not text:
+            return subcommands
+        return [c for c in subcommands if c.startswith(text)]
+
+    def do_cache(self, line):
+        """
+        Show or clear the response cache.
+        Syntax:
+
+        cache [stats | clear]
+
+        Show how many calls were answered from the cache:
+
+            cache stats
+
+        Discard everything in the cache, so the next command
+        fetches fresh data from the server:
+
+            cache clear
+
+        """
+        if not hasattr(self._lmapi, 'cache_stats'):
+            print "caching is disabled"
+            return
+        subcommand = line.strip() or 'stats'
+        if subcommand == 'clear':
+            self._lmapi.clear_cache()
+        elif subcommand == 'stats':
+            self._print_cache_stats(self._lmapi.cache_stats())
+        else:
+            print "unknown subcommand: %s" % subcommand
+
+    def _print_cache_stats(self, stats):
+        total_hits = total_calls = 0
+        print "%-30s %8s %8s %8s" % ('method', 'hits', 'misses', 'hit rate')
+        for method_name in sorted(stats):
+            hits, misses = stats[method_name]
+            total_hits += hits
+            total_calls += hits + misses
+            print "%-30s %8d %8d %8s" % (method_name, hits, misses,
+                                         _percent(hits, hits + misses))
+        print "%-30s %8d %8d %8s" % ('total', total_hits,
+                                     total_calls - total_hits,
+                                     _percent(total_hits, total_calls))
+
+    def complete_stats(self, text, line, begidx, endidx):
+        return [c for c in ['reset'] if c.startswith(text)]
+
+    def do_stats(self, line):
+        """
+        Show timing and size statistics for this session.
+        Syntax:
+
+        stats [reset]
+
+        For every SOAP call, and for loading the WSDL, converting
+        the results and rendering output, this shows the number of
+        calls and errors, the mean, median, 95th percentile and
+        slowest times, the bytes sent and received, and the number
+        of objects.  Use 'stats reset' to start counting again.
+
+        """
+        if self.stats is None:
+            print "statistics are disabled"
+            return
+        subcommand = line.strip()
+        if subcommand == 'reset':
+            self.stats.reset()
+        elif not subcommand:
+            print '\n'.join(stats.format_metrics(self.stats.metrics()))
+        else:
+            print "unknown subcommand: %s" % subcommand
+
+    def _complete_config_id(self, text):
+        if self.completion_index is None:
+            return []
+        return self.completion_index.complete_config_id(text)
+
+    def _complete_machine_id(self, text):
+        if self.completion_index is None:
+            return []
+        return self.completion_index.complete_machine_id(text)
+
     def do_EOF(self, line):
         print
         return True
@@ -288,17 +923,59 @@ class LMShell(cmd.Cmd):
 
     def onecmd(self, line):
         try:
-            return cmd.Cmd.onecmd(self, line)
-        except SOAP_API_EXCEPTION, e:
-            sys.stderr.write("ERROR: %s\n" % e)
-            return ReturnCode(1)
+            try:
+                return cmd.Cmd.onecmd(self, line)
+            except Exception, e:
+                # If suds was never imported, this can't be a SOAP error.
+                if 'suds' not in sys.modules or \
+                        not isinstance(e, soap_api_exceptions()):
+                    raise
+                sys.stderr.write("ERROR: %s\n" % e)
+                return ReturnCode(1)
+        finally:
+            # Here rather than in postcmd, which one-shot, --batch and
+            # --serve commands don't go through.  Even a failed
+            # command may have changed some of what it acted on.
+            if self.inventory is not None and self._changes_inventory(line):
+                self.inventory.expire()
+
+    def _changes_inventory(self, line):
+        return line.split()[:1] in [[name] for name in
+                                    self.INVENTORY_CHANGING_COMMANDS]
 
     def postcmd(self, stop, line):
+        if self.completion_index is not None and \
+                self._changes_inventory(line):
+            # Deployed machines are completed as well as
+            # configurations, so this is more than checkout and delete.
+            self.completion_index.request_refresh()
         if isinstance(stop, ReturnCode):
             return None
         return stop
 
 
+def _arg_index(line, begidx):
+    # The index of the argument being completed, not
+    # counting the command name or any --options.
+    return len([arg for arg in line[:begidx].split()
+                if not arg.startswith('--')]) - 1
+
+
+def _pop_flag(args, flag):
+    # Remove all occurrences of flag from the args list,
+    # returning True if there were any.
+    found = flag in args
+    while flag in args:
+        args.remove(flag)
+    return found
+
+
+def _percent(part, total):
+    if not total:
+        return '-'
+    return '%.1f%%' % (100.0 * part / total)
+
+
 class ReturnCode(object):
     def __init__(self, return_code):
         self.return_code = return_code
@@ -319,21 +996,127 @@ def get_cmd_line_parser():
                         "name that contains the objects on which you want to "
                         "perform operations.")
     parser.add_argument('--timeout', default=None, type=int,
-                        help="The default timeout  to use with all SOAP "
-                        "calls.  If this is not specified, then no timeout "
-                        "will be used.")
+                        help="The timeout to use with all SOAP calls, "
+                        "instead of the default deadline for each "
+                        "call (30 seconds for lookups up to 30 minutes "
+                        "for deploys).")
+    parser.add_argument('--deadlines', default=None, help="Comma "
+                        "separated METHOD=SECONDS deadlines for "
+                        "individual SOAP calls, e.g. "
+                        "ConfigurationDeploy=3600,GetMachine=10.")
+    parser.add_argument('--retries', default=config.RETRIES, type=int,
+                        help="How many times to retry read calls (and "
+                        "power actions) that fail to reach the server.")
+    parser.add_argument('--retry-delay', default=config.RETRY_DELAY,
+                        type=float, help="The seconds to wait before the "
+                        "first retry, doubling for each retry after it.")
+    parser.add_argument('--breaker-failures', type=int,
+                        default=config.BREAKER_FAILURES, help="Stop "
+                        "calling the server for a while after this many "
+                        "calls in a row fail to reach it (0 never stops).")
+    parser.add_argument('--breaker-reset', type=int,
+                        default=config.BREAKER_RESET, help="How many "
+                        "seconds to wait before calling the server again "
+                        "once it has been stopped.")
+    parser.add_argument('--wsdl-cache-dir', default=config.WSDL_CACHE_DIR,
+                        help="Where to cache the parsed Lab Manager WSDL "
+                        "between runs.")
+    parser.add_argument('--wsdl-cache-days', default=config.WSDL_CACHE_DAYS,
+                        type=int, help="How many days a cached WSDL is "
+                        "used before it is downloaded again.  A value of 0 "
+                        "means the cached WSDL never expires.")
+    parser.add_argument('--no-wsdl-cache', action="store_true",
+                        help="Always download and parse the WSDL.")
+    parser.add_argument('--refresh-wsdl', action="store_true",
+                        help="Discard any cached WSDL for this server and "
+                        "download it again.")
+    parser.add_argument('--max-workers', default=config.MAX_WORKERS,
+                        type=int,
+                        help="The maximum number of concurrent requests "
+                        "to make to the Lab Manager server.")
+    parser.add_argument('--no-keep-alive', action="store_true",
+                        help="Open a new connection to the server for "
+                        "every request.")
+    parser.add_argument('--stream-lists', action="store_true",
+                        help="Parse configuration and machine lists "
+                        "as they are read instead of with suds, which "
+                        "is faster and uses less memory for large "
+                        "organizations.")
+    parser.add_argument('--record-cassette', help="Record every request "
+                        "to the server and its reply to this file, with "
+                        "the username and password scrubbed.")
+    parser.add_argument('--replay-cassette', help="Serve the replies "
+                        "recorded in this file instead of talking to the "
+                        "server.")
+    parser.add_argument('--replay-time-scale', type=float,
+                        default=config.REPLAY_TIME_SCALE, help="How long "
+                        "replayed replies take, as a multiple of the "
+                        "recorded time (0 replays without waiting).")
+    parser.add_argument('--pool-size', type=int, default=None,
+                        help="The number of idle connections to keep open "
+                        "to the server.  Defaults to --max-workers.")
+    parser.add_argument('--pool-idle-timeout', type=int,
+                        default=config.POOL_IDLE_TIMEOUT,
+                        help="Close connections that have been idle for "
+                        "this many seconds.")
+    parser.add_argument('--scheme', default='https', choices=['https', 'http'],
+                        help="Connect to the server over http instead of "
+                        "https (for testing against tests/fakeserver.py).")
+    parser.add_argument('--no-cache', action="store_true",
+                        help="Always fetch configurations and machines from "
+                        "the server instead of reusing recent results.")
+    parser.add_argument('--cache-ttls', default=None, help="Comma "
+                        "separated METHOD=SECONDS lifetimes of cached "
+                        "results, e.g. list_machines=5,"
+                        "list_library_configurations=300.")
+    parser.add_argument('--format', default='table', choices=output.FORMATS,
+                        help="The output format of the list and machines "
+                        "commands.")
+    parser.add_argument('--profile', action="store_true", help="Print "
+                        "timing and size statistics to stderr on exit.")
+    parser.add_argument('--trace', help="Append a line of JSON for every "
+                        "SOAP call (and other timed operation) to this "
+                        "file.")
     parser.add_argument('--section', default='default', help="What section "
                         "name to load config values from (if loading values "
                         "from a config file).")
+    parser.add_argument('--batch', metavar='PLAN', help="Run the "
+                        "commands in a plan file (one command per line, "
+                        "or a JSON list), running the commands for "
+                        "different configurations concurrently, up to "
+                        "--max-workers at a time.")
+    parser.add_argument('--sections', help="Run the command against "
+                        "each of these comma separated sections at once, "
+                        "with the output merged.")
+    parser.add_argument('--all-sections', action="store_true",
+                        help="Run the command against every section in "
+                        "the .lmshrc file at once.")
     parser.add_argument('-l', '--list-sections', action="store_true", help="Show "
                         "available sections in the .lmshrc file.")
-    parser.add_argument('onecmd', nargs='*', default=None)
+    parser.add_argument('--serve', action="store_true", help="Keep a "
+                        "single connection to the Lab Manager server open "
+                        "and run commands sent with --connect.")
+    parser.add_argument('--connect', action="store_true", help="Send the "
+                        "command to an lmsh started with --serve instead of "
+                        "connecting to the Lab Manager server.")
+    parser.add_argument('--socket', default=server.DEFAULT_SOCKET_PATH,
+                        help="The unix socket used by --serve and "
+                        "--connect.")
+    # Everything after the command name is the command's, so options
+    # like 'undeploy --all-workspace' reach the command.
+    parser.add_argument('onecmd', nargs=argparse.REMAINDER)
     return parser
 
 
 def main():
     parser = get_cmd_line_parser()
     args = parser.parse_args()
+    if args.onecmd[:1] == ['--']:
+        # 'lmsh -- machines --all' used to be the only way to pass
+        # options to a command.
+        del args.onecmd[0]
+    if args.connect:
+        sys.exit(run_remote_command(args))
 
     config_parser = ConfigParser.SafeConfigParser()
     # If the user explicitly specifies a section but it does
@@ -346,22 +1129,204 @@ def main():
     if args.list_sections:
         print '\n'.join(config_parser.sections())
         sys.exit(0)
-    if api_config.password is None:
+    if args.onecmd and args.onecmd[0] in ('help', '?'):
+        # Help doesn't need the server (or a password).
+        LMShell(None).onecmd(' '.join(args.onecmd))
+        sys.exit(0)
+    section_configs = None
+    if args.sections or args.all_sections:
+        section_configs = load_section_configs(parser, args, config_parser)
+    elif api_config.password is None and not api_config.replay_cassette:
         api_config.password = getpass.getpass('password: ')
     logging.getLogger('suds').addHandler(NullHandler())
+    trace = None
+    if args.trace:
+        trace = open(os.path.expanduser(args.trace), 'a')
+    lmstats = stats.Stats(trace)
     try:
-        client = api.create_soap_client(api_config)
-    except urllib2.URLError, e:
+        if section_configs is not None:
+            sys.exit(run_sections(args, section_configs, lmstats))
+        run(args, api_config, lmstats)
+    finally:
+        if args.profile:
+            sys.stderr.write('\n'.join(
+                stats.format_metrics(lmstats.metrics())) + '\n')
+        if trace is not None:
+            trace.close()
+
+
+def create_lmapi(args, api_config, lmstats):
+    client = api.create_soap_client(api_config, lmstats)
+    labmanager_api = api.LabManager(client, api_config.max_workers, lmstats,
+                                    api.create_call_policy(api_config),
+                                    stream_lists=api_config.stream_lists)
+    if not args.no_cache:
+        labmanager_api = cache.CachingLabManager(labmanager_api,
+                                                 api_config.cache_ttls)
+    return labmanager_api
+
+
+def connection_errors():
+    import httplib
+    import urllib2
+    import suds.transport
+    from labmanager import cassette
+    return (urllib2.URLError, suds.transport.TransportError,
+            socket.error, httplib.HTTPException, cassette.CassetteError)
+
+
+def run(args, api_config, lmstats):
+    steps = None
+    if args.batch:
+        # Check the plan before connecting to the server.
+        try:
+            steps = batch.create_steps(batch.load_plan(args.batch))
+        except (IOError, batch.PlanError), e:
+            sys.stderr.write("could not load plan: %s\n" % e)
+            sys.exit(1)
+    try:
+        labmanager_api = create_lmapi(args, api_config, lmstats)
+    except connection_errors(), e:
         sys.stderr.write("could not connect to server: %s\n" % e)
         sys.exit(1)
-    labmanager_api = api.LabManager(client)
-    lmsh = LMShell(labmanager_api)
-    if args.onecmd:
+    lmsh = LMShell(labmanager_api, output_format=args.format, stats=lmstats,
+                   inventory=inventory.Inventory(
+                       labmanager_api, config.inventory_path(api_config),
+                       enum_names=LMShell.ENUM_TYPES))
+    if args.serve:
+        serve(lmsh, args.socket)
+    elif steps is not None:
+        sys.exit(batch.run_steps(lmsh, steps, api_config.max_workers))
+    elif args.onecmd:
         result = lmsh.onecmd(' '.join(args.onecmd))
         if isinstance(result, ReturnCode):
             sys.exit(result.return_code)
         sys.exit(0)
     else:
+        import readline
+        lmsh.completion_index = completion.CompletionIndex(labmanager_api)
+        lmsh.completion_index.start()
         readline.set_completer(lmsh.complete)
         readline.parse_and_bind("tab: complete")
         lmsh.cmdloop()
+
+
+def load_section_configs(parser, args, config_parser):
+    """Return a list of (section, APIConfig) for --sections/--all-sections.
+
+    Exits if there's no command to run or a section doesn't exist.
+    Passwords that aren't in the config file are asked for up front.
+
+    """
+    if not args.onecmd:
+        sys.stderr.write("--sections and --all-sections require a "
+                         "command to run\n")
+        sys.exit(1)
+    if args.all_sections:
+        names = config_parser.sections()
+    else:
+        names = [name.strip() for name in args.sections.split(',')
+                 if name.strip()]
+    missing = [name for name in names
+               if not config_parser.has_section(name)]
+    if missing or not names:
+        sys.stderr.write("section does not exist: %s\n" %
+                         ', '.join(missing or names))
+        sys.exit(1)
+    section_configs = []
+    for name in names:
+        section_args = copy.copy(args)
+        section_args.section = name
+        api_config = config.load_config(parser, section_args,
+                                        ConfigParser.SafeConfigParser())
+        if api_config.password is None:
+            api_config.password = getpass.getpass('password for %s: ' % name)
+        section_configs.append((name, api_config))
+    return section_configs
+
+
+def run_sections(args, section_configs, lmstats):
+    """Run args.onecmd against every section at once.
+
+    Every section gets its own client, and they're all created and
+    run concurrently, so the WSDL loads and SOAP calls overlap.
+    Objects from every section are merged into one output with a
+    source column, any other output is prefixed with the section
+    name.  A section that fails doesn't stop the others.  Returns
+    the highest return code of any section.
+
+    """
+    line = ' '.join(args.onecmd)
+    stdout, stderr = sys.stdout, sys.stderr
+    merged = output.MergedWriter(
+        args.format, stdout,
+        max([len('source')] + [len(name) for name, api_config
+                                in section_configs]))
+    lock = threading.Lock()
+
+    def _run_section(section_config):
+        name, api_config = section_config
+        streams = [output.PrefixedStream(stdout, '%s: ' % name, lock),
+                   output.PrefixedStream(stderr, '%s: ' % name, lock)]
+        sys.stdout.set_stream(streams[0])
+        sys.stderr.set_stream(streams[1])
+        try:
+            try:
+                labmanager_api = create_lmapi(args, api_config, lmstats)
+            except connection_errors(), e:
+                sys.stderr.write("could not connect to server: %s\n" % e)
+                return 1
+            lmsh = LMShell(labmanager_api, output_format=args.format,
+                           stats=lmstats)
+            lmsh.merged_output = merged
+            lmsh.source = name
+            try:
+                result = lmsh.onecmd(line)
+            except Exception, e:
+                sys.stderr.write("ERROR: %s\n" % e)
+                return 1
+            if isinstance(result, ReturnCode):
+                return result.return_code
+            return 0
+        finally:
+            for stream in streams:
+                stream.flush()
+
+    sys.stdout = output.ThreadLocalStream(stdout)
+    sys.stderr = output.ThreadLocalStream(stderr)
+    try:
+        results = parallel.run_parallel(_run_section, section_configs,
+                                        len(section_configs))
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+    merged.close()
+    return max([result.get() for result in results])
+
+
+def serve(lmsh, socket_path):
+    try:
+        lmsh_server = server.LMShellServer(socket_path, lmsh)
+    except socket.error, e:
+        sys.stderr.write("could not start server: %s\n" % e)
+        sys.exit(1)
+    sys.stderr.write("lmsh serving on %s\n" % socket_path)
+    try:
+        lmsh_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        lmsh_server.server_close()
+
+
+def run_remote_command(args):
+    if not args.onecmd:
+        sys.stderr.write("--connect requires a command to run\n")
+        return 1
+    try:
+        response = server.send_command(' '.join(args.onecmd), args.socket)
+    except server.ServerNotRunningError, e:
+        sys.stderr.write("%s\n" % e)
+        return 1
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return response['return_code']
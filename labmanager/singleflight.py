@@ -0,0 +1,113 @@
+"""Share one call between threads that make the same call at once.
+
+Waiters, completion index refreshes and bulk commands running on
+different threads often ask for the same configuration or machine list
+at the same moment.  A SingleFlight makes the first of those calls and
+hands its result (or exception) to every other thread that asked for
+the same key while it was running, instead of sending the server the
+same request several times.
+
+Only calls that are in flight at the same time are shared, nothing is
+kept once the call returns (see cache.CachingLabManager for that).
+A call made after invalidate() never shares a call that started
+before it, so a read made after a write sees the write.
+
+"""
+import sys
+import threading
+
+from labmanager import parallel
+
+
+class _Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls with the same key.
+
+    Keys are tuples whose first element is a name the calls are
+    counted under, see stats().
+
+    """
+    def __init__(self):
+        # (generation, key) -> the _Flight of the call in progress
+        self._flights = {}
+        self._calls = {}
+        self._coalesced = {}
+        self._lock = threading.Lock()
+        # Bumped by every invalidate().
+        self.generation = 0
+
+    def call(self, key, func, *args):
+        """Return func(*args), or the result of the same call in flight.
+
+        Returns a (value, shared) tuple, shared is True if the value
+        came from a call made by another thread.
+
+        """
+        self._lock.acquire()
+        try:
+            flight_key = (self.generation, key)
+            flight = self._flights.get(flight_key)
+            if flight is None:
+                flight = _Flight()
+                self._flights[flight_key] = flight
+                leader = True
+                counts = self._calls
+            else:
+                leader = False
+                counts = self._coalesced
+            counts[key[0]] = counts.get(key[0], 0) + 1
+        finally:
+            self._lock.release()
+        if not leader:
+            flight.done.wait()
+            return flight.result.get(), True
+        try:
+            try:
+                flight.result = parallel.Result(key, value=func(*args))
+            except Exception:
+                flight.result = parallel.Result(key, exc_info=sys.exc_info())
+        finally:
+            if flight.result is None:
+                # Interrupted, the waiters get the same exception.
+                flight.result = parallel.Result(key, exc_info=sys.exc_info())
+            self._lock.acquire()
+            try:
+                del self._flights[flight_key]
+            finally:
+                self._lock.release()
+            flight.done.set()
+        return flight.result.get(), False
+
+    def invalidate(self):
+        """Don't share the calls in progress with any later calls."""
+        self._lock.acquire()
+        try:
+            self.generation += 1
+        finally:
+            self._lock.release()
+
+    def in_flight(self):
+        """Return the number of calls in progress."""
+        return len(self._flights)
+
+    def stats(self):
+        """Return a dict of name -> (calls, coalesced).
+
+        calls is the number of calls actually made, coalesced is the
+        number of calls that shared the result of one of them.
+
+        """
+        self._lock.acquire()
+        try:
+            stats = {}
+            for name in set(self._calls) | set(self._coalesced):
+                stats[name] = (self._calls.get(name, 0),
+                               self._coalesced.get(name, 0))
+            return stats
+        finally:
+            self._lock.release()
@@ -0,0 +1,211 @@
+"""Timing and size statistics for lmsh.
+
+A Stats object collects a latency histogram, call and error counts,
+bytes sent and received, and object counts for every named operation.
+The names used by lmsh are:
+
+  wsdl.load           creating the suds client (WSDL download and parse)
+  soap.<Operation>    a SOAP call, from sending the request to having
+                      the unmarshalled reply
+  xml.<Operation>     the part of a SOAP call spent by suds parsing and
+                      unmarshalling the reply
+  convert.<method>    converting suds objects to records
+  coalesced.<method>  waiting for an identical call that was already
+                      in progress (see singleflight)
+  render.<command>    writing the output of a shell command
+
+Everything recorded can also be written, one JSON object per line, to
+a trace file.
+
+"""
+import json
+import time
+import bisect
+import threading
+
+
+# The upper bounds (in seconds) of the histogram buckets.  Anything
+# slower than the last bound goes in one extra bucket at the end.
+BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+           1.0, 2.0, 5.0, 10.0, 30.0, 60.0]
+
+
+class Metric(object):
+    """Everything recorded for one name."""
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.objects = 0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    def add(self, elapsed, bytes_sent=0, bytes_received=0, objects=0,
+            error=False):
+        self.count += 1
+        if error:
+            self.errors += 1
+        self.total += elapsed
+        if self.min is None or elapsed < self.min:
+            self.min = elapsed
+        self.max = max(self.max, elapsed)
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.objects += objects
+        self.histogram[bisect.bisect_left(BUCKETS, elapsed)] += 1
+
+    @property
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return self.total / self.count
+
+    def percentile(self, percent):
+        """Estimate a percentile (0 to 100) from the histogram.
+
+        The estimate is the upper bound of the bucket the percentile
+        falls in, so it's never lower than the real value, and it's
+        never more than the slowest time actually recorded.
+
+        """
+        if not self.count:
+            return 0.0
+        target = self.count * percent / 100.0
+        seen = 0
+        for i, bucket_count in enumerate(self.histogram):
+            seen += bucket_count
+            if seen >= target and bucket_count:
+                if i < len(BUCKETS):
+                    return min(BUCKETS[i], self.max)
+                break
+        return self.max
+
+    def copy(self):
+        metric = Metric(self.name)
+        metric.__dict__.update(self.__dict__)
+        metric.histogram = list(self.histogram)
+        return metric
+
+
+class Stats(object):
+    """Thread safe collection of Metrics by name.
+
+    If trace is given, it's a file like object that every record()
+    is written to as a line of JSON, timestamped with clock().
+
+    """
+    def __init__(self, trace=None, clock=time.time):
+        self.trace = trace
+        self.clock = clock
+        self._metrics = {}
+        self._lock = threading.Lock()
+        # The SOAP call in progress on each thread, used to
+        # attribute message sizes to the right call.
+        self._local = threading.local()
+
+    def record(self, name, elapsed, bytes_sent=0, bytes_received=0,
+               objects=0, error=False):
+        self._lock.acquire()
+        try:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Metric(name)
+            metric.add(elapsed, bytes_sent, bytes_received, objects, error)
+            if self.trace is not None:
+                self.trace.write(json.dumps({
+                    'time': self.clock(), 'name': name, 'elapsed': elapsed,
+                    'bytes_sent': bytes_sent,
+                    'bytes_received': bytes_received, 'objects': objects,
+                    'error': error}) + '\n')
+                self.trace.flush()
+        finally:
+            self._lock.release()
+
+    def metrics(self):
+        """Return a copy of every Metric, sorted by name."""
+        self._lock.acquire()
+        try:
+            return [self._metrics[name].copy() for name in
+                    sorted(self._metrics)]
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self._metrics.clear()
+        finally:
+            self._lock.release()
+
+    def plugin(self):
+        """Return a suds plugin that measures the SOAP messages."""
+        return _message_plugin_class()(self._local)
+
+    def start_call(self):
+        self._local.bytes_sent = 0
+        self._local.bytes_received = 0
+        self._local.received_at = None
+
+    def message_sizes(self, bytes_sent, bytes_received):
+        """Record the message sizes of a call not made through suds."""
+        self._local.bytes_sent = bytes_sent
+        self._local.bytes_received = bytes_received
+        self._local.received_at = time.time()
+
+    def call_sizes(self):
+        """Return (bytes_sent, bytes_received, received_at) of the call.
+
+        These are for the most recent call started on this thread with
+        start_call().  received_at is None if no reply was received.
+
+        """
+        return (getattr(self._local, 'bytes_sent', 0),
+                getattr(self._local, 'bytes_received', 0),
+                getattr(self._local, 'received_at', None))
+
+
+_MessagePlugin = None
+
+
+def _message_plugin_class():
+    # Created on first use so that importing this module
+    # doesn't import suds.
+    global _MessagePlugin
+    if _MessagePlugin is None:
+        from suds.plugin import MessagePlugin
+
+        class _MessagePlugin(MessagePlugin):
+            def __init__(self, local):
+                self._local = local
+
+            def sending(self, context):
+                self._local.bytes_sent = len(context.envelope)
+
+            def received(self, context):
+                self._local.bytes_received = len(context.reply)
+                self._local.received_at = time.time()
+
+            def __deepcopy__(self, memo={}):
+                # Cloned clients should record into the same Stats.
+                return self
+    return _MessagePlugin
+
+
+def format_metrics(metrics):
+    """Return the lines of a table summarizing a list of Metrics."""
+    lines = ["%-34s %7s %6s %9s %9s %9s %9s %10s %10s %8s" % (
+        'name', 'calls', 'errors', 'mean ms', 'p50 ms', 'p95 ms', 'max ms',
+        'sent KB', 'recv KB', 'objects')]
+    for metric in metrics:
+        lines.append("%-34s %7d %6d %9.1f %9.1f %9.1f %9.1f %10.1f %10.1f "
+                     "%8d" % (
+                         metric.name, metric.count, metric.errors,
+                         1000 * metric.mean, 1000 * metric.percentile(50),
+                         1000 * metric.percentile(95), 1000 * metric.max,
+                         metric.bytes_sent / 1024.0,
+                         metric.bytes_received / 1024.0, metric.objects))
+    return lines
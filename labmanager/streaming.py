@@ -0,0 +1,199 @@
+"""A streaming fast path for the ListConfigurations and ListMachines calls.
+
+For a large organization, suds parses these replies into a full DOM,
+unmarshals that into a tree of sudsobjects, and only then are they
+converted to records.  StreamingCalls skips both: it sends the same
+document/literal envelope suds would, and parses the reply with
+cElementTree.iterparse, turning each configuration or machine into a
+record as soon as its closing tag is read and throwing its elements
+away.  Apart from the reply itself, memory use doesn't grow with the
+number of objects, and the records can be used as they're parsed.
+
+Everything needed to build the envelopes and convert the fields (the
+endpoint, SOAPAction, namespace, parameter names and field types) is
+taken from the client's WSDL, so the records are the same as the
+ones converted from suds (the same fields, in the same order, with
+the same Python types).  create() returns None if the WSDL doesn't
+describe these calls the way this module expects, and
+api.LabManager then keeps using suds.
+
+"""
+from StringIO import StringIO
+from xml.etree import cElementTree
+from xml.sax.saxutils import escape
+
+from labmanager import records
+
+
+STREAMED_METHODS = ('ListConfigurations', 'ListMachines')
+SOAP_ENV_NAMESPACE = 'http://schemas.xmlsoap.org/soap/envelope/'
+ENVELOPE = ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<soap:Envelope xmlns:soap="%s"><soap:Header>%%s</soap:Header>'
+            '<soap:Body>%%s</soap:Body></soap:Envelope>' % SOAP_ENV_NAMESPACE)
+
+
+class UnsupportedWSDLError(Exception):
+    pass
+
+
+class _Method(object):
+    """What's needed to make one streamed call and parse its reply."""
+    def __init__(self, method):
+        binding = method.binding
+        if method.soap.input.body.use != 'literal' or \
+                binding.input.__class__.__name__ != 'Document':
+            raise UnsupportedWSDLError("%s is not document/literal" %
+                                       method.name)
+        self.name = method.name
+        self.location = method.location
+        self.action = method.soap.action
+        self.namespace = binding.input.wsdl.tns[1]
+        self.params = [name for name, param_type in
+                       binding.input.param_defs(method)]
+        returned = binding.output.returned_types(method)
+        if len(returned) != 1:
+            raise UnsupportedWSDLError("%s doesn't return one array" %
+                                       method.name)
+        self.result_tag = self.tag(returned[0].name)
+        items = list(returned[0].resolve().children())
+        if len(items) != 1:
+            raise UnsupportedWSDLError("%s doesn't return one array" %
+                                       method.name)
+        item = items[0][0]
+        self.item_tag = self.tag(item.name)
+        self.type_name = str(item.resolve().name)
+        # field name -> the suds builtin's translate(), or None for
+        # strings, which are used as they are.
+        self.converters = {}
+        for field, ancestry in item.resolve().children():
+            field_type = field.resolve()
+            if not hasattr(field_type, 'translate'):
+                raise UnsupportedWSDLError("%s.%s is not a simple type" %
+                                           (self.type_name, field.name))
+            converter = None
+            if field_type.name != 'string':
+                converter = field_type.translate
+            self.converters[self.tag(field.name)] = (str(field.name),
+                                                     converter)
+
+    def tag(self, name):
+        return '{%s}%s' % (self.namespace, name)
+
+    def envelope(self, header, args):
+        params = ''.join(['<%s>%s</%s>' % (name, escape(unicode(arg)), name)
+                          for name, arg in zip(self.params, args)])
+        body = '<%s xmlns="%s">%s</%s>' % (self.name, self.namespace,
+                                           params, self.name)
+        return (ENVELOPE % (header, body)).encode('utf-8')
+
+
+class StreamingCalls(object):
+    """Make the streamed calls with the clients of one WSDL."""
+    def __init__(self, client):
+        self._methods = {}
+        for service in client.wsdl.services:
+            for port in service.ports:
+                for name in STREAMED_METHODS:
+                    if name in port.methods and name not in self._methods:
+                        self._methods[name] = _Method(port.methods[name])
+        missing = set(STREAMED_METHODS) - set(self._methods)
+        if missing:
+            raise UnsupportedWSDLError("the WSDL has no %s" %
+                                       ', '.join(sorted(missing)))
+
+    def send(self, client, method_name, args, stats=None):
+        """Make the call with client, returns the reply body.
+
+        The client's transport, timeout and SOAP headers are used.  A
+        SOAP fault is raised as a suds.WebFault, like suds does.  If
+        stats (a stats.Stats) is given, the message sizes are recorded
+        in it for the call in progress.
+
+        """
+        from suds import WebFault
+        from suds.transport import Request, TransportError
+        method = self._methods[method_name]
+        envelope = method.envelope(_header(client.options.soapheaders),
+                                   args)
+        request = Request(client.options.location or method.location,
+                          envelope)
+        request.headers = {'Content-Type': 'text/xml; charset=utf-8',
+                           'SOAPAction': method.action}
+        request.headers.update(client.options.headers)
+        try:
+            reply = client.options.transport.send(request)
+        except TransportError, e:
+            if e.httpcode != 500 or e.fp is None:
+                raise
+            fault = _fault(e.fp.read())
+            if fault is None:
+                raise
+            raise WebFault(fault, None)
+        if stats is not None:
+            stats.message_sizes(len(envelope), len(reply.message))
+        return reply.message
+
+    def iter_records(self, method_name, body):
+        """Yield the records in the reply body of a streamed call."""
+        method = self._methods[method_name]
+        converters = method.converters
+        record_type = records.record_type
+        result = None
+        for event, elem in cElementTree.iterparse(StringIO(body),
+                                                  ('start', 'end')):
+            if event == 'start':
+                if elem.tag == method.result_tag:
+                    result = elem
+                continue
+            if elem.tag != method.item_tag or result is None:
+                continue
+            fields = []
+            values = []
+            for child in elem:
+                name, converter = converters.get(child.tag, (None, None))
+                if name is None:
+                    name = child.tag.split('}')[-1]
+                value = child.text
+                if value is not None and converter is not None:
+                    value = converter(value)
+                fields.append(name)
+                values.append(value)
+            yield records.make_record(
+                record_type(method.type_name, tuple(fields)), values)
+            # Throw away the elements of the items already yielded.
+            result.clear()
+
+
+def create(client):
+    """Return the StreamingCalls for client, or None if unsupported."""
+    try:
+        return StreamingCalls(client)
+    except UnsupportedWSDLError:
+        return None
+
+
+def _header(soapheaders):
+    # The AuthenticationHeader sudsobject from api.create_soap_client.
+    if soapheaders is None:
+        return ''
+    name = soapheaders.__class__.__name__
+    namespace = soapheaders.__metadata__.sxtype.namespace()[1]
+    fields = ''.join(['<%s>%s</%s>' % (field, escape(unicode(value)), field)
+                      for field, value in soapheaders
+                      if value is not None])
+    return '<%s xmlns="%s">%s</%s>' % (name, namespace, fields, name)
+
+
+def _fault(body):
+    from suds.sudsobject import Factory
+    try:
+        root = cElementTree.fromstring(body)
+    except SyntaxError:
+        return None
+    fault = root.find('{%s}Body/{%s}Fault' % (SOAP_ENV_NAMESPACE,
+                                              SOAP_ENV_NAMESPACE))
+    if fault is None:
+        return None
+    return Factory.object('Fault', {
+        'faultcode': fault.findtext('faultcode'),
+        'faultstring': fault.findtext('faultstring')})
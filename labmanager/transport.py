@@ -0,0 +1,247 @@
+"""A suds transport that reuses HTTP(S) connections.
+
+The default suds transport is built on urllib2, which opens a new
+connection (and for https, does a new TLS handshake) for every request.
+PooledHttpTransport keeps connections open between requests, and all
+the clients in an api.ClientPool share its connections.
+
+"""
+import time
+import errno
+import base64
+import socket
+import urllib
+import httplib
+import threading
+from StringIO import StringIO
+from urlparse import urlparse
+
+from suds.transport import Transport, TransportError, Reply
+from suds.properties import Unskin
+
+
+class PooledHttpTransport(Transport):
+    """HTTP transport with persistent (keep-alive) connections.
+
+    Up to pool_size idle connections are kept per host, and idle
+    connections that haven't been used for idle_timeout seconds are
+    closed instead of reused.  Servers (and load balancers) close idle
+    connections on their own schedule, so when a request on a
+    connection that came from the pool fails before the server could
+    have seen it (the request couldn't be sent, or the connection was
+    closed without a single byte of reply), it is retried on a new
+    connection, up to stale_retries times.  Any other failure may have
+    happened after the server acted on the request, so it's left to
+    api.CallPolicy to decide whether the call can be retried.
+    Requests that fail on a brand new connection are never retried.
+
+    Like the urllib2 transport lets URLError through, timeouts and
+    connection failures are raised as the socket.error or
+    httplib.HTTPException they are, not as a TransportError: suds
+    expects every TransportError to carry a reply it can read a SOAP
+    fault from.
+
+    Requests go through the proxy in the proxy option ({protocol:
+    url}) if it's set, or otherwise the http_proxy and https_proxy
+    environment variables (honouring no_proxy).  https requests are
+    tunnelled through the proxy with CONNECT.
+
+    """
+    def __init__(self, pool_size=4, idle_timeout=60, stale_retries=1,
+                 **kwargs):
+        Transport.__init__(self)
+        Unskin(self.options).update(kwargs)
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.stale_retries = stale_retries
+        # (scheme, host, port) -> a list of (connection, last_used)
+        # tuples, most recently used last.
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def open(self, request):
+        status, reason, headers, body = self._request(
+            'GET', request.url, None, request.headers)
+        if status >= 300:
+            raise TransportError(reason, status, StringIO(body))
+        return StringIO(body)
+
+    def send(self, request):
+        status, reason, headers, body = self._request(
+            'POST', request.url, request.message, request.headers)
+        if status in (202, 204):
+            return None
+        elif status >= 300:
+            # suds reads the SOAP fault out of fp for 500 errors.
+            raise TransportError(reason, status, StringIO(body))
+        return Reply(status, headers, body)
+
+    def close(self):
+        """Close all idle connections."""
+        self._lock.acquire()
+        try:
+            # Cleared in place, the dict is shared with any clones.
+            pools = self._pools.values()
+            self._pools.clear()
+        finally:
+            self._lock.release()
+        for pool in pools:
+            for connection, last_used in pool:
+                connection.close()
+
+    def _request(self, method, url, body, headers):
+        parsed = urlparse(url)
+        proxy = self._proxy_for(parsed.scheme, parsed.hostname)
+        key = (parsed.scheme, parsed.hostname, parsed.port, proxy)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        if proxy is not None and parsed.scheme != 'https':
+            # A plain http proxy is sent the whole url.
+            path = url
+            headers = _with_proxy_authorization(headers, proxy)
+        attempt = 0
+        while True:
+            connection, reused = self._get_connection(key)
+            if reused:
+                # The timeout can change between calls, see
+                # api.CallPolicy.
+                connection.timeout = self.options.timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(self.options.timeout)
+            # A failure means the server can't have seen the request
+            # if it couldn't be sent, or if no reply came back at all
+            # (see _unanswered()).
+            sent = replied = False
+            try:
+                connection.request(method, path, body, headers)
+                sent = True
+                response = connection.getresponse()
+                replied = True
+                data = response.read()
+            except socket.timeout:
+                # The server may still be processing the request,
+                # so this is never safe to retry.
+                connection.close()
+                raise
+            except (httplib.HTTPException, socket.error), e:
+                connection.close()
+                if reused and attempt < self.stale_retries and \
+                        (not sent or (not replied and _unanswered(e))):
+                    attempt += 1
+                    # The other idle connections to this host are
+                    # likely to have been closed as well.
+                    self._discard_idle(key)
+                    continue
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._release_connection(key, connection)
+            return (response.status, response.reason,
+                    dict(response.getheaders()), data)
+
+    def _get_connection(self, key):
+        now = time.time()
+        expired = []
+        connection = None
+        self._lock.acquire()
+        try:
+            pool = self._pools.get(key, [])
+            while pool:
+                candidate, last_used = pool.pop()
+                if now - last_used < self.idle_timeout:
+                    connection = candidate
+                    break
+                expired.append(candidate)
+        finally:
+            self._lock.release()
+        for candidate in expired:
+            candidate.close()
+        if connection is not None:
+            return connection, True
+        return self._new_connection(key), False
+
+    def _new_connection(self, key):
+        scheme, host, port, proxy = key
+        if scheme == 'https':
+            connection_cls = httplib.HTTPSConnection
+        else:
+            connection_cls = httplib.HTTPConnection
+        if proxy is None:
+            return connection_cls(host, port, timeout=self.options.timeout)
+        parsed = urlparse(proxy)
+        connection = connection_cls(parsed.hostname, parsed.port,
+                                    timeout=self.options.timeout)
+        if scheme == 'https':
+            # set_tunnel is _set_tunnel before Python 2.7.
+            set_tunnel = getattr(connection, 'set_tunnel', None) or \
+                connection._set_tunnel
+            set_tunnel(host, port, _with_proxy_authorization({}, proxy))
+        return connection
+
+    def _proxy_for(self, scheme, host):
+        # The proxy url for requests to host, or None.
+        if self.options.proxy:
+            return self.options.proxy.get(scheme)
+        proxy = urllib.getproxies().get(scheme)
+        if proxy is None or urllib.proxy_bypass(host):
+            return None
+        if '://' not in proxy:
+            proxy = 'http://' + proxy
+        return proxy
+
+    def _release_connection(self, key, connection):
+        self._lock.acquire()
+        try:
+            pool = self._pools.setdefault(key, [])
+            if len(pool) < self.pool_size:
+                pool.append((connection, time.time()))
+                return
+        finally:
+            self._lock.release()
+        connection.close()
+
+    def _discard_idle(self, key):
+        self._lock.acquire()
+        try:
+            pool = self._pools.pop(key, [])
+        finally:
+            self._lock.release()
+        for connection, last_used in pool:
+            connection.close()
+
+    def __deepcopy__(self, memo={}):
+        # suds deep copies the options (including the transport) when
+        # a client is cloned.  suds links the transport's options to
+        # the options of the client that uses it, so every clone needs
+        # its own transport, but they should all share the connections.
+        clone = PooledHttpTransport(self.pool_size, self.idle_timeout,
+                                    self.stale_retries)
+        Unskin(clone.options).update(Unskin(self.options))
+        clone._pools = self._pools
+        clone._lock = self._lock
+        return clone
+
+
+def _unanswered(e):
+    # True if e, raised while waiting for the reply, means the
+    # connection was closed without a byte of reply: the server had
+    # closed it before the request arrived.
+    if isinstance(e, httplib.BadStatusLine):
+        # Python 2.7.5 and later say so, older versions give repr('').
+        return e.line in ('', repr('')) or \
+            e.line.startswith('No status line received')
+    return isinstance(e, socket.error) and \
+        e.args[:1] in ((errno.ECONNRESET,), (errno.EPIPE,))
+
+
+def _with_proxy_authorization(headers, proxy):
+    parsed = urlparse(proxy)
+    if parsed.username is None:
+        return headers
+    headers = dict(headers)
+    headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(
+        '%s:%s' % (urllib.unquote(parsed.username),
+                   urllib.unquote(parsed.password or '')))
+    return headers
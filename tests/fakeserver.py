@@ -0,0 +1,627 @@
+"""A local stand-in for the Lab Manager SOAP API.
+
+The fake server serves a LabManager.asmx WSDL with the same operations,
+types and namespace as the real thing (for the calls that lmsh uses),
+and answers them from an in memory set of configurations and machines.
+It's meant for end to end tests and benchmarks, where mocking
+client.service would skip suds, the transport and the network entirely,
+and isn't installed with lmsh.
+
+The number of configurations, the latency of every call, and SOAP
+faults can all be controlled::
+
+    python tests/fakeserver.py --port 8080 --configurations 1000 \\
+        --latency 0.05 --fault-rate 0.01
+
+and then::
+
+    lmsh --scheme http --hostname localhost:8080 --username user \\
+        --organization org list
+
+Any username, password, organization and workspace are accepted.
+
+"""
+import sys
+import time
+import random
+import argparse
+import threading
+import BaseHTTPServer
+import SocketServer
+from xml.sax.saxutils import escape
+from xml.etree import cElementTree
+
+
+NAMESPACE = 'http://vmware.com/labmanager'
+SOAP_ENV_NAMESPACE = 'http://schemas.xmlsoap.org/soap/envelope/'
+PATH = '/LabManager/SOAP/LabManager.asmx'
+
+CONFIGURATION_FIELDS = [
+    ('id', 'int'), ('name', 'string'), ('description', 'string'),
+    ('isPublic', 'boolean'), ('isDeployed', 'boolean'),
+    ('fenceMode', 'int'), ('type', 'int'), ('owner', 'string'),
+    ('dateCreated', 'dateTime'), ('autoDeleteInMilliSeconds', 'double'),
+    ('bucketName', 'string'), ('mustBeFenced', 'string'),
+    ('autoDeleteDateTime', 'dateTime'),
+]
+MACHINE_FIELDS = [
+    ('id', 'int'), ('name', 'string'), ('description', 'string'),
+    ('internalIP', 'string'), ('externalIP', 'string'),
+    ('macAddress', 'string'), ('memory', 'int'), ('status', 'int'),
+    ('isDeployed', 'boolean'), ('configID', 'int'),
+    ('DatastoreNameResidesOn', 'string'), ('HostNameDeployedOn', 'string'),
+    ('OwnerFullName', 'string'),
+]
+AUTHENTICATION_FIELDS = [
+    ('username', 'string'), ('password', 'string'),
+    ('organizationname', 'string'), ('workspacename', 'string'),
+]
+
+# operation name -> (list of (param name, type), result type or None)
+OPERATIONS = {
+    'ListConfigurations': ([('configurationType', 'int')],
+                           'ArrayOfConfiguration'),
+    'GetConfiguration': ([('id', 'int')], 'Configuration'),
+    'GetSingleConfigurationByName': ([('name', 'string')], 'Configuration'),
+    'ListMachines': ([('configurationId', 'int')], 'ArrayOfMachine'),
+    'GetMachine': ([('machineId', 'int')], 'Machine'),
+    'GetMachineByName': ([('configurationId', 'int'), ('name', 'string')],
+                         'Machine'),
+    'ConfigurationDeploy': ([('configurationId', 'int'),
+                             ('isCached', 'boolean'),
+                             ('fenceMode', 'int')], None),
+    'ConfigurationUndeploy': ([('configurationId', 'int')], None),
+    'ConfigurationCheckout': ([('configurationId', 'int'),
+                               ('workspaceName', 'string')], 'int'),
+    'ConfigurationDelete': ([('configurationId', 'int')], None),
+    'MachinePerformAction': ([('machineId', 'int'), ('action', 'int')],
+                             None),
+}
+
+WORKSPACE_CONFIGURATION = 1
+LIBRARY_CONFIGURATIONS = 2
+STATUS_OFF = 1
+STATUS_ON = 2
+STATUS_SUSPENDED = 3
+# MachinePerformAction action -> the status the machine ends up in.
+# Snapshot (6) and revert (7) leave the status alone.
+ACTION_STATUS = {
+    1: STATUS_ON,
+    2: STATUS_OFF,
+    3: STATUS_SUSPENDED,
+    4: STATUS_ON,
+    5: STATUS_ON,
+    8: STATUS_OFF,
+}
+
+
+class FakeFault(Exception):
+    """Raised by FakeLabManager to send a SOAP fault to the client."""
+    pass
+
+
+class FakeLabManager(object):
+    """The configurations and machines behind the fake server.
+
+    Configurations alternate between the workspace and the library.
+    One in three workspace configurations is deployed, with all of its
+    machines powered on.  Everything is generated from seed, so the
+    same arguments always give the same objects.
+
+    Faults can be injected randomly with fault_rate (0.0 to 1.0), or
+    deterministically with inject_fault().
+
+    """
+    def __init__(self, configurations=100, machines_per_configuration=3,
+                 fault_rate=0.0, seed=0):
+        self.fault_rate = fault_rate
+        self._random = random.Random(seed)
+        self._configurations = {}
+        self._machines = {}
+        # config id -> list of machine ids
+        self._config_machines = {}
+        self._injected_faults = []
+        self._next_config_id = 1
+        self._next_machine_id = 1
+        self._xml = {}
+        self._lock = threading.Lock()
+        for i in xrange(configurations):
+            config_type = (WORKSPACE_CONFIGURATION, LIBRARY_CONFIGURATIONS)[
+                i % 2]
+            config_id = self._add_configuration(
+                'Configuration%s' % i, config_type,
+                owner='owner%s' % (i % 10))
+            for j in xrange(machines_per_configuration):
+                self._add_machine(config_id, 'machine%s' % j)
+            if config_type == WORKSPACE_CONFIGURATION and i % 3 == 0:
+                self._set_deployed(config_id, True)
+
+    def _add_configuration(self, name, config_type, owner):
+        config_id = self._next_config_id
+        self._next_config_id += 1
+        self._configurations[config_id] = {
+            'id': config_id, 'name': name, 'description': '',
+            'isPublic': config_type == LIBRARY_CONFIGURATIONS,
+            'isDeployed': False, 'fenceMode': 1, 'type': config_type,
+            'owner': owner, 'dateCreated': '2011-12-17T00:00:00',
+            'autoDeleteInMilliSeconds': 0, 'bucketName': 'Main',
+            'mustBeFenced': 'NotSpecified',
+            'autoDeleteDateTime': '0001-01-01T00:00:00',
+        }
+        self._config_machines[config_id] = []
+        return config_id
+
+    def _add_machine(self, config_id, name, memory=512):
+        machine_id = self._next_machine_id
+        self._next_machine_id += 1
+        self._machines[machine_id] = {
+            'id': machine_id, 'name': name, 'description': '',
+            'internalIP': '', 'externalIP': '',
+            'macAddress': '00:50:56:%02x:%02x:%02x' % (
+                (machine_id >> 16) & 0xff, (machine_id >> 8) & 0xff,
+                machine_id & 0xff),
+            'memory': memory, 'status': STATUS_OFF, 'isDeployed': False,
+            'configID': config_id, 'DatastoreNameResidesOn': 'datastore1',
+            'HostNameDeployedOn': '', 'OwnerFullName': 'Test Owner',
+        }
+        self._config_machines[config_id].append(machine_id)
+        return machine_id
+
+    def _set_deployed(self, config_id, deployed):
+        self._configurations[config_id]['isDeployed'] = deployed
+        self._xml.pop(('Configuration', config_id), None)
+        for machine_id in self._config_machines[config_id]:
+            if deployed:
+                self._set_status(machine_id, STATUS_ON)
+            else:
+                self._set_status(machine_id, STATUS_OFF)
+                self._machines[machine_id]['isDeployed'] = False
+
+    def _set_status(self, machine_id, status):
+        machine = self._machines[machine_id]
+        machine['status'] = status
+        if status == STATUS_ON:
+            machine['isDeployed'] = True
+            machine['internalIP'] = '10.%s.%s.%s' % (
+                (machine_id >> 16) & 0xff, (machine_id >> 8) & 0xff,
+                machine_id & 0xff)
+            machine['HostNameDeployedOn'] = 'esx%s' % (machine_id % 8)
+        elif status == STATUS_OFF:
+            machine['internalIP'] = ''
+            machine['HostNameDeployedOn'] = ''
+        self._xml.pop(('Machine', machine_id), None)
+
+    def inject_fault(self, operation=None, message='Injected fault',
+                     count=1):
+        """Make the next count calls to operation fail with a SOAP fault.
+
+        An operation of None fails the next calls to any operation.
+
+        """
+        self._lock.acquire()
+        try:
+            self._injected_faults.extend([(operation, message)] * count)
+        finally:
+            self._lock.release()
+
+    def call(self, operation, args):
+        """Run an operation and return the response body XML."""
+        self._lock.acquire()
+        try:
+            self._check_faults(operation)
+            if operation not in OPERATIONS:
+                raise FakeFault('Unknown operation: %s' % operation)
+            params, result_type = OPERATIONS[operation]
+            values = []
+            for name, param_type in params:
+                try:
+                    values.append(_from_text(args.get(name), param_type))
+                except (ValueError, TypeError):
+                    # Like Lab Manager, a fault rather than no reply.
+                    raise FakeFault('Invalid %s: %r' % (name,
+                                                        args.get(name)))
+            result = getattr(self, '_' + operation)(*values)
+            return self._response(operation, result_type, result)
+        finally:
+            self._lock.release()
+
+    def _check_faults(self, operation):
+        for i, (fault_operation, message) in \
+                enumerate(self._injected_faults):
+            if fault_operation is None or fault_operation == operation:
+                del self._injected_faults[i]
+                raise FakeFault(message)
+        if self.fault_rate and self._random.random() < self.fault_rate:
+            raise FakeFault('Random fault')
+
+    def _get_configuration(self, config_id):
+        try:
+            return self._configurations[config_id]
+        except KeyError:
+            raise FakeFault('Configuration %s not found' % config_id)
+
+    def _get_machine(self, machine_id):
+        try:
+            return self._machines[machine_id]
+        except KeyError:
+            raise FakeFault('Machine %s not found' % machine_id)
+
+    def _ListConfigurations(self, config_type):
+        return [c for c in sorted(self._configurations.values(),
+                                  key=lambda c: c['id'])
+                if c['type'] == config_type]
+
+    def _GetConfiguration(self, config_id):
+        return self._get_configuration(config_id)
+
+    def _GetSingleConfigurationByName(self, name):
+        for config_id in sorted(self._configurations):
+            if self._configurations[config_id]['name'] == name:
+                return self._configurations[config_id]
+        raise FakeFault('Configuration %s not found' % name)
+
+    def _ListMachines(self, config_id):
+        self._get_configuration(config_id)
+        return [self._machines[machine_id] for machine_id in
+                self._config_machines[config_id]]
+
+    def _GetMachine(self, machine_id):
+        return self._get_machine(machine_id)
+
+    def _GetMachineByName(self, config_id, name):
+        for machine in self._ListMachines(config_id):
+            if machine['name'] == name:
+                return machine
+        raise FakeFault('Machine %s not found' % name)
+
+    def _ConfigurationDeploy(self, config_id, is_cached, fence_mode):
+        config = self._get_configuration(config_id)
+        if config['isDeployed']:
+            raise FakeFault('Configuration %s is already deployed' %
+                            config_id)
+        config['fenceMode'] = fence_mode
+        self._set_deployed(config_id, True)
+
+    def _ConfigurationUndeploy(self, config_id):
+        self._get_configuration(config_id)
+        self._set_deployed(config_id, False)
+
+    def _ConfigurationCheckout(self, config_id, workspace_name):
+        config = self._get_configuration(config_id)
+        new_id = self._add_configuration(workspace_name,
+                                         WORKSPACE_CONFIGURATION,
+                                         config['owner'])
+        for machine_id in self._config_machines[config_id]:
+            machine = self._machines[machine_id]
+            self._add_machine(new_id, machine['name'], machine['memory'])
+        return new_id
+
+    def _ConfigurationDelete(self, config_id):
+        config = self._get_configuration(config_id)
+        if config['isDeployed']:
+            raise FakeFault('Configuration %s is deployed' % config_id)
+        del self._configurations[config_id]
+        self._xml.pop(('Configuration', config_id), None)
+        for machine_id in self._config_machines.pop(config_id):
+            del self._machines[machine_id]
+            self._xml.pop(('Machine', machine_id), None)
+
+    def _MachinePerformAction(self, machine_id, action):
+        machine = self._get_machine(machine_id)
+        if action not in ACTION_STATUS and action not in (6, 7):
+            raise FakeFault('Invalid action: %s' % action)
+        if not self._configurations[machine['configID']]['isDeployed']:
+            raise FakeFault('Machine %s is not deployed' % machine_id)
+        if action in ACTION_STATUS:
+            self._set_status(machine_id, ACTION_STATUS[action])
+
+    def _response(self, operation, result_type, result):
+        parts = ['<%sResponse xmlns="%s">' % (operation, NAMESPACE)]
+        if result_type is not None:
+            tag = operation + 'Result'
+            if result_type.startswith('ArrayOf'):
+                item_type = result_type[len('ArrayOf'):]
+                parts.append('<%s>' % tag)
+                parts.extend([self._object_xml(item_type, item_type, obj)
+                              for obj in result])
+                parts.append('</%s>' % tag)
+            elif result_type in _OBJECT_FIELDS:
+                parts.append(self._object_xml(tag, result_type, result))
+            else:
+                parts.append('<%s>%s</%s>' % (
+                    tag, _to_text(result, result_type), tag))
+        parts.append('</%sResponse>' % operation)
+        return ''.join(parts)
+
+    def _object_xml(self, tag, object_type, obj):
+        # Large listings are requested over and over again, so
+        # the XML for each object is kept until the object changes.
+        key = (object_type, obj['id'])
+        xml = self._xml.get(key)
+        if xml is None:
+            xml = ''.join([
+                '<%s>%s</%s>' % (name, _to_text(obj[name], field_type), name)
+                for name, field_type in _OBJECT_FIELDS[object_type]])
+            self._xml[key] = xml
+        return '<%s>%s</%s>' % (tag, xml, tag)
+
+
+_OBJECT_FIELDS = {
+    'Configuration': CONFIGURATION_FIELDS,
+    'Machine': MACHINE_FIELDS,
+}
+
+
+def _to_text(value, value_type):
+    if value_type == 'boolean':
+        return value and 'true' or 'false'
+    return escape(unicode(value)).encode('utf-8')
+
+
+def _from_text(text, value_type):
+    if text is None:
+        return None
+    if value_type == 'int':
+        return int(text)
+    elif value_type == 'boolean':
+        return text.strip() in ('true', '1')
+    return text
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_request(body):
+    """Return the (operation, args) of a SOAP request body.
+
+    args is a dict of parameter name -> text.
+
+    """
+    envelope = cElementTree.fromstring(body)
+    soap_body = envelope.find('{%s}Body' % SOAP_ENV_NAMESPACE)
+    if soap_body is None or len(soap_body) == 0:
+        raise FakeFault('Missing SOAP body')
+    operation = soap_body[0]
+    args = dict([(_local_name(child.tag), child.text or '')
+                 for child in operation])
+    return _local_name(operation.tag), args
+
+
+def envelope(body):
+    return ('<?xml version="1.0" encoding="utf-8"?>'
+            '<soap:Envelope xmlns:soap="%s"><soap:Body>%s</soap:Body>'
+            '</soap:Envelope>' % (SOAP_ENV_NAMESPACE, body))
+
+
+def fault_envelope(message):
+    return envelope('<soap:Fault><faultcode>soap:Server</faultcode>'
+                    '<faultstring>%s</faultstring><detail /></soap:Fault>'
+                    % escape(message))
+
+
+def generate_wsdl(location):
+    """Return the WSDL document for a server at location."""
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<wsdl:definitions '
+        'xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/" '
+        'xmlns:s="http://www.w3.org/2001/XMLSchema" '
+        'xmlns:wsdl="http://schemas.xmlsoap.org/wsdl/" '
+        'xmlns:tns="%s" targetNamespace="%s">' % (NAMESPACE, NAMESPACE),
+        '<wsdl:types><s:schema elementFormDefault="qualified" '
+        'targetNamespace="%s">' % NAMESPACE,
+    ]
+    for name in sorted(OPERATIONS):
+        params, result_type = OPERATIONS[name]
+        parts.append('<s:element name="%s">%s</s:element>' % (
+            name, _sequence(params, min_occurs=1)))
+        results = []
+        if result_type is not None:
+            results.append((name + 'Result', result_type))
+        parts.append('<s:element name="%sResponse">%s</s:element>' % (
+            name, _sequence(results, min_occurs=0)))
+    for type_name in sorted(_OBJECT_FIELDS):
+        parts.append('<s:complexType name="%s">%s</s:complexType>' % (
+            type_name, _sequence(_OBJECT_FIELDS[type_name], min_occurs=1,
+                                 complex_type=False)))
+        parts.append(
+            '<s:complexType name="ArrayOf%s"><s:sequence>'
+            '<s:element minOccurs="0" maxOccurs="unbounded" '
+            'name="%s" nillable="true" type="tns:%s" />'
+            '</s:sequence></s:complexType>' % (type_name, type_name,
+                                               type_name))
+    parts.append('<s:element name="AuthenticationHeader" '
+                 'type="tns:AuthenticationHeader" />')
+    parts.append('<s:complexType name="AuthenticationHeader">%s'
+                 '</s:complexType>' % _sequence(AUTHENTICATION_FIELDS,
+                                                min_occurs=0,
+                                                complex_type=False))
+    parts.append('</s:schema></wsdl:types>')
+    parts.append('<wsdl:message name="AuthenticationHeader">'
+                 '<wsdl:part name="AuthenticationHeader" '
+                 'element="tns:AuthenticationHeader" /></wsdl:message>')
+    for name in sorted(OPERATIONS):
+        parts.append('<wsdl:message name="%sSoapIn"><wsdl:part '
+                     'name="parameters" element="tns:%s" /></wsdl:message>'
+                     % (name, name))
+        parts.append('<wsdl:message name="%sSoapOut"><wsdl:part '
+                     'name="parameters" element="tns:%sResponse" />'
+                     '</wsdl:message>' % (name, name))
+    parts.append('<wsdl:portType name="LabManagerSOAPinterfaceSoap">')
+    for name in sorted(OPERATIONS):
+        parts.append('<wsdl:operation name="%s">'
+                     '<wsdl:input message="tns:%sSoapIn" />'
+                     '<wsdl:output message="tns:%sSoapOut" />'
+                     '</wsdl:operation>' % (name, name, name))
+    parts.append('</wsdl:portType>')
+    parts.append('<wsdl:binding name="LabManagerSOAPinterfaceSoap" '
+                 'type="tns:LabManagerSOAPinterfaceSoap">'
+                 '<soap:binding transport="http://schemas.xmlsoap.org/soap/'
+                 'http" />')
+    for name in sorted(OPERATIONS):
+        parts.append(
+            '<wsdl:operation name="%s">'
+            '<soap:operation soapAction="%s/%s" style="document" />'
+            '<wsdl:input><soap:body use="literal" />'
+            '<soap:header message="tns:AuthenticationHeader" '
+            'part="AuthenticationHeader" use="literal" /></wsdl:input>'
+            '<wsdl:output><soap:body use="literal" /></wsdl:output>'
+            '</wsdl:operation>' % (name, NAMESPACE, name))
+    parts.append('</wsdl:binding>')
+    parts.append('<wsdl:service name="LabManagerSOAPinterface">'
+                 '<wsdl:port name="LabManagerSOAPinterfaceSoap" '
+                 'binding="tns:LabManagerSOAPinterfaceSoap">'
+                 '<soap:address location="%s" /></wsdl:port>'
+                 '</wsdl:service></wsdl:definitions>' % escape(location))
+    return ''.join(parts)
+
+
+def _sequence(fields, min_occurs, complex_type=True):
+    elements = ''.join([
+        '<s:element minOccurs="%s" maxOccurs="1" name="%s" type="%s:%s" />'
+        % (min_occurs, name, _prefix(field_type), field_type)
+        for name, field_type in fields])
+    if complex_type:
+        return '<s:complexType><s:sequence>%s</s:sequence></s:complexType>' \
+            % elements
+    return '<s:sequence>%s</s:sequence>' % elements
+
+
+def _prefix(field_type):
+    if field_type in _OBJECT_FIELDS or field_type.startswith('ArrayOf'):
+        return 'tns'
+    return 's'
+
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Write each response in one go, otherwise Nagle's algorithm
+    # and delayed ACKs add ~40ms to every keep-alive request.
+    wbufsize = -1
+
+    def do_GET(self):
+        if not self.path.startswith(PATH):
+            self._respond(404, 'text/plain', 'Not Found')
+            return
+        self._respond(200, 'text/xml; charset=utf-8', self.server.wsdl)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.delay()
+        try:
+            operation, args = parse_request(body)
+            response = envelope(self.server.fake.call(operation, args))
+        except FakeFault, e:
+            self._respond(500, 'text/xml; charset=utf-8',
+                          fault_envelope(str(e)))
+        except SyntaxError, e:
+            self._respond(500, 'text/xml; charset=utf-8',
+                          fault_envelope('Invalid request: %s' % e))
+        else:
+            self._respond(200, 'text/xml; charset=utf-8', response)
+
+    def _respond(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(
+                self, format, *args)
+
+
+class FakeLabManagerServer(SocketServer.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    """An HTTP server for a FakeLabManager.
+
+    Every SOAP call is delayed by latency seconds, plus a random
+    amount up to jitter seconds.  Requests are handled in their own
+    threads, so concurrent calls are delayed concurrently.  Port 0
+    picks a free port, use the hostname attribute to find out which.
+
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, fake, address=('127.0.0.1', 0), latency=0.0,
+                 jitter=0.0, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, _RequestHandler)
+        self.fake = fake
+        self.latency = latency
+        self.jitter = jitter
+        self.verbose = verbose
+        self.wsdl = generate_wsdl('http://%s%s' % (self.hostname, PATH))
+        self._thread = None
+
+    @property
+    def hostname(self):
+        host, port = self.server_address[:2]
+        return '%s:%s' % (host, port)
+
+    @property
+    def url(self):
+        return 'http://%s%s?WSDL' % (self.hostname, PATH)
+
+    def delay(self):
+        delay = self.latency
+        if self.jitter:
+            delay += random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def start(self):
+        """Serve requests from a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Run a fake Lab Manager SOAP server.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080,
+                        help="The port to listen on, 0 picks a free port.")
+    parser.add_argument('--configurations', type=int, default=100,
+                        help="The number of configurations to create.")
+    parser.add_argument('--machines', type=int, default=3,
+                        help="The number of machines in each configuration.")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds to wait before answering each call.")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="Add a random delay of up to this many seconds "
+                        "to each call.")
+    parser.add_argument('--fault-rate', type=float, default=0.0,
+                        help="The fraction of calls (0.0 to 1.0) that fail "
+                        "with a SOAP fault.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="Log every request.")
+    args = parser.parse_args(args)
+    fake = FakeLabManager(args.configurations, args.machines,
+                          args.fault_rate, args.seed)
+    server = FakeLabManagerServer(fake, (args.host, args.port), args.latency,
+                                  args.jitter, args.verbose)
+    # Print the hostname first so scripts using --port 0
+    # can read it from stdout.
+    print server.hostname
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
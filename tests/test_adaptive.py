@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import time
+import threading
+import unittest
+
+from labmanager import adaptive
+
+
+class TestAIMDController(unittest.TestCase):
+    def setUp(self):
+        self.controller = adaptive.AIMDController(maximum=8)
+
+    def succeed(self, count, latency=1.0):
+        for i in xrange(count):
+            self.controller.finished(self.controller.started(), latency, True)
+
+    def test_additive_increase(self):
+        self.assertEqual(self.controller.limit, 1)
+        # About one more per round of successful calls.
+        self.succeed(1)
+        self.assertEqual(self.controller.limit, 2)
+        self.succeed(3)
+        self.assertEqual(self.controller.limit, 3)
+        self.succeed(100)
+        self.assertEqual(self.controller.limit, 8)
+
+    def test_failures_halve_the_limit_once_per_round(self):
+        self.succeed(100)
+        tokens = [self.controller.started() for i in xrange(8)]
+        for token in tokens:
+            self.controller.finished(token, 1.0, False)
+        self.assertEqual(self.controller.limit, 4)
+        self.controller.finished(self.controller.started(), 1.0, False)
+        self.assertEqual(self.controller.limit, 2)
+        self.assertEqual((self.controller.lowest, self.controller.highest),
+                         (1, 8))
+
+    def test_slow_calls_decrease_the_limit(self):
+        self.succeed(100, latency=1.0)
+        self.controller.finished(self.controller.started(), 2.5, True)
+        self.assertEqual(self.controller.limit, 8)
+        self.controller.finished(self.controller.started(), 5.0, True)
+        self.assertEqual(self.controller.limit, 4)
+
+    def test_slowness_is_judged_against_the_smoothed_latency(self):
+        self.succeed(100, latency=1.0)
+        # One unusually fast call doesn't make the normal ones slow.
+        self.succeed(1, latency=0.01)
+        self.succeed(1, latency=1.0)
+        self.assertEqual(self.controller.limit, 8)
+        # And calls that are consistently slower become the norm.
+        self.succeed(100, latency=4.0)
+        self.assertEqual(self.controller.limit, 8)
+        self.assertAlmostEqual(self.controller.latency, 4.0)
+
+    def test_latency_target(self):
+        controller = adaptive.AIMDController(maximum=8, initial=4,
+                                             latency_target=10)
+        controller.finished(controller.started(), 11, True)
+        self.assertEqual(controller.limit, 2)
+        controller.finished(controller.started(), 1, False)
+        self.assertEqual(controller.limit, 1)
+
+
+class TestRunAdaptive(unittest.TestCase):
+    def setUp(self):
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def call(self, item):
+        self.lock.acquire()
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        self.lock.release()
+        time.sleep(0.01)
+        self.lock.acquire()
+        self.running -= 1
+        self.lock.release()
+        if item % 10 == 9:
+            raise ValueError("failed %s" % item)
+        return item * 2
+
+    def test_results_are_in_input_order(self):
+        progress = []
+        controller = adaptive.AIMDController(maximum=4, slow_factor=100)
+        results = adaptive.run_adaptive(
+            self.call, range(40), controller,
+            lambda result, latency, done, total, limit:
+            progress.append((done, total)))
+        self.assertEqual([r.item for r in results], range(40))
+        self.assertEqual([r.value for r in results if r.ok],
+                         [i * 2 for i in range(40) if i % 10 != 9])
+        self.assertEqual(len([r for r in results if not r.ok]), 4)
+        self.assertEqual(progress, [(i, 40) for i in range(1, 41)])
+        self.assertTrue(1 < self.max_running <= 4)
+
+    def test_no_items(self):
+        self.assertEqual(adaptive.run_adaptive(
+            self.call, [], adaptive.AIMDController(maximum=4)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,21 @@
 #!/usr/bin/env python
 
+import os
+import time
+import datetime
+import shutil
+import tempfile
+import threading
 import unittest
 
 import mock
+from suds import WebFault
+from suds.cache import NoCache
+from suds.transport import TransportError
 from suds.sudsobject import Factory
 
 from labmanager import api
+from labmanager import config
 
 
 def create_suds_type(name='FakeSudsObject', **kwargs):
@@ -24,9 +34,65 @@ class TestTypeConversions(unittest.TestCase):
                          {'foo': 'bar'})
 
 
+class TestWSDLCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.config = config.APIConfig('hostname', 'username', 'password',
+                                       'org', 'workspace',
+                                       wsdl_cache_dir=self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_cache_disabled(self):
+        self.config.wsdl_cache_dir = None
+        self.assertTrue(isinstance(api.create_wsdl_cache(self.config),
+                                   NoCache))
+
+    def test_cache_is_keyed_by_url(self):
+        first = api.create_wsdl_cache(self.config)
+        self.config.hostname = 'otherhostname'
+        second = api.create_wsdl_cache(self.config)
+        self.assertNotEqual(first.location, second.location)
+        self.assertTrue(first.location.startswith(self.cache_dir))
+
+    def test_refresh_clears_cached_entries(self):
+        cache = api.create_wsdl_cache(self.config)
+        cache.put('wsdl', 'cached wsdl')
+        self.assertEqual(cache.get('wsdl'), 'cached wsdl')
+        self.config.refresh_wsdl = True
+        cache = api.create_wsdl_cache(self.config)
+        self.assertEqual(cache.get('wsdl'), None)
+
+
+class TestClientPool(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.pool = api.ClientPool(self.client, max_size=2)
+
+    def test_original_client_is_used_first(self):
+        self.assertTrue(self.pool.acquire() is self.client)
+        self.assertFalse(self.client.clone.called)
+
+    def test_clones_created_up_to_max_size(self):
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        self.assertTrue(first is self.client)
+        self.assertTrue(second is self.client.clone.return_value)
+
+    def test_released_clients_are_reused(self):
+        client = self.pool.acquire()
+        self.pool.release(client)
+        self.assertTrue(self.pool.acquire() is client)
+        self.assertFalse(self.client.clone.called)
+
+
 class TestLabManagerAPI(unittest.TestCase):
     def setUp(self):
         self.client = mock.Mock()
+        # Concurrent calls are made on clones of the client, make
+        # sure they're all recorded on the same mock.
+        self.client.clone.return_value = self.client
         self.lmapi = api.LabManager(self.client)
 
     # I'm not super interested in testing every single API call that's just a 1
@@ -44,12 +110,26 @@ class TestLabManagerAPI(unittest.TestCase):
         all_configs = self.lmapi.list_all_configurations()
 
         self.assertEqual(all_configs, [{'foo': 'bar'}, {'foo': 'bar'}])
+        # The two calls are made concurrently so they can
+        # happen in any order.
         expected_args = [((self.lmapi.WORKSPACE_CONFIGURATION,),),
                          ((self.lmapi.LIBRARY_CONFIGURATIONS,),)]
         self.assertEqual(
-            self.client.service.ListConfigurations.call_args_list,
+            sorted(self.client.service.ListConfigurations.call_args_list),
             expected_args)
 
+    def test_list_all_configurations_keeps_workspace_first(self):
+        def list_configurations(config_type):
+            return [[create_suds_type(type=config_type)]]
+        self.client.service.ListConfigurations.side_effect = \
+            list_configurations
+
+        all_configs = self.lmapi.list_all_configurations()
+
+        self.assertEqual(all_configs, [
+            {'type': self.lmapi.WORKSPACE_CONFIGURATION},
+            {'type': self.lmapi.LIBRARY_CONFIGURATIONS}])
+
     def test_show_one_configuration(self):
         self.client.service.GetConfiguration.return_value = \
             create_suds_type(foo='bar')
@@ -66,6 +146,96 @@ class TestLabManagerAPI(unittest.TestCase):
         self.lmapi.perform_machine_action(self.lmapi.POWER_ON, 54)
         self.client.service.MachinePerformAction.assert_called_with(54, 1)
 
+    def test_perform_machine_actions(self):
+        def perform_action(machine_id, action):
+            if machine_id == 2:
+                raise ValueError("machine is stuck")
+        self.client.service.MachinePerformAction.side_effect = \
+            perform_action
+
+        results = self.lmapi.perform_machine_actions(
+            self.lmapi.POWER_OFF, [1, 2, 3])
+
+        self.assertEqual([r.item for r in results], [1, 2, 3])
+        self.assertEqual([r.ok for r in results], [True, False, True])
+        self.assertEqual(
+            sorted(self.client.service.MachinePerformAction.call_args_list),
+            [((1, 2),), ((2, 2),), ((3, 2),)])
+
+    def test_concurrent_identical_reads_are_coalesced(self):
+        release = threading.Event()
+
+        def list_machines(config_id):
+            release.wait()
+            return [[create_suds_type(configID=config_id)]]
+        self.client.service.ListMachines.side_effect = list_machines
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self.lmapi.list_machines(289))) for i in xrange(3)]
+        for thread in threads:
+            thread.start()
+        for i in xrange(200):
+            if self.lmapi.flight_stats().get('list_machines') == (1, 2):
+                break
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.client.service.ListMachines.call_count, 1)
+        self.assertEqual(results, [[{'configID': 289}]] * 3)
+        # Each caller gets their own list.
+        self.assertFalse(results[0] is results[1])
+        self.assertEqual(self.lmapi.flight_stats(),
+                         {'list_machines': (1, 2)})
+
+    def test_reads_after_a_write_do_not_share_older_calls(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def list_machines(config_id):
+            started.set()
+            release.wait()
+            return [[create_suds_type(configID=config_id)]]
+        self.client.service.ListMachines.side_effect = list_machines
+
+        results = []
+        before = threading.Thread(target=lambda: results.append(
+            self.lmapi.list_machines(289)))
+        before.start()
+        started.wait(5)
+        self.lmapi.deploy_configuration(289, self.lmapi.NON_FENCED)
+        after = threading.Thread(target=lambda: results.append(
+            self.lmapi.list_machines(289)))
+        after.start()
+        for i in xrange(200):
+            if self.client.service.ListMachines.call_count == 2:
+                break
+            time.sleep(0.01)
+        release.set()
+        before.join()
+        after.join()
+
+        self.assertEqual(self.client.service.ListMachines.call_count, 2)
+        self.assertEqual(self.lmapi.flight_stats(),
+                         {'list_machines': (2, 0)})
+
+    def test_iter_machines(self):
+        def list_machines(config_id):
+            if config_id == 2:
+                raise ValueError("no such configuration")
+            return [[create_suds_type(configID=config_id)]]
+        self.client.service.ListMachines.side_effect = list_machines
+
+        results = sorted(self.lmapi.iter_machines([1, 2, 3]),
+                         key=lambda r: r.item)
+
+        self.assertEqual([r.item for r in results], [1, 2, 3])
+        self.assertEqual(results[0].value, [{'configID': 1}])
+        self.assertTrue(isinstance(results[1].error, ValueError))
+        self.assertEqual(results[2].value, [{'configID': 3}])
+
     def test_get_machine(self):
         self.client.service.GetMachine.return_value = \
             create_suds_type(foo='bar')
@@ -83,6 +253,264 @@ class TestLabManagerAPI(unittest.TestCase):
         self.assertEqual(self.lmapi.show_configuration_by_name(
             'configuration_name'), {'foo': 'bar'})
 
+    def test_list_configuration_changes(self):
+        self.client.service.ListConfigurations.return_value = [[
+            create_suds_type('Configuration', id=1, isDeployed=False),
+            create_suds_type('Configuration', id=2, isDeployed=False)]]
+        snapshot = api.Snapshot()
+        changes = self.lmapi.list_configuration_changes(
+            snapshot, self.lmapi.WORKSPACE_CONFIGURATION)
+        self.assertEqual([c['id'] for c in changes.added], [1, 2])
+        self.client.service.ListConfigurations.assert_called_with(
+            self.lmapi.WORKSPACE_CONFIGURATION)
+
+        unchanged = snapshot.records[1]
+        self.client.service.ListConfigurations.return_value = [[
+            create_suds_type('Configuration', id=1, isDeployed=False),
+            create_suds_type('Configuration', id=3, isDeployed=False)]]
+        changes = self.lmapi.list_configuration_changes(
+            snapshot, self.lmapi.WORKSPACE_CONFIGURATION)
+        self.assertEqual(len(changes), 2)
+        self.assertEqual(changes.added, [{'id': 3, 'isDeployed': False}])
+        self.assertEqual(changes.removed, [{'id': 2, 'isDeployed': False}])
+        # Unchanged objects keep their existing record.
+        self.assertTrue(snapshot.records[1] is unchanged)
+
+    def test_list_machine_changes(self):
+        self.client.service.ListMachines.return_value = [[
+            create_suds_type('Machine', id=1, status=1)]]
+        snapshot = api.Snapshot()
+        self.lmapi.list_machine_changes(snapshot, 289)
+        self.client.service.ListMachines.return_value = [[
+            create_suds_type('Machine', id=1, status=2)]]
+        changes = self.lmapi.list_machine_changes(snapshot, 289)
+        self.assertEqual((changes.added, changes.removed), ([], []))
+        self.assertEqual(changes.changed, [{'id': 1, 'status': 2}])
+        self.client.service.ListMachines.assert_called_with(289)
+
+    def test_saved_snapshot(self):
+        created = datetime.datetime(2011, 1, 2, 3, 4, 5)
+        self.client.service.ListConfigurations.return_value = [[
+            create_suds_type('Configuration', id=1, dateCreated=created),
+            create_suds_type('Configuration', id=2, dateCreated=created)]]
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'changes.json')
+            snapshot = api.Snapshot.load(path)
+            self.lmapi.list_configuration_changes(
+                snapshot, self.lmapi.WORKSPACE_CONFIGURATION)
+            snapshot.save(path)
+            self.assertEqual(os.stat(path).st_mode & 0777, 0600)
+            self.client.service.ListConfigurations.return_value = [[
+                create_suds_type('Configuration', id=1, dateCreated=created),
+                create_suds_type('Configuration', id=3,
+                                 dateCreated=created)]]
+            changes = self.lmapi.list_configuration_changes(
+                api.Snapshot.load(path), self.lmapi.WORKSPACE_CONFIGURATION)
+        finally:
+            shutil.rmtree(tempdir)
+        self.assertEqual([c['id'] for c in changes.added], [3])
+        self.assertEqual([c['id'] for c in changes.removed], [2])
+        self.assertEqual(changes.changed, [])
+
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestWaitForMachines(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.lmapi = api.LabManager(self.client)
+        self.clock = FakeClock()
+
+    def set_machine_states(self, *states):
+        responses = [[[create_suds_type(status=status, internalIP=ip)
+                       for status, ip in machines]]
+                     for machines in states]
+        self.client.service.ListMachines.side_effect = \
+            lambda config_id: responses.pop(0)
+
+    def wait(self, status, timeout=600):
+        return self.lmapi.wait_for_machines(289, status, timeout,
+                                            sleep=self.clock.sleep,
+                                            clock=self.clock)
+
+    def test_wait_until_on_and_ips_assigned(self):
+        self.set_machine_states(
+            [(self.lmapi.STATUS_OFF, ''), (self.lmapi.STATUS_OFF, '')],
+            [(self.lmapi.STATUS_ON, ''), (self.lmapi.STATUS_ON, '10.0.0.2')],
+            [(self.lmapi.STATUS_ON, '10.0.0.1'),
+             (self.lmapi.STATUS_ON, '10.0.0.2')])
+        machines, elapsed = self.wait(self.lmapi.STATUS_ON)
+        self.assertEqual(len(machines), 2)
+        # One ListMachines call per poll, for all the machines.
+        self.assertEqual(self.client.service.ListMachines.call_count, 3)
+        self.assertEqual(elapsed, self.clock.now)
+        self.assertTrue(elapsed > 0)
+
+    def test_wait_for_off_ignores_ips(self):
+        self.set_machine_states([(self.lmapi.STATUS_OFF, '')])
+        machines, elapsed = self.wait(self.lmapi.STATUS_OFF)
+        self.assertEqual(elapsed, 0)
+
+    def test_timeout(self):
+        self.client.service.ListMachines.return_value = [
+            [create_suds_type(status=self.lmapi.STATUS_OFF, internalIP='')]]
+        self.assertRaises(api.WaitTimeoutError, self.wait,
+                          self.lmapi.STATUS_ON, timeout=60)
+        self.assertEqual(self.clock.now, 60)
+
+    def test_polling_backs_off(self):
+        self.client.service.ListMachines.return_value = [
+            [create_suds_type(status=self.lmapi.STATUS_OFF, internalIP='')]]
+        self.assertRaises(api.WaitTimeoutError, self.wait,
+                          self.lmapi.STATUS_ON, timeout=600)
+        # Polling every 2 seconds for 10 minutes would be 300 calls.
+        self.assertTrue(self.client.service.ListMachines.call_count < 40)
+
+
+def fault(code='soap:Server'):
+    return WebFault(create_suds_type(faultcode=code,
+                                     faultstring='Injected fault'), None)
+
+
+class Failing(object):
+    """Raise each of errors in turn, then return 'ok'."""
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.timeouts = []
+
+    def __call__(self, timeout):
+        self.timeouts.append(timeout)
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+class TestCallPolicy(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.policy = api.CallPolicy(retries=2, retry_delay=1,
+                                     clock=self.clock, sleep=self.clock.sleep)
+
+    def test_read_calls_are_retried(self):
+        attempt = Failing(TransportError('refused', None), fault())
+        self.assertEqual(self.policy.call('GetMachine', (1,), attempt), 'ok')
+        self.assertEqual(len(attempt.timeouts), 3)
+        # Each attempt gets whatever is left of the deadline.
+        self.assertEqual(attempt.timeouts[0], 30)
+        self.assertTrue(attempt.timeouts[2] < attempt.timeouts[1] < 30)
+
+    def test_retries_are_limited(self):
+        attempt = Failing(*[TransportError('refused', None)] * 3)
+        self.assertRaises(TransportError, self.policy.call, 'ListMachines',
+                          (1,), attempt)
+        self.assertEqual(len(attempt.timeouts), 3)
+
+    def test_deploys_are_not_retried(self):
+        attempt = Failing(TransportError('timed out', None))
+        self.assertRaises(TransportError, self.policy.call,
+                          'ConfigurationDeploy', (1, False, 1), attempt)
+        self.assertEqual(len(attempt.timeouts), 1)
+        self.assertEqual(attempt.timeouts[0], 1800)
+
+    def test_only_safe_actions_are_retried(self):
+        self.assertTrue(self.policy.is_retry_safe(
+            'MachinePerformAction', (10, api.LabManager.POWER_ON)))
+        self.assertFalse(self.policy.is_retry_safe(
+            'MachinePerformAction', (10, api.LabManager.SNAPSHOT)))
+
+    def test_client_faults_are_not_retried(self):
+        attempt = Failing(fault('soap:Client'))
+        self.assertRaises(WebFault, self.policy.call, 'GetMachine', (1,),
+                          attempt)
+        self.assertEqual(len(attempt.timeouts), 1)
+
+    def test_no_retry_past_the_deadline(self):
+        # The first retry would be after up to a second.
+        self.policy.deadlines = {'GetMachine': 0.4}
+        attempt = Failing(TransportError('refused', None))
+        self.assertRaises(TransportError, self.policy.call, 'GetMachine',
+                          (1,), attempt)
+        self.assertEqual(len(attempt.timeouts), 1)
+
+    def test_create_from_config(self):
+        api_config = config.APIConfig(
+            'hostname', 'username', 'password', 'org', 'workspace',
+            deadlines=config.parse_deadlines('GetMachine=5, ListMachines=7'))
+        policy = api.create_call_policy(api_config)
+        self.assertEqual(policy.deadline_for('GetMachine'), 5)
+        self.assertEqual(policy.deadline_for('ConfigurationDeploy'), 1800)
+        self.assertEqual(policy.breaker.failure_threshold, 5)
+        api_config.timeout = 20
+        api_config.breaker_failures = 0
+        policy = api.create_call_policy(api_config)
+        self.assertEqual(policy.deadline_for('ConfigurationDeploy'), 20)
+        self.assertEqual(policy.deadline_for('GetMachine'), 5)
+        self.assertTrue(policy.breaker is None)
+        self.assertRaises(ValueError, config.parse_deadlines, 'GetMachine')
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = api.CircuitBreaker(failure_threshold=3,
+                                          reset_timeout=30, clock=self.clock)
+        self.policy = api.CallPolicy(retries=0, breaker=self.breaker,
+                                     clock=self.clock, sleep=self.clock.sleep)
+
+    def call(self, *errors):
+        return self.policy.call('GetMachine', (1,), Failing(*errors))
+
+    def test_opens_after_failures_in_a_row(self):
+        for i in xrange(2):
+            self.assertRaises(TransportError, self.call,
+                              TransportError('refused', None))
+        self.assertEqual(self.call(), 'ok')
+        for i in xrange(3):
+            self.assertRaises(TransportError, self.call,
+                              TransportError('refused', None))
+        self.assertRaises(api.CircuitOpenError, self.call)
+
+    def test_faults_do_not_open_the_breaker(self):
+        for i in xrange(5):
+            self.assertRaises(WebFault, self.call, fault())
+        self.assertFalse(self.breaker.is_open)
+
+    def test_one_trial_call_after_the_reset_timeout(self):
+        for i in xrange(3):
+            self.breaker.record_failure()
+        self.clock.now += 30
+        self.breaker.before_call()
+        # Only one call at a time is let through.
+        self.assertRaises(api.CircuitOpenError, self.breaker.before_call)
+        self.breaker.record_failure()
+        self.assertRaises(api.CircuitOpenError, self.call)
+        self.clock.now += 30
+        self.assertEqual(self.call(), 'ok')
+        self.assertFalse(self.breaker.is_open)
+
+
+class TestLabManagerWithPolicy(unittest.TestCase):
+    def test_timeout_is_set_for_each_call(self):
+        client = mock.Mock()
+        lmapi = api.LabManager(client, policy=api.CallPolicy(
+            retry_delay=0.01, deadlines={'GetMachine': 10}))
+        client.service.GetMachine.side_effect = lambda machine_id: \
+            create_suds_type(id=machine_id)
+        self.assertEqual(lmapi.get_machine(5), {'id': 5})
+        timeout = client.set_options.call_args[1]['timeout']
+        self.assertTrue(9 < timeout <= 10)
+
 
 if __name__ == '__main__':
     unittest.main()
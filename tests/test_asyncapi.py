@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import unittest
+
+import mock
+
+from labmanager import api
+from labmanager import asyncapi
+from labmanager import parallel
+
+
+class TestAsyncLabManager(unittest.TestCase):
+    def setUp(self):
+        self.lmapi = mock.Mock()
+        self.async_lmapi = asyncapi.AsyncLabManager(self.lmapi,
+                                                    max_concurrency=4)
+
+    def tearDown(self):
+        self.async_lmapi.close()
+
+    def test_calls_return_futures(self):
+        self.lmapi.list_machines.return_value = [{'id': 1}]
+        future = self.async_lmapi.list_machines(289)
+        self.assertEqual(future.result(5), [{'id': 1}])
+        self.lmapi.list_machines.assert_called_with(289)
+
+    def test_constants_are_shared(self):
+        self.assertEqual(asyncapi.AsyncLabManager.POWER_ON,
+                         api.LabManager.POWER_ON)
+        self.assertEqual(self.async_lmapi.FENCE_ALLOW_IN_AND_OUT,
+                         api.LabManager.FENCE_ALLOW_IN_AND_OUT)
+
+    def test_perform_machine_actions(self):
+        self.lmapi.perform_machine_action.side_effect = \
+            lambda action, machine_id: machine_id == 2 and 1 / 0
+        futures = self.async_lmapi.perform_machine_actions(
+            api.LabManager.RESET, [1, 2, 3])
+        self.assertEqual([f.exception(5) is None for f in futures],
+                         [True, False, True])
+
+    def test_wait_for_machines(self):
+        on = {'status': api.LabManager.STATUS_ON, 'internalIP': '10.0.0.1'}
+        off = {'status': api.LabManager.STATUS_OFF}
+        responses = [[off], [on, off], [on, on]]
+        self.lmapi.list_machines.side_effect = \
+            lambda config_id: responses.pop(0)
+        future = self.async_lmapi.wait_for_machines(
+            289, api.LabManager.STATUS_ON, timeout=5, initial_delay=0.001,
+            max_delay=0.001)
+        machines, elapsed = future.result(5)
+        self.assertEqual(machines, [on, on])
+        self.assertEqual(self.lmapi.list_machines.call_count, 3)
+
+    def test_wait_for_machines_timeout(self):
+        self.lmapi.list_machines.return_value = [
+            {'status': api.LabManager.STATUS_OFF}]
+        future = self.async_lmapi.wait_for_machines(
+            289, api.LabManager.STATUS_ON, timeout=0.01, initial_delay=0.001,
+            max_delay=0.001)
+        self.assertRaises(api.WaitTimeoutError, future.result, 5)
+
+    def test_many_operations_in_flight(self):
+        self.lmapi.get_machine.side_effect = lambda machine_id: machine_id
+        futures = [self.async_lmapi.get_machine(i) for i in range(1000)]
+        self.assertEqual(sorted([f.result(5) for f in
+                                 parallel.as_completed(futures, 10)]),
+                         range(1000))
+
+
+if __name__ == '__main__':
+    unittest.main()
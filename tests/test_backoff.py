@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+
+import unittest
+
+from labmanager import backoff
+
+
+class TestExponentialBackoff(unittest.TestCase):
+    def take(self, delays, count):
+        return [delays.next() for i in range(count)]
+
+    def test_delays_grow_up_to_maximum(self):
+        delays = backoff.exponential_backoff(1, 10, jitter=0)
+        self.assertEqual(self.take(delays, 6), [1, 2, 4, 8, 10, 10])
+
+    def test_jitter_reduces_delays(self):
+        delays = backoff.exponential_backoff(4, 10, jitter=0.5,
+                                             rand=lambda: 1.0)
+        self.assertEqual(self.take(delays, 3), [2, 4, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
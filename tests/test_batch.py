@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+
+from labmanager import batch
+from labmanager.shell import ReturnCode
+
+
+def dependencies(commands):
+    return [sorted(step.depends_on) for step in
+            batch.create_steps(commands)]
+
+
+class FakeShell(object):
+    def __init__(self, fail=(), delay=0.05):
+        self.fail = fail
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.commands = []
+        self._lock = threading.Lock()
+
+    def onecmd(self, line):
+        self._lock.acquire()
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        self._lock.release()
+        time.sleep(self.delay)
+        print "ran", line
+        self._lock.acquire()
+        self.running -= 1
+        self.commands.append(line)
+        self._lock.release()
+        if line in self.fail:
+            return ReturnCode(2)
+
+
+class TestCreateSteps(unittest.TestCase):
+    def test_steps_for_the_same_config_are_chained(self):
+        self.assertEqual(dependencies([
+            'deploy --wait unfenced 289', 'deploy fenced 191',
+            'machines --format tsv 289', 'undeploy 289', 'undeploy 191',
+            'action poweroff --config 191']),
+            [[], [], [1], [3], [2], [5]])
+
+    def test_steps_with_several_configs(self):
+        self.assertEqual(dependencies([
+            'undeploy 1', 'undeploy 2', 'machines 1 2', 'wait 2 off']),
+            [[], [], [1, 2], [3]])
+
+    def test_many_configs_in_one_step(self):
+        self.assertEqual(dependencies([
+            'deploy --many unfenced 1 2', 'undeploy --many 2 3',
+            'undeploy 1', 'undeploy --all-workspace']),
+            [[], [1], [1], [1, 2, 3]])
+
+    def test_checkouts_to_the_same_name_are_chained(self):
+        self.assertEqual(dependencies([
+            'checkout 1 copy', 'checkout 2 copy', 'checkout 3 other']),
+            [[], [1], []])
+
+    def test_barriers(self):
+        self.assertEqual(dependencies([
+            'undeploy 1', 'undeploy 2', 'list', 'undeploy 1',
+            'machines --all', 'action poweron 10 11', 'undeploy 2']),
+            [[], [], [1, 2], [3], [3, 4], [5], [6]])
+
+
+class TestLoadPlan(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write(self, name, contents):
+        path = os.path.join(self.tempdir, name)
+        open(path, 'w').write(contents)
+        return path
+
+    def test_text_plan(self):
+        path = self.write('plan.txt', '# undeploy everything\n\n'
+                          'undeploy 1\n  undeploy 2  \n')
+        self.assertEqual(batch.load_plan(path), ['undeploy 1', 'undeploy 2'])
+
+    def test_json_plan(self):
+        path = self.write('plan.json', '["undeploy 1", '
+                          '{"command": "undeploy 2"}]')
+        self.assertEqual(batch.load_plan(path), ['undeploy 1', 'undeploy 2'])
+
+    def test_invalid_json_plan(self):
+        path = self.write('plan.json', '{"command": "undeploy 1"}')
+        self.assertRaises(batch.PlanError, batch.load_plan, path)
+
+
+class TestRunSteps(unittest.TestCase):
+    def run_steps(self, lmshell, commands, max_workers=4):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            return_code = batch.run_steps(
+                lmshell, batch.create_steps(commands), max_workers)
+            return return_code, sys.stdout.getvalue().splitlines()
+        finally:
+            sys.stdout = stdout
+
+    def test_independent_steps_run_concurrently(self):
+        lmshell = FakeShell()
+        return_code, lines = self.run_steps(lmshell, [
+            'undeploy 1', 'undeploy 2', 'undeploy 3', 'delete 1'],
+            max_workers=2)
+        self.assertEqual(return_code, 0)
+        self.assertEqual(lmshell.max_running, 2)
+        self.assertTrue(lmshell.commands.index('delete 1') >
+                        lmshell.commands.index('undeploy 1'))
+        self.assertTrue('[4] ran delete 1' in lines)
+        self.assertEqual(len([line for line in lines if ' ok ' in line]), 4)
+
+    def test_steps_after_a_failure_are_skipped(self):
+        lmshell = FakeShell(fail=['deploy fenced 1'])
+        return_code, lines = self.run_steps(lmshell, [
+            'deploy fenced 1', 'deploy fenced 2', 'wait 1 on', 'undeploy 1',
+            'undeploy 2'])
+        self.assertEqual(return_code, 2)
+        self.assertEqual(sorted(lmshell.commands),
+                         ['deploy fenced 1', 'deploy fenced 2', 'undeploy 2'])
+        self.assertTrue('[1] FAILED (return code 2): deploy fenced 1'
+                        in lines)
+        self.assertTrue('[3] skipped (step 1 failed): wait 1 on' in lines)
+        self.assertTrue('[4] skipped (step 3 was skipped): undeploy 1'
+                        in lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
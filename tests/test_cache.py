@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+import unittest
+
+import mock
+
+from labmanager import cache
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = cache.LRUCache(max_size=2, clock=self.clock)
+
+    def test_get_and_put(self):
+        self.assertEqual(self.cache.get('a'), (False, None))
+        self.cache.put('a', 1, ttl=10)
+        self.assertEqual(self.cache.get('a'), (True, 1))
+
+    def test_entries_expire(self):
+        self.cache.put('a', 1, ttl=10)
+        self.clock.now = 10
+        self.assertEqual(self.cache.get('a'), (False, None))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.put('a', 1, ttl=10)
+        self.cache.put('b', 2, ttl=10)
+        self.cache.get('a')
+        self.cache.put('c', 3, ttl=10)
+        self.assertEqual(self.cache.get('b'), (False, None))
+        self.assertEqual(self.cache.get('a'), (True, 1))
+        self.assertEqual(self.cache.get('c'), (True, 3))
+
+    def test_invalidate(self):
+        self.cache.put('a', 1, ttl=10)
+        self.cache.put('b', 2, ttl=10)
+        self.cache.invalidate(lambda key: key == 'a')
+        self.assertEqual(self.cache.get('a'), (False, None))
+        self.assertEqual(self.cache.get('b'), (True, 2))
+
+
+class TestCachingLabManager(unittest.TestCase):
+    def setUp(self):
+        self.lmapi = mock.Mock()
+        self.lmapi.list_machines.return_value = [{'id': 1}]
+        self.lmapi.list_all_configurations.return_value = [{'id': 289}]
+        self.cached = cache.CachingLabManager(self.lmapi)
+
+    def test_repeated_reads_are_cached(self):
+        self.assertEqual(self.cached.list_machines(289), [{'id': 1}])
+        self.assertEqual(self.cached.list_machines('289'), [{'id': 1}])
+        self.assertEqual(self.lmapi.list_machines.call_count, 1)
+        self.assertEqual(self.cached.cache_stats()['list_machines'], (1, 1))
+
+    def test_different_args_are_cached_separately(self):
+        self.cached.list_machines(289)
+        self.cached.list_machines(290)
+        self.assertEqual(self.lmapi.list_machines.call_count, 2)
+
+    def test_deploy_invalidates_configuration(self):
+        self.cached.list_machines(289)
+        self.cached.list_machines(290)
+        self.cached.list_all_configurations()
+        self.cached.deploy_configuration(289, 1)
+        self.cached.list_machines(289)
+        self.cached.list_machines(290)
+        self.cached.list_all_configurations()
+        self.assertEqual(self.lmapi.list_machines.call_count, 3)
+        self.assertEqual(self.lmapi.list_all_configurations.call_count, 2)
+
+    def test_reads_in_flight_during_a_write_are_not_cached(self):
+        def list_machines(config_id):
+            # The deploy finishes while the listing is in flight.
+            self.cached.deploy_configuration(289, 1)
+            return [{'id': 1}]
+        self.lmapi.list_machines.side_effect = list_machines
+        self.cached.list_machines(289)
+        self.cached.list_machines(289)
+        self.assertEqual(self.lmapi.list_machines.call_count, 2)
+
+    def test_failed_write_still_invalidates(self):
+        self.lmapi.undeploy_configuration.side_effect = ValueError()
+        self.cached.list_all_configurations()
+        self.assertRaises(ValueError, self.cached.undeploy_configuration, 289)
+        self.cached.list_all_configurations()
+        self.assertEqual(self.lmapi.list_all_configurations.call_count, 2)
+
+    def test_machine_action_invalidates_machines(self):
+        self.cached.list_machines(289)
+        self.cached.list_all_configurations()
+        self.cached.perform_machine_action(self.lmapi.POWER_ON, 1)
+        self.cached.list_machines(289)
+        self.cached.list_all_configurations()
+        self.assertEqual(self.lmapi.list_machines.call_count, 2)
+        self.assertEqual(self.lmapi.list_all_configurations.call_count, 1)
+
+    def test_iter_machines_uses_the_cache(self):
+        self.lmapi.max_clients = 4
+        self.cached.list_machines(289)
+        results = list(self.cached.iter_machines([289, 290]))
+        self.assertEqual(sorted([r.item for r in results]), [289, 290])
+        self.assertEqual([r.value for r in results], [[{'id': 1}]] * 2)
+        self.assertEqual(self.lmapi.list_machines.call_count, 2)
+
+    def test_batch_lookups_use_the_cache(self):
+        self.lmapi.max_clients = 4
+        self.lmapi.get_machine.side_effect = lambda machine_id: \
+            {'id': int(machine_id)}
+        self.cached.get_machine(1)
+        results = self.cached.get_machines([1, 2, '2'])
+        self.assertEqual([r.value for r in results],
+                         [{'id': 1}, {'id': 2}, {'id': 2}])
+        self.assertEqual(self.lmapi.get_machine.call_count, 2)
+
+    def test_results_are_copies(self):
+        self.cached.list_machines(289).append({'id': 2})
+        self.assertEqual(self.cached.list_machines(289), [{'id': 1}])
+
+    def test_ttls(self):
+        cached = cache.CachingLabManager(self.lmapi, {'list_machines': 0})
+        cached.list_machines(289)
+        cached.list_machines(289)
+        self.assertEqual(self.lmapi.list_machines.call_count, 2)
+        self.assertRaises(ValueError, cache.CachingLabManager, self.lmapi,
+                          {'deploy_configuration': 10})
+
+    def test_other_attributes_are_delegated(self):
+        self.assertTrue(self.cached.POWER_ON is self.lmapi.POWER_ON)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import socket
+import logging
+import tempfile
+import unittest
+
+import suds
+
+from labmanager import api
+from labmanager import cassette
+from labmanager import config
+from labmanager.shell import NullHandler
+
+import fakeserver
+
+
+# suds logs every fault it receives.
+logging.getLogger('suds').addHandler(NullHandler())
+
+
+HEADER = ('<SOAP-ENV:Header><ns0:AuthenticationHeader>'
+          '<ns0:username>me</ns0:username>'
+          '<ns0:password>s3cret</ns0:password>'
+          '<ns0:organizationname>org</ns0:organizationname>'
+          '</ns0:AuthenticationHeader></SOAP-ENV:Header>')
+
+
+class TestScrub(unittest.TestCase):
+    def test_credentials_are_scrubbed(self):
+        scrubbed = cassette.scrub(HEADER)
+        self.assertFalse('me<' in scrubbed)
+        self.assertFalse('s3cret' in scrubbed)
+        self.assertTrue('<ns0:username>SCRUBBED</ns0:username>' in scrubbed)
+        self.assertTrue('>org<' in scrubbed)
+
+    def test_unprefixed_header(self):
+        self.assertEqual(cassette.scrub(
+            '<AuthenticationHeader xmlns="urn:x"><password>s3cret'
+            '</password></AuthenticationHeader>'),
+            '<AuthenticationHeader xmlns="urn:x"><password>SCRUBBED'
+            '</password></AuthenticationHeader>')
+
+    def test_only_the_header_is_scrubbed(self):
+        message = '<Body><username>me</username></Body>'
+        self.assertEqual(cassette.scrub(message), message)
+
+
+class TestRecordAndReplay(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'session.cassette')
+        self.fake = fakeserver.FakeLabManager(configurations=4,
+                                              machines_per_configuration=2)
+        self.server = fakeserver.FakeLabManagerServer(self.fake)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tempdir)
+
+    def api_config(self, **kwargs):
+        return config.APIConfig(self.server.hostname, 'username', 's3cret',
+                                'org', 'Main', wsdl_cache_dir=None,
+                                scheme='http', **kwargs)
+
+    def record(self):
+        client = api.create_soap_client(
+            self.api_config(record_cassette=self.path))
+        lmapi = api.LabManager(client)
+        self.fake.inject_fault('GetMachine', 'No such machine')
+        try:
+            result = (lmapi.list_all_configurations(),
+                      lmapi.list_machines(1))
+            self.assertRaises(suds.WebFault, lmapi.get_machine, 1)
+            lmapi.undeploy_configuration(1)
+            return result + (lmapi.show_configuration(1),)
+        finally:
+            client.options.transport.transport.close()
+
+    def test_replay_without_a_server(self):
+        configurations, machines, undeployed = self.record()
+        self.assertFalse('s3cret' in open(self.path).read())
+        self.server.stop()
+        slept = []
+        transport = cassette.ReplayTransport(
+            cassette.Cassette.load(self.path), time_scale=2,
+            sleep=slept.append)
+        client = suds.client.Client(self.api_config().url,
+                                    transport=transport)
+        client.set_options(soapheaders=client.factory.create(
+            'AuthenticationHeader'))
+        lmapi = api.LabManager(client)
+        self.assertEqual(lmapi.list_all_configurations(), configurations)
+        self.assertEqual(lmapi.list_machines(1), machines)
+        self.assertRaises(suds.WebFault, lmapi.get_machine, 1)
+        # The replies for a request are replayed in order.
+        self.assertTrue(lmapi.show_configuration(1)['isDeployed'] is False)
+        self.assertTrue(slept and min(slept) > 0)
+        recorded = [i['elapsed'] for i in transport.cassette.interactions]
+        self.assertEqual(sorted(slept)[-1], 2 * max(recorded))
+
+    def test_streamed_lists_replay_suds_recordings(self):
+        configurations, machines, undeployed = self.record()
+        self.server.stop()
+        lmapi = api.LabManager(api.create_soap_client(self.api_config(
+            replay_cassette=self.path, replay_time_scale=0)),
+            stream_lists=True)
+        self.assertEqual(lmapi.list_machines(1), machines)
+
+    def test_timeouts_are_replayed(self):
+        api_config = self.api_config(record_cassette=self.path,
+                                     retries=0,
+                                     deadlines={'GetConfiguration': 0.2})
+        client = api.create_soap_client(api_config)
+        lmapi = api.LabManager(client,
+                               policy=api.create_call_policy(api_config))
+        self.server.latency = 1
+        try:
+            self.assertRaises(socket.timeout, lmapi.show_configuration, 1)
+        finally:
+            client.options.transport.transport.close()
+        lmapi = api.LabManager(api.create_soap_client(self.api_config(
+            replay_cassette=self.path, replay_time_scale=0, retries=0)))
+        try:
+            lmapi.show_configuration(1)
+        except socket.error, e:
+            self.assertTrue(api.is_connection_error(e))
+            self.assertTrue('timed out' in str(e))
+        else:
+            self.fail("socket.error not raised")
+
+    def test_missing_reply(self):
+        self.record()
+        lmapi = api.LabManager(api.create_soap_client(self.api_config(
+            replay_cassette=self.path, replay_time_scale=0)))
+        self.assertRaises(cassette.CassetteError, lmapi.list_machines, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
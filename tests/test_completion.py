@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import time
+import unittest
+
+import mock
+
+from labmanager import completion
+from labmanager.shell import LMShell
+
+
+class TestCompletionIndex(unittest.TestCase):
+    def setUp(self):
+        self.lmapi = mock.Mock()
+        self.lmapi.list_all_configurations.return_value = [
+            {'id': 191, 'name': 'TestServerOne', 'isDeployed': False},
+            {'id': 289, 'name': 'TestServerTwo', 'isDeployed': True},
+            {'id': 1393, 'name': 'WebServer', 'isDeployed': False},
+        ]
+        self.lmapi.list_machines.return_value = [
+            {'id': 9601, 'name': 'web1'},
+            {'id': 9602, 'name': 'web2'},
+            {'id': 9701, 'name': 'db1'},
+        ]
+        self.index = completion.CompletionIndex(self.lmapi)
+
+    def test_empty_index_completes_nothing(self):
+        self.assertEqual(self.index.complete_config_id(''), [])
+        self.assertEqual(self.index.complete_machine_id('9'), [])
+
+    def test_complete_config_ids(self):
+        self.index.refresh()
+        self.assertEqual(self.index.complete_config_id(''),
+                         ['1393', '191', '289'])
+        self.assertEqual(self.index.complete_config_id('1'),
+                         ['1393', '191'])
+        self.assertEqual(self.index.complete_config_id('5'), [])
+
+    def test_names_complete_to_ids(self):
+        self.index.refresh()
+        self.assertEqual(self.index.complete_config_id('testserver'),
+                         ['191', '289'])
+        self.assertEqual(self.index.complete_config_id('Web'), ['1393'])
+
+    def test_only_deployed_machines_are_indexed(self):
+        self.index.refresh()
+        self.lmapi.list_machines.assert_called_once_with(289)
+        self.assertEqual(self.index.complete_machine_id('96'),
+                         ['9601', '9602'])
+        self.assertEqual(self.index.complete_machine_id('db'), ['9701'])
+
+    def test_completion_is_fast_with_many_configurations(self):
+        self.lmapi.list_all_configurations.return_value = [
+            {'id': i, 'name': 'config%s' % i, 'isDeployed': False}
+            for i in xrange(10000)]
+        self.index.refresh()
+        start = time.time()
+        for i in xrange(100):
+            self.index.complete_config_id('12')
+            self.index.complete_config_id('config12')
+        self.assertTrue((time.time() - start) / 200 < 0.01)
+
+    def test_background_refresh(self):
+        self.index.start()
+        try:
+            for i in xrange(100):
+                if self.index.complete_config_id(''):
+                    break
+                time.sleep(0.01)
+            self.assertEqual(self.index.complete_config_id('2'), ['289'])
+        finally:
+            self.index.stop()
+
+
+class TestShellRefreshesTheIndex(unittest.TestCase):
+    def test_commands_that_change_machines(self):
+        index = mock.Mock()
+        lmsh = LMShell(mock.Mock(), completion_index=index)
+        for line in ('list', 'machines 289', 'show 289'):
+            lmsh.postcmd(None, line)
+        self.assertFalse(index.request_refresh.called)
+        for line in ('checkout 191 copy', 'delete 191', 'deploy 289',
+                     'undeploy 289', 'action on 9601'):
+            index.reset_mock()
+            lmsh.postcmd(None, line)
+            self.assertTrue(index.request_refresh.called, line)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+from ConfigParser import SafeConfigParser
+
+from labmanager import config
+from labmanager.shell import get_cmd_line_parser
+
+
+class TestLoadConfig(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.user_config_file = config.USER_CONFIG_FILE
+        config.USER_CONFIG_FILE = os.path.join(self.tempdir, '.lmshrc')
+        open(config.USER_CONFIG_FILE, 'w').write(
+            '[default]\nhostname=localhost\nusername=user\n'
+            'organization=org\nwsdl_cache_days=3\nrefresh_wsdl=true\n')
+        self.parser = get_cmd_line_parser()
+
+    def tearDown(self):
+        config.USER_CONFIG_FILE = self.user_config_file
+        shutil.rmtree(self.tempdir)
+
+    def load(self, argv):
+        return config.load_config(self.parser, self.parser.parse_args(argv),
+                                  SafeConfigParser())
+
+    def test_config_file_values(self):
+        api_config = self.load([])
+        self.assertEqual(api_config.hostname, 'localhost')
+        self.assertEqual(api_config.wsdl_cache_days, 3)
+
+    def test_cache_ttls(self):
+        self.assertEqual(self.load([]).cache_ttls, {})
+        self.assertEqual(self.load(['--cache-ttls', 'list_machines=5, '
+                                    'get_machine=0.5']).cache_ttls,
+                         {'list_machines': 5, 'get_machine': 0.5})
+        self.assertRaises(ValueError, self.load,
+                          ['--cache-ttls', 'list_machines'])
+
+    def test_refresh_wsdl_is_only_a_command_line_option(self):
+        self.assertFalse(self.load([]).refresh_wsdl)
+        self.assertTrue(self.load(['--refresh-wsdl']).refresh_wsdl)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import socket
+import logging
+import tempfile
+import subprocess
+import unittest
+from StringIO import StringIO
+
+import suds
+
+from labmanager import api
+from labmanager import cache
+from labmanager import config
+from labmanager import shell
+from labmanager import stats
+from labmanager.shell import LMShell, NullHandler
+
+import fakeserver
+
+
+# suds logs every fault it receives.
+logging.getLogger('suds').addHandler(NullHandler())
+
+
+def _kind(value):
+    if isinstance(value, basestring):
+        return basestring
+    return type(value)
+
+
+class TestFakeLabManagerServer(unittest.TestCase):
+    # These go through suds, the transport and a real socket,
+    # so they also cover the parts that test_api mocks out.
+    def setUp(self):
+        self.fake = fakeserver.FakeLabManager(configurations=6,
+                                              machines_per_configuration=2)
+        self.server = fakeserver.FakeLabManagerServer(self.fake)
+        self.server.start()
+        api_config = config.APIConfig(self.server.hostname, 'username',
+                                      'password', 'org', 'Main',
+                                      wsdl_cache_dir=None, scheme='http')
+        self.client = api.create_soap_client(api_config)
+        self.lmapi = api.LabManager(self.client)
+
+    def tearDown(self):
+        # Close the keep-alive connections so the server's
+        # handler threads can finish.
+        self.client.options.transport.close()
+        self.server.stop()
+
+    def test_list_configurations(self):
+        workspace = self.lmapi.list_workspace_configurations()
+        library = self.lmapi.list_library_configurations()
+        self.assertEqual([c['id'] for c in workspace], [1, 3, 5])
+        self.assertEqual([c['id'] for c in library], [2, 4, 6])
+        self.assertEqual(len(self.lmapi.list_all_configurations()), 6)
+        self.assertEqual(workspace[0]['name'], 'Configuration0')
+        self.assertTrue(workspace[0]['isDeployed'])
+        self.assertFalse(workspace[1]['isDeployed'])
+
+    def test_deadline(self):
+        api_config = config.APIConfig(self.server.hostname, 'username',
+                                      'password', 'org', 'Main',
+                                      wsdl_cache_dir=None, scheme='http',
+                                      deadlines={'GetConfiguration': 0.2},
+                                      breaker_failures=2)
+        client = api.create_soap_client(api_config)
+        lmapi = api.LabManager(client,
+                               policy=api.create_call_policy(api_config))
+        # So the timeouts happen on a kept alive connection.
+        lmapi.show_configuration(1)
+        self.server.latency = 1
+        try:
+            self.assertRaises(socket.timeout, lmapi.show_configuration, 1)
+            self.assertRaises(socket.timeout, lmapi.show_configuration, 1)
+            # The server is unreachable, not answering with faults.
+            self.assertRaises(api.CircuitOpenError,
+                              lmapi.show_configuration, 1)
+        finally:
+            client.options.transport.close()
+
+    def test_list_machines(self):
+        machines = self.lmapi.list_machines(1)
+        self.assertEqual([m['name'] for m in machines],
+                         ['machine0', 'machine1'])
+        self.assertEqual(machines[0]['status'], api.LabManager.STATUS_ON)
+        self.assertEqual(machines[0]['configID'], 1)
+        self.assertTrue(machines[0]['internalIP'])
+
+    def test_deploy_and_undeploy(self):
+        self.lmapi.deploy_configuration(3, api.LabManager.NON_FENCED)
+        self.assertTrue(self.lmapi.show_configuration(3)['isDeployed'])
+        self.assertEqual([m['status'] for m in self.lmapi.list_machines(3)],
+                         [api.LabManager.STATUS_ON] * 2)
+        self.lmapi.undeploy_configuration(3)
+        self.assertFalse(self.lmapi.show_configuration(3)['isDeployed'])
+
+    def test_machine_actions(self):
+        machine_id = self.lmapi.list_machines(1)[0]['id']
+        self.lmapi.perform_machine_action(api.LabManager.SUSPEND, machine_id)
+        self.assertEqual(self.lmapi.get_machine(machine_id)['status'],
+                         api.LabManager.STATUS_SUSPENDED)
+
+    def test_checkout_and_delete(self):
+        new_id = self.lmapi.checkout_configuration(2, 'mycopy')
+        self.assertEqual(
+            self.lmapi.show_configuration_by_name('mycopy')['id'], new_id)
+        self.assertEqual(len(self.lmapi.list_machines(new_id)), 2)
+        self.lmapi.delete_configuration(new_id)
+        self.assertRaises(suds.WebFault, self.lmapi.show_configuration,
+                          new_id)
+
+    def test_concurrent_replies_are_not_mixed_up(self):
+        lmapi = api.LabManager(self.client, max_clients=6)
+        for i in range(30):
+            for result in lmapi.iter_machines(range(1, 7)):
+                self.assertEqual(
+                    [m['configID'] for m in result.get()],
+                    [result.item] * 2)
+
+    def test_injected_fault(self):
+        self.fake.inject_fault('GetConfiguration', 'Something went wrong')
+        try:
+            self.lmapi.show_configuration(1)
+        except suds.WebFault, e:
+            self.assertTrue('Something went wrong' in str(e))
+        else:
+            self.fail("WebFault not raised")
+        # Only the next call fails.
+        self.assertEqual(self.lmapi.show_configuration(1)['id'], 1)
+
+    def test_malformed_argument(self):
+        try:
+            self.lmapi.show_configuration('')
+        except suds.WebFault, e:
+            self.assertTrue('Invalid' in str(e))
+        else:
+            self.fail("WebFault not raised")
+
+    def test_faults_are_retried_for_read_calls(self):
+        lmapi = api.LabManager(self.client, policy=api.CallPolicy(
+            retries=2, retry_delay=0.01))
+        self.fake.inject_fault('GetConfiguration', count=2)
+        self.assertEqual(lmapi.show_configuration(1)['id'], 1)
+        self.fake.inject_fault('ConfigurationUndeploy')
+        self.assertRaises(suds.WebFault, lmapi.undeploy_configuration, 1)
+        self.assertTrue(lmapi.show_configuration(1)['isDeployed'])
+
+    def test_batch_lookups(self):
+        results = self.lmapi.get_machines_by_name(
+            1, ['machine1', 'missing', 'machine0', 'machine1'])
+        self.assertEqual([r.ok for r in results], [True, False, True, True])
+        self.assertEqual([r.value['name'] for r in results if r.ok],
+                         ['machine1', 'machine0', 'machine1'])
+        self.assertTrue(isinstance(results[1].error, suds.WebFault))
+        results = self.lmapi.get_machines(
+            [results[0].value['id'], results[2].value['id']])
+        self.assertEqual([r.value['name'] for r in results],
+                         ['machine1', 'machine0'])
+
+    def test_streamed_lists_match_suds(self):
+        lmapi = api.LabManager(self.client, stream_lists=True)
+        for method, arg in [('list_workspace_configurations', ()),
+                            ('list_all_configurations', ()),
+                            ('list_machines', (3,))]:
+            streamed = getattr(lmapi, method)(*arg)
+            from_suds = getattr(self.lmapi, method)(*arg)
+            self.assertEqual(streamed, from_suds)
+            # Strings are str or unicode rather than suds' Text.
+            self.assertEqual([map(_kind, r.values()) for r in streamed],
+                             [map(_kind, r.values()) for r in from_suds])
+        machines = list(lmapi.stream_machines(1))
+        self.assertEqual([m['name'] for m in machines],
+                         ['machine0', 'machine1'])
+        self.fake.inject_fault('ListMachines', 'Something went wrong')
+        self.assertRaises(suds.WebFault, lmapi.list_machines, 1)
+
+    def test_random_faults(self):
+        self.fake.fault_rate = 1.0
+        self.assertRaises(suds.WebFault, self.lmapi.get_machine, 1)
+
+    def run_command(self, line):
+        lmsh = LMShell(self.lmapi, output_format='tsv')
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            lmsh.onecmd(line)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_wait_with_a_bad_timeout(self):
+        lmsh = LMShell(self.lmapi)
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            result = lmsh.onecmd('wait 3 on abc')
+            self.assertTrue('timeout must be a number' in
+                            sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(result.return_code, 1)
+
+    def test_show_several_configurations(self):
+        output = self.run_command('show 2 999 1')
+        self.assertTrue(output.index("'id': 2") < output.index("'id': 1"))
+        self.assertTrue('999: ERROR' in output)
+
+    def test_undeploy_all_workspace(self):
+        self.lmapi.deploy_configuration(3, api.LabManager.NON_FENCED)
+        output = self.run_command('undeploy --all-workspace')
+        self.assertTrue('1: ok' in output)
+        self.assertTrue('2 of 2 configurations undeployed' in output)
+        self.assertEqual([c['id'] for c in
+                          self.lmapi.list_all_configurations()
+                          if c['isDeployed']], [])
+        output = self.run_command('deploy --many unfenced 2 999 4')
+        self.assertTrue('999: ERROR' in output)
+        self.assertTrue('2 of 3 configurations deployed' in output)
+
+    def test_bulk_commands_do_not_act_on_cached_lists(self):
+        lmsh = LMShell(cache.CachingLabManager(self.lmapi),
+                       output_format='tsv')
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            lmsh.onecmd('list workspace')
+            # Deployed by someone else, after the list was cached.
+            self.lmapi.deploy_configuration(3, api.LabManager.NON_FENCED)
+            lmsh.onecmd('machines --deployed')
+            self.assertEqual(len(sys.stdout.getvalue().splitlines()), 7)
+            lmsh.onecmd('undeploy --all-workspace')
+            self.assertTrue('2 of 2 configurations undeployed' in
+                            sys.stdout.getvalue())
+        finally:
+            sys.stdout = stdout
+
+    def test_shell_command(self):
+        output = self.run_command('list workspace')
+        self.assertEqual([line.split('\t')[0] for line in
+                          output.splitlines()], ['1', '3', '5'])
+
+    def test_machines_in_every_deployed_configuration(self):
+        self.lmapi.deploy_configuration(5, api.LabManager.NON_FENCED)
+        output = self.run_command('machines --deployed')
+        # The last column is the config ID.
+        self.assertEqual(sorted([line.split('\t')[-1] for line in
+                                 output.splitlines()]),
+                         ['1', '1', '5', '5'])
+
+    def test_machines_in_many_configurations(self):
+        output = self.run_command('machines --all')
+        self.assertEqual(len(output.splitlines()), 12)
+        output = self.run_command('machines 2 3')
+        self.assertEqual(len(output.splitlines()), 4)
+
+    def test_list_changes(self):
+        lmsh = LMShell(self.lmapi, output_format='tsv')
+        stdout = sys.stdout
+        try:
+            sys.stdout = StringIO()
+            lmsh.onecmd('list --changes workspace')
+            self.assertEqual(len(sys.stdout.getvalue().splitlines()), 3)
+            self.lmapi.deploy_configuration(3, api.LabManager.NON_FENCED)
+            self.lmapi.delete_configuration(5)
+            sys.stdout = StringIO()
+            lmsh.onecmd('list --changes workspace')
+            self.assertEqual([line.split('\t')[:2] for line in
+                              sys.stdout.getvalue().splitlines()],
+                             [['changed', '3'], ['removed', '5']])
+        finally:
+            sys.stdout = stdout
+
+    def test_find(self):
+        output = self.run_command('find type=library name=configuration*')
+        self.assertEqual([line.split('\t')[0] for line in
+                          output.splitlines()], ['2', '4', '6'])
+        output = self.run_command('find config=3')
+        self.assertEqual(len(output.splitlines()), 2)
+
+
+class TestOneShotCommands(unittest.TestCase):
+    def setUp(self):
+        self.fake = fakeserver.FakeLabManager(configurations=4)
+        self.server = fakeserver.FakeLabManagerServer(self.fake)
+        self.server.start()
+        self.home = tempfile.mkdtemp()
+        open(os.path.join(self.home, '.lmshrc'), 'w').write(
+            '[default]\nusername=user\npassword=password\n'
+            'organization=org\nscheme=http\nno_wsdl_cache=true\n'
+            'hostname=%s\n' % self.server.hostname)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.home)
+
+    def run_lmsh(self, args):
+        env = dict(os.environ)
+        env['HOME'] = self.home
+        # Run from the source tree, wherever the tests are run from.
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__)))
+        process = subprocess.Popen(
+            [sys.executable, '-c', 'from labmanager.shell import main; '
+             'main()'] + args, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, env=env)
+        stdout, stderr = process.communicate()
+        return process.returncode, stdout, stderr
+
+    def test_command_options_reach_the_command(self):
+        return_code, stdout, stderr = self.run_lmsh(
+            ['--format', 'tsv', 'undeploy', '--many', '1', '3'])
+        self.assertEqual((return_code, stderr), (0, ''))
+        self.assertTrue('2 of 2 configurations undeployed' in stdout)
+        return_code, stdout, stderr = self.run_lmsh(
+            ['--format', 'tsv', '--', 'machines', '--deployed'])
+        self.assertEqual((return_code, stdout, stderr), (0, '', ''))
+
+    def test_changes_expire_the_saved_inventory(self):
+        find = ['--format', 'tsv', 'find', 'type=workspace',
+                'deployed=true']
+        return_code, stdout, stderr = self.run_lmsh(find)
+        self.assertEqual([line.split('\t')[0] for line in
+                          stdout.splitlines()], ['1'])
+        return_code, stdout, stderr = self.run_lmsh(
+            ['deploy', 'unfenced', '3'])
+        self.assertEqual((return_code, stderr), (0, ''))
+        return_code, stdout, stderr = self.run_lmsh(find)
+        self.assertEqual([line.split('\t')[0] for line in
+                          stdout.splitlines()], ['1', '3'])
+
+    def test_list_changes_since_the_last_run(self):
+        changes = ['--format', 'tsv', 'list', '--changes', 'workspace']
+        return_code, stdout, stderr = self.run_lmsh(changes)
+        self.assertEqual(len(stdout.splitlines()), 2)
+        return_code, stdout, stderr = self.run_lmsh(changes)
+        self.assertEqual((return_code, stdout, stderr), (0, '', ''))
+        self.run_lmsh(['deploy', 'unfenced', '3'])
+        return_code, stdout, stderr = self.run_lmsh(changes)
+        self.assertEqual([line.split('\t')[:2] for line in
+                          stdout.splitlines()], [['changed', '3']])
+
+    def test_passed_deadline(self):
+        self.server.latency = 2
+        for keep_alive in ([], ['--no-keep-alive']):
+            return_code, stdout, stderr = self.run_lmsh(
+                keep_alive + ['--deadlines', 'GetConfiguration=0.5',
+                              'show', '1'])
+            self.assertEqual(return_code, 1)
+            self.assertTrue(stderr.startswith('ERROR: ') and
+                            'timed out' in stderr, stderr)
+
+
+class TestSections(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+        for configurations in (2, 3):
+            server = fakeserver.FakeLabManagerServer(
+                fakeserver.FakeLabManager(configurations=configurations))
+            server.start()
+            self.servers.append(server)
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def api_config(self, hostname):
+        return config.APIConfig(hostname, 'username', 'password', 'org',
+                                'Main', wsdl_cache_dir=None, scheme='http',
+                                keep_alive=False)
+
+    def run_sections(self, section_configs, command):
+        args = shell.get_cmd_line_parser().parse_args(
+            ['--format', 'tsv'] + command.split())
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO(), StringIO()
+        try:
+            return_code = shell.run_sections(args, section_configs,
+                                             stats.Stats())
+            return return_code, sys.stdout.getvalue(), sys.stderr.getvalue()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+    def test_output_is_merged_with_a_source_column(self):
+        return_code, stdout, stderr = self.run_sections(
+            [('one', self.api_config(self.servers[0].hostname)),
+             ('two', self.api_config(self.servers[1].hostname))], 'list')
+        self.assertEqual(return_code, 0)
+        self.assertEqual(sorted([line.split('\t')[:2] for line in
+                                 stdout.splitlines()]),
+                         [['one', '1'], ['one', '2'], ['two', '1'],
+                          ['two', '2'], ['two', '3']])
+
+    def test_failed_sections_do_not_stop_the_others(self):
+        self.servers[1].stop()
+        return_code, stdout, stderr = self.run_sections(
+            [('one', self.api_config(self.servers[0].hostname)),
+             ('two', self.api_config(self.servers[1].hostname))], 'list')
+        self.assertEqual(return_code, 1)
+        self.assertEqual(len(stdout.splitlines()), 2)
+        self.assertTrue(stderr.startswith('two: could not connect'))
+
+
+if __name__ == '__main__':
+    unittest.main()
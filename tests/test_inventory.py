@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from labmanager import inventory
+from labmanager import parallel
+
+
+CONFIGS = [
+    {'id': 1, 'name': 'web-tier', 'owner': 'jsmith', 'isDeployed': True,
+     'type': 1, 'isPublic': False},
+    {'id': 2, 'name': 'Web-Golden', 'owner': 'jdoe', 'isDeployed': False,
+     'type': 2, 'isPublic': True},
+    {'id': 3, 'name': 'db', 'owner': 'jsmith', 'isDeployed': False,
+     'type': 1, 'isPublic': False},
+]
+MACHINES = {
+    1: [{'id': 10, 'name': 'web1', 'internalIP': '10.0.0.1',
+         'externalIP': '', 'macAddress': '00:50:56:00:00:01',
+         'isDeployed': True, 'status': 2, 'configID': 1}],
+    2: [{'id': 20, 'name': 'web1', 'internalIP': '10.0.1.1',
+         'macAddress': '00:50:56:00:01:01', 'isDeployed': False,
+         'status': 1, 'configID': 2}],
+    3: [{'id': 30, 'name': 'db1', 'internalIP': '10.0.2.1',
+         'macAddress': '00:50:56:00:02:01', 'isDeployed': False,
+         'status': 1, 'configID': 3}],
+}
+ENUM_NAMES = {'type': {1: 'workspace', 2: 'library'},
+              'status': {1: 'off', 2: 'on'}}
+
+
+def iter_machines(config_ids):
+    return [parallel.Result(config_id, value=MACHINES[config_id])
+            for config_id in config_ids]
+
+
+class TestInventory(unittest.TestCase):
+    def setUp(self):
+        self.lmapi = mock.Mock()
+        self.lmapi.list_all_configurations.return_value = CONFIGS
+        self.lmapi.iter_machines.side_effect = iter_machines
+        self.inventory = inventory.Inventory(self.lmapi,
+                                             enum_names=ENUM_NAMES)
+        self.inventory.refresh()
+
+    def find_ids(self, query, kind=None):
+        kind, results = self.inventory.find(
+            inventory.parse_terms(query.split()), kind)
+        return kind, [obj['id'] for obj in results]
+
+    def test_exact_matches(self):
+        self.assertEqual(self.find_ids('owner=jsmith'), ('configs', [1, 3]))
+        self.assertEqual(self.find_ids('owner=JSMITH deployed=true'),
+                         ('configs', [1]))
+        self.assertEqual(self.find_ids('owner=nobody'), ('configs', []))
+
+    def test_wildcard_matches(self):
+        self.assertEqual(self.find_ids('name=web*'), ('configs', [1, 2]))
+        self.assertEqual(self.find_ids('ip=10.0.?.1'),
+                         ('machines', [10, 20, 30]))
+        self.assertEqual(self.find_ids('mac=*:02:01'), ('machines', [30]))
+
+    def test_enum_names(self):
+        self.assertEqual(self.find_ids('type=library'), ('configs', [2]))
+        self.assertEqual(self.find_ids('type=2'), ('configs', [2]))
+        self.assertEqual(self.find_ids('status=on'), ('machines', [10]))
+
+    def test_machine_searches(self):
+        self.assertEqual(self.find_ids('config=3'), ('machines', [30]))
+        self.assertEqual(self.find_ids('name=web1', 'machines'),
+                         ('machines', [10, 20]))
+
+    def test_unknown_field(self):
+        self.assertRaises(inventory.InvalidQueryError, self.find_ids,
+                          'colour=red')
+        self.assertRaises(inventory.InvalidQueryError,
+                          inventory.parse_terms, ['owner'])
+
+    def test_refresh_only_lists_deployed_and_changed_configs(self):
+        self.assertEqual(self.lmapi.iter_machines.call_args[0][0], [1, 2, 3])
+        changed = dict(CONFIGS[2], name='db-renamed')
+        self.lmapi.list_all_configurations.return_value = \
+            CONFIGS[:2] + [changed]
+        self.assertEqual(self.inventory.refresh(), (3, 2, []))
+        self.assertEqual(self.lmapi.iter_machines.call_args[0][0], [1, 3])
+        self.assertEqual(self.find_ids('name=db-*'), ('configs', [3]))
+
+    def test_deleted_configs_are_dropped(self):
+        self.lmapi.list_all_configurations.return_value = CONFIGS[:1]
+        self.inventory.refresh()
+        self.assertEqual(len(self.inventory), 1)
+        self.assertEqual(self.find_ids('name=db1', 'machines'),
+                         ('machines', []))
+
+    def test_failed_configs_are_listed_again(self):
+        def failing(config_ids):
+            return [parallel.Result(config_id,
+                                    exc_info=(ValueError, ValueError(), None))
+                    for config_id in config_ids]
+        self.lmapi.iter_machines.side_effect = failing
+        self.lmapi.list_all_configurations.return_value = \
+            [dict(c, owner='someone') for c in CONFIGS]
+        count, listed, errors = self.inventory.refresh()
+        self.assertEqual(len(errors), 3)
+        # The machines from before are kept.
+        self.assertEqual(self.find_ids('name=db1', 'machines'),
+                         ('machines', [30]))
+        self.lmapi.iter_machines.side_effect = iter_machines
+        self.inventory.refresh()
+        self.assertEqual(self.lmapi.iter_machines.call_args[0][0], [1, 2, 3])
+
+
+class TestSavedInventory(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'inventory', 'lm.json')
+        self.lmapi = mock.Mock()
+        self.lmapi.list_all_configurations.return_value = CONFIGS
+        self.lmapi.iter_machines.side_effect = iter_machines
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_save_and_load(self):
+        inventory.Inventory(self.lmapi, self.path, ENUM_NAMES).refresh()
+        self.assertEqual(os.stat(self.path).st_mode & 0777, 0600)
+        loaded = inventory.Inventory(self.lmapi, self.path, ENUM_NAMES)
+        self.assertTrue(loaded.load())
+        self.assertEqual(len(loaded), 3)
+        self.assertTrue(loaded.age() is not None)
+        kind, results = loaded.find([('ip', '10.0.0.1')])
+        self.assertEqual([m['name'] for m in results], ['web1'])
+        # Nothing changed, so only the deployed config is listed.
+        loaded.refresh()
+        self.assertEqual(self.lmapi.iter_machines.call_args[0][0], [1])
+
+    def test_loaded_when_first_needed(self):
+        inventory.Inventory(self.lmapi, self.path, ENUM_NAMES).refresh()
+        loaded = inventory.Inventory(self.lmapi, self.path, ENUM_NAMES)
+        kind, results = loaded.find([('ip', '10.0.0.1')])
+        self.assertEqual([m['name'] for m in results], ['web1'])
+        self.assertTrue(loaded.age() is not None)
+        # Nothing is read until then.
+        unused = inventory.Inventory(self.lmapi, self.path, ENUM_NAMES)
+        os.rename(self.path, self.path + '.moved')
+        self.assertEqual(len(unused), 0)
+        os.rename(self.path + '.moved', self.path)
+
+    def test_expired_inventory_is_saved_as_expired(self):
+        inventory.Inventory(self.lmapi, self.path, ENUM_NAMES).refresh()
+        inventory.Inventory(self.lmapi, self.path, ENUM_NAMES).expire()
+        loaded = inventory.Inventory(self.lmapi, self.path, ENUM_NAMES)
+        self.assertEqual(len(loaded), 3)
+        self.assertTrue(loaded.age() is None)
+
+    def test_nothing_saved(self):
+        self.assertFalse(inventory.Inventory(self.lmapi, self.path).load())
+
+
+if __name__ == '__main__':
+    unittest.main()
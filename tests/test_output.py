@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+import json
+import threading
+import unittest
+from StringIO import StringIO
+
+from labmanager import output
+
+
+def get_row(obj):
+    return [obj['id'], obj['name']]
+
+
+class TestWriters(unittest.TestCase):
+    def setUp(self):
+        self.stream = StringIO()
+        self.objects = [{'id': 191, 'name': 'TestServerOne'},
+                        {'id': 289, 'name': 'TestServerTwo'}]
+
+    def write(self, output_format, objects, widths=(6, 15)):
+        writer = output.create_writer(output_format, self.stream, get_row,
+                                      ['id', 'name'], list(widths))
+        for obj in objects:
+            writer.write(obj)
+        writer.close()
+        return self.stream.getvalue()
+
+    def test_table(self):
+        self.assertEqual(self.write('table', self.objects), (
+            '  id   |      name      \n'
+            '=======+================\n'
+            '191    | TestServerOne  \n'
+            '289    | TestServerTwo  \n'))
+
+    def test_table_wraps_long_values(self):
+        self.assertEqual(self.write('table', self.objects, widths=(6, 10)), (
+            '  id   |    name   \n'
+            '=======+===========\n'
+            '191    | TestServer\n'
+            '       | One       \n'
+            '289    | TestServer\n'
+            '       | Two       \n'))
+
+    def test_table_rows_are_written_as_they_arrive(self):
+        writer = output.create_writer('table', self.stream, get_row,
+                                      ['id', 'name'], [6, 15])
+        writer.write(self.objects[0])
+        self.assertTrue('TestServerOne' in self.stream.getvalue())
+
+    def test_tsv(self):
+        self.assertEqual(self.write('tsv', self.objects),
+                         '191\tTestServerOne\n289\tTestServerTwo\n')
+
+    def test_json(self):
+        self.assertEqual(json.loads(self.write('json', self.objects)),
+                         self.objects)
+
+    def test_empty_json(self):
+        self.assertEqual(json.loads(self.write('json', [])), [])
+
+    def test_ndjson(self):
+        lines = self.write('ndjson', self.objects).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.objects)
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, output.create_writer, 'xml',
+                          self.stream, get_row, [], [])
+
+
+class TestMergedWriter(unittest.TestCase):
+    def setUp(self):
+        self.stream = StringIO()
+
+    def write(self, output_format):
+        merged = output.MergedWriter(output_format, self.stream, 4)
+        count = merged.write('prod', [{'id': 191, 'name': 'TestServerOne'}],
+                             ['id', 'name'], ['id', 'name'], [6, 15],
+                             lambda columns: get_row)
+        merged.write('test', [{'id': 7, 'name': 'Other'}], ['id', 'name'],
+                     ['id', 'name'], [6, 15], lambda columns: get_row)
+        merged.close()
+        self.assertEqual(count, 1)
+        return self.stream.getvalue()
+
+    def test_tsv_has_a_source_column(self):
+        self.assertEqual(self.write('tsv'),
+                         'prod\t191\tTestServerOne\ntest\t7\tOther\n')
+
+    def test_one_table(self):
+        lines = self.write('table').splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[0].split('|')[0].strip(), 'source')
+
+    def test_json_has_a_source_field(self):
+        self.assertEqual([obj['source'] for obj in
+                          json.loads(self.write('json'))], ['prod', 'test'])
+
+
+class TestStreams(unittest.TestCase):
+    def test_prefixed_stream_writes_whole_lines(self):
+        stream = StringIO()
+        prefixed = output.PrefixedStream(stream, 'prod: ', threading.Lock())
+        prefixed.write('Deploying')
+        self.assertEqual(stream.getvalue(), '')
+        prefixed.write(' config...\nDone\nno newline')
+        prefixed.flush()
+        self.assertEqual(stream.getvalue(), 'prod: Deploying config...\n'
+                         'prod: Done\nprod: no newline\n')
+
+    def test_thread_local_stream(self):
+        default, other = StringIO(), StringIO()
+        stream = output.ThreadLocalStream(default)
+
+        def _write():
+            stream.set_stream(other)
+            stream.write('other')
+        thread = threading.Thread(target=_write)
+        thread.start()
+        thread.join()
+        stream.write('default')
+        self.assertEqual(default.getvalue(), 'default')
+        self.assertEqual(other.getvalue(), 'other')
+
+    def test_softspace_is_per_thread(self):
+        stream = output.ThreadLocalStream(StringIO())
+        stream.softspace = 1
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(stream.softspace))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, [0])
+        self.assertEqual(stream.softspace, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+import time
+import threading
+import unittest
+
+from labmanager import parallel
+
+
+class TestRunParallel(unittest.TestCase):
+    def test_results_are_in_input_order(self):
+        results = parallel.run_parallel(lambda x: x * 2, range(10),
+                                        max_workers=4)
+        self.assertEqual([r.value for r in results], range(0, 20, 2))
+        self.assertEqual([r.item for r in results], range(10))
+
+    def test_errors_are_captured_per_item(self):
+        def func(x):
+            if x == 2:
+                raise ValueError("bad item")
+            return x
+        results = parallel.run_parallel(func, [1, 2, 3], max_workers=3)
+        self.assertEqual([r.ok for r in results], [True, False, True])
+        self.assertTrue(isinstance(results[1].error, ValueError))
+        self.assertRaises(ValueError, results[1].get)
+        self.assertEqual(results[2].get(), 3)
+
+    def test_calls_run_concurrently(self):
+        # Each call waits for the other one to start, which
+        # can only happen if they run at the same time.
+        started = []
+        condition = threading.Condition()
+
+        def func(x):
+            condition.acquire()
+            try:
+                started.append(x)
+                condition.notifyAll()
+                while len(started) < 2:
+                    condition.wait(5)
+                return len(started)
+            finally:
+                condition.release()
+        results = parallel.run_parallel(func, [1, 2], max_workers=2)
+        self.assertEqual([r.get() for r in results], [2, 2])
+
+    def test_no_items(self):
+        self.assertEqual(parallel.run_parallel(lambda x: x, []), [])
+
+    def test_unique_items_are_called_once(self):
+        calls = []
+
+        def func(x):
+            calls.append(x)
+            if int(x) == 2:
+                raise ValueError("bad item")
+            return x * 2
+        results = parallel.run_parallel_unique(func, [1, '2', 3, 1, 2],
+                                               max_workers=4, key=int)
+        self.assertEqual(sorted(calls, key=int), [1, '2', 3])
+        self.assertEqual([r.item for r in results], [1, '2', 3, 1, 2])
+        self.assertEqual([r.value for r in results], [2, None, 6, 2, None])
+        self.assertTrue(isinstance(results[4].error, ValueError))
+
+
+class TestImapUnordered(unittest.TestCase):
+    def test_results_are_yielded_as_they_finish(self):
+        event = threading.Event()
+
+        def func(x):
+            if x == 'slow':
+                event.wait(5)
+            return x
+        results = parallel.imap_unordered(func, ['slow', 'fast'], 2)
+        first = results.next()
+        self.assertEqual((first.item, first.value), ('fast', 'fast'))
+        event.set()
+        self.assertEqual(results.next().item, 'slow')
+        self.assertRaises(StopIteration, results.next)
+
+    def test_errors_are_captured(self):
+        results = list(parallel.imap_unordered(lambda x: 1 / x, [0]))
+        self.assertTrue(isinstance(results[0].error, ZeroDivisionError))
+
+    def test_threads_have_stopped_when_done(self):
+        before = set(threading.enumerate())
+        for i in range(20):
+            list(parallel.imap_unordered(lambda x: x, range(20), 4))
+            self.assertEqual(set(threading.enumerate()) - before, set())
+
+
+class TestExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = parallel.Executor(max_workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_submit_returns_future(self):
+        future = self.executor.submit(lambda x, y: x + y, 1, y=2)
+        self.assertEqual(future.result(5), 3)
+        self.assertTrue(future.done())
+        self.assertEqual(future.exception(), None)
+
+    def test_exceptions_are_raised_by_result(self):
+        future = self.executor.submit(lambda: 1 / 0)
+        self.assertRaises(ZeroDivisionError, future.result, 5)
+        self.assertTrue(isinstance(future.exception(), ZeroDivisionError))
+
+    def test_max_workers_bounds_calls_in_flight(self):
+        lock = threading.Lock()
+        in_flight = [0]
+        most = [0]
+
+        def func(x):
+            lock.acquire()
+            in_flight[0] += 1
+            most[0] = max(most[0], in_flight[0])
+            lock.release()
+            time.sleep(0.01)
+            lock.acquire()
+            in_flight[0] -= 1
+            lock.release()
+            return x
+        futures = self.executor.map(func, range(10))
+        self.assertEqual([f.result(5) for f in futures], range(10))
+        self.assertEqual(most[0], 2)
+
+    def test_done_callback(self):
+        event = threading.Event()
+        future = self.executor.submit(event.wait, 5)
+        called = []
+        future.add_done_callback(called.append)
+        self.assertEqual(called, [])
+        event.set()
+        future.result(5)
+        self.assertEqual(called, [future])
+        # Callbacks added after the fact are called right away.
+        future.add_done_callback(called.append)
+        self.assertEqual(called, [future, future])
+
+    def test_result_timeout(self):
+        event = threading.Event()
+        future = self.executor.submit(event.wait, 5)
+        self.assertRaises(parallel.TimeoutError, future.result, 0.01)
+        event.set()
+
+    def test_as_completed(self):
+        event = threading.Event()
+        slow = self.executor.submit(event.wait, 5)
+        fast = self.executor.submit(lambda: 'fast')
+        completed = parallel.as_completed([slow, fast], timeout=5)
+        self.assertTrue(completed.next() is fast)
+        event.set()
+        self.assertTrue(completed.next() is slow)
+        self.assertRaises(StopIteration, completed.next)
+
+    def test_as_completed_timeout(self):
+        event = threading.Event()
+        future = self.executor.submit(event.wait, 5)
+        self.assertRaises(parallel.TimeoutError, list,
+                          parallel.as_completed([future], timeout=0.01))
+        event.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import copy
+import unittest
+
+from suds.sudsobject import Factory
+
+from labmanager import records
+
+
+def create_suds_type(classname='Configuration', **kwargs):
+    return Factory.object(classname, kwargs)
+
+
+class TestRecords(unittest.TestCase):
+    def setUp(self):
+        self.record = records.from_suds(
+            create_suds_type(id=289, name='TestServerTwo', isDeployed=True))
+
+    def test_dict_like_access(self):
+        self.assertEqual(self.record['id'], 289)
+        self.assertTrue('name' in self.record)
+        self.assertFalse('memory' in self.record)
+        self.assertEqual(self.record.get('memory', 1024), 1024)
+        self.assertRaises(KeyError, lambda: self.record['memory'])
+        self.assertEqual(sorted(self.record), ['id', 'isDeployed', 'name'])
+
+    def test_attribute_access(self):
+        self.assertEqual(self.record.name, 'TestServerTwo')
+
+    def test_equal_to_dict(self):
+        expected = {'id': 289, 'name': 'TestServerTwo', 'isDeployed': True}
+        self.assertEqual(self.record, expected)
+        self.assertEqual(expected, self.record)
+        self.assertEqual(dict(self.record), expected)
+        self.assertEqual(records.as_dict(self.record), expected)
+        self.assertNotEqual(self.record, {'id': 289})
+
+    def test_record_types_are_reused(self):
+        other = records.from_suds(
+            create_suds_type(id=191, name='TestServerOne', isDeployed=False))
+        self.assertTrue(type(other) is type(self.record))
+
+    def test_different_fields_create_different_types(self):
+        other = records.from_suds(create_suds_type(id=191))
+        self.assertFalse(type(other) is type(self.record))
+        self.assertEqual(other, {'id': 191})
+
+    def test_copy(self):
+        self.assertEqual(copy.copy(self.record), self.record)
+
+    def test_same_as_suds(self):
+        self.assertTrue(records.same_as_suds(self.record, create_suds_type(
+            id=289, name='TestServerTwo', isDeployed=True)))
+        self.assertFalse(records.same_as_suds(self.record, create_suds_type(
+            id=289, name='TestServerTwo', isDeployed=False)))
+        self.assertFalse(records.same_as_suds(self.record, create_suds_type(
+            id=289, name='TestServerTwo')))
+
+    def test_row_getter(self):
+        get_row = records.row_getter(type(self.record),
+                                     ['name', 'memory', 'id'])
+        self.assertEqual(get_row(self.record), ['TestServerTwo', '', 289])
+
+    def test_row_getter_for_dicts(self):
+        get_row = records.row_getter(dict, ['name', 'memory'])
+        self.assertEqual(get_row({'name': 'web1'}), ['web1', ''])
+
+
+if __name__ == '__main__':
+    unittest.main()
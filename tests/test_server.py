@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import mock
+import suds
+
+from labmanager import server
+from labmanager import shell
+
+
+class TestLMShellServer(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tempdir, 'lmsh.sock')
+        self.lmapi = mock.Mock()
+        self.server = server.LMShellServer(self.socket_path,
+                                           shell.LMShell(self.lmapi))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tempdir)
+
+    def test_command_output_is_returned(self):
+        response = server.send_command('undeploy 289', self.socket_path)
+        self.assertEqual(response, {'stdout': 'Undeploying config...\n',
+                                    'stderr': '', 'return_code': 0})
+        self.lmapi.undeploy_configuration.assert_called_with('289')
+
+    def test_return_code_of_failed_command(self):
+        self.lmapi.undeploy_configuration.side_effect = \
+            suds.WebFault('fault', None)
+        response = server.send_command('undeploy 289', self.socket_path)
+        self.assertEqual(response['return_code'], 1)
+        self.assertTrue(response['stderr'].startswith('ERROR:'))
+
+    def test_client_reuses_server_for_many_commands(self):
+        for i in range(3):
+            server.send_command('undeploy %s' % i, self.socket_path)
+        self.assertEqual(self.lmapi.undeploy_configuration.call_count, 3)
+
+    def test_socket_is_only_accessible_by_owner(self):
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0077, 0)
+
+    def test_no_server_running(self):
+        self.assertRaises(server.ServerNotRunningError, server.send_command,
+                          'list', os.path.join(self.tempdir, 'missing'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import time
+import threading
+import unittest
+
+from labmanager import singleflight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.flights = singleflight.SingleFlight()
+        self.release = threading.Event()
+        self.calls = []
+
+    def slow_call(self, value):
+        self.calls.append(value)
+        self.release.wait()
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def start_callers(self, key, value, count):
+        results = []
+
+        def _call():
+            try:
+                results.append(self.flights.call(key, self.slow_call, value))
+            except Exception, e:
+                results.append(e)
+        threads = [threading.Thread(target=_call) for i in xrange(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def wait_for_coalesced(self, name, count):
+        for i in xrange(200):
+            if self.flights.stats().get(name, (0, 0))[1] >= count:
+                return
+            time.sleep(0.01)
+        self.fail("calls were not coalesced")
+
+    def finish(self, threads):
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+    def test_concurrent_calls_share_one_call(self):
+        threads, results = self.start_callers(('list_machines', '1'), 'a', 5)
+        self.wait_for_coalesced('list_machines', 4)
+        self.finish(threads)
+        self.assertEqual(self.calls, ['a'])
+        self.assertEqual(sorted(results), [('a', False)] + [('a', True)] * 4)
+        self.assertEqual(self.flights.stats(), {'list_machines': (1, 4)})
+        self.assertEqual(self.flights.in_flight(), 0)
+
+    def test_different_keys_are_not_shared(self):
+        threads, results = self.start_callers(('list_machines', '1'), 'a', 1)
+        more_threads, more_results = self.start_callers(
+            ('list_machines', '2'), 'b', 1)
+        self.finish(threads + more_threads)
+        self.assertEqual(sorted(self.calls), ['a', 'b'])
+        self.assertEqual(self.flights.stats(), {'list_machines': (2, 0)})
+
+    def test_errors_are_shared(self):
+        error = ValueError('server down')
+        threads, results = self.start_callers(('get_machine', '1'), error, 3)
+        self.wait_for_coalesced('get_machine', 2)
+        self.finish(threads)
+        self.assertEqual(results, [error] * 3)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_calls_after_invalidate_are_not_shared(self):
+        threads, results = self.start_callers(('list_machines', '1'), 'a', 1)
+        for i in xrange(200):
+            if self.calls:
+                break
+            time.sleep(0.01)
+        self.flights.invalidate()
+        more_threads, more_results = self.start_callers(
+            ('list_machines', '1'), 'b', 1)
+        self.finish(threads + more_threads)
+        self.assertEqual(sorted(self.calls), ['a', 'b'])
+        self.assertEqual(more_results, [('b', False)])
+
+    def test_nothing_is_kept_after_the_call(self):
+        self.release.set()
+        self.flights.call(('get_machine', '1'), self.slow_call, 'a')
+        self.flights.call(('get_machine', '1'), self.slow_call, 'b')
+        self.assertEqual(self.calls, ['a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
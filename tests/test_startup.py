@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+
+# Runs lmsh's main() with the given arguments, then reports whether
+# any of the modules that are slow to import were imported.
+LMSH = """
+import sys
+from labmanager.shell import main
+sys.argv = ['lmsh'] + %r
+try:
+    main()
+except SystemExit:
+    pass
+sys.stderr.write(' '.join(sorted([name for name in sys.modules if
+                                  name.split('.')[0] in
+                                  ('suds', 'readline', 'urllib2')])))
+"""
+
+
+class TestStartup(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        open(os.path.join(self.home, '.lmshrc'), 'w').write(
+            '[default]\nusername=user\n\n[other]\nusername=user\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.home)
+
+    def run_lmsh(self, args):
+        env = dict(os.environ)
+        env['HOME'] = self.home
+        # Run from the source tree, wherever the tests are run from.
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__)))
+        process = subprocess.Popen([sys.executable, '-c', LMSH % (args,)],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, env=env)
+        stdout, stderr = process.communicate()
+        return stdout, stderr.split()
+
+    def test_list_sections_does_not_import_suds(self):
+        stdout, imported = self.run_lmsh(['--list-sections'])
+        self.assertEqual(sorted(stdout.split()), ['default', 'other'])
+        self.assertEqual(imported, [])
+
+    def test_help_does_not_import_suds(self):
+        stdout, imported = self.run_lmsh(['help', 'deploy'])
+        self.assertTrue('Deploy a configuration' in stdout)
+        self.assertEqual(imported, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
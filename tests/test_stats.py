@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+import json
+import unittest
+from StringIO import StringIO
+
+import mock
+from suds.sudsobject import Factory
+
+from labmanager import api
+from labmanager import stats
+
+
+class TestMetric(unittest.TestCase):
+    def test_summary_values(self):
+        metric = stats.Metric('soap.GetMachine')
+        for elapsed in [0.003, 0.004, 0.015, 0.250]:
+            metric.add(elapsed, bytes_sent=10, bytes_received=100)
+        metric.add(0.001, error=True)
+        self.assertEqual(metric.count, 5)
+        self.assertEqual(metric.errors, 1)
+        self.assertEqual(metric.bytes_sent, 40)
+        self.assertEqual(metric.bytes_received, 400)
+        self.assertAlmostEqual(metric.mean, 0.0546)
+        self.assertEqual(metric.min, 0.001)
+        self.assertEqual(metric.max, 0.250)
+
+    def test_percentiles_are_bucket_upper_bounds(self):
+        metric = stats.Metric('name')
+        for elapsed in [0.003] * 9 + [0.150]:
+            metric.add(elapsed)
+        self.assertEqual(metric.percentile(50), 0.005)
+        self.assertEqual(metric.percentile(90), 0.005)
+        # Never more than the slowest time recorded.
+        self.assertEqual(metric.percentile(95), 0.150)
+
+    def test_slower_than_every_bucket(self):
+        metric = stats.Metric('name')
+        metric.add(120.0)
+        self.assertEqual(metric.percentile(50), 120.0)
+
+
+class TestStats(unittest.TestCase):
+    def test_record_and_reset(self):
+        lmstats = stats.Stats()
+        lmstats.record('render.list', 0.5, objects=10)
+        lmstats.record('render.list', 0.25, objects=5)
+        metrics = lmstats.metrics()
+        self.assertEqual([m.name for m in metrics], ['render.list'])
+        self.assertEqual(metrics[0].count, 2)
+        self.assertEqual(metrics[0].objects, 15)
+        lmstats.reset()
+        self.assertEqual(lmstats.metrics(), [])
+
+    def test_trace_file(self):
+        trace = StringIO()
+        lmstats = stats.Stats(trace, clock=lambda: 100.0)
+        lmstats.record('soap.ListMachines', 0.5, bytes_sent=1,
+                       bytes_received=2, error=True)
+        self.assertEqual(json.loads(trace.getvalue()), {
+            'time': 100.0, 'name': 'soap.ListMachines', 'elapsed': 0.5,
+            'bytes_sent': 1, 'bytes_received': 2, 'objects': 0,
+            'error': True})
+
+    def test_plugin_records_message_sizes(self):
+        lmstats = stats.Stats()
+        plugin = lmstats.plugin()
+        lmstats.start_call()
+        context = mock.Mock()
+        context.envelope = 'x' * 10
+        context.reply = 'x' * 25
+        plugin.sending(context)
+        plugin.received(context)
+        bytes_sent, bytes_received, received_at = lmstats.call_sizes()
+        self.assertEqual((bytes_sent, bytes_received), (10, 25))
+        self.assertTrue(received_at is not None)
+
+    def test_format_metrics(self):
+        lmstats = stats.Stats()
+        lmstats.record('wsdl.load', 0.02)
+        lines = stats.format_metrics(lmstats.metrics())
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('wsdl.load'))
+
+
+class TestLabManagerStats(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.clone.return_value = self.client
+        self.stats = stats.Stats()
+        self.lmapi = api.LabManager(self.client, stats=self.stats)
+
+    def metrics(self):
+        return dict([(m.name, m) for m in self.stats.metrics()])
+
+    def test_calls_and_conversions_are_recorded(self):
+        self.client.service.ListMachines.return_value = [
+            [Factory.object('Machine', {'id': 1}),
+             Factory.object('Machine', {'id': 2})]]
+        self.lmapi.list_machines(1)
+        metrics = self.metrics()
+        self.assertEqual(sorted(metrics), ['convert.list_machines',
+                                           'soap.ListMachines'])
+        self.assertEqual(metrics['soap.ListMachines'].count, 1)
+        self.assertEqual(metrics['convert.list_machines'].objects, 2)
+
+    def test_failed_calls_are_errors(self):
+        self.client.service.ConfigurationDelete.side_effect = \
+            lambda *args: 1 / 0
+        self.assertRaises(ZeroDivisionError,
+                          self.lmapi.delete_configuration, 1)
+        self.assertEqual(self.metrics()['soap.ConfigurationDelete'].errors,
+                         1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+import os
+import copy
+import socket
+import httplib
+import threading
+import unittest
+import BaseHTTPServer
+
+from suds.cache import NoCache
+from suds.client import Client
+from suds.transport import Request, TransportError
+
+from labmanager import transport
+
+
+WSDL = ('<definitions xmlns="http://schemas.xmlsoap.org/wsdl/" '
+        'targetNamespace="urn:test" />')
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        self._respond(200, WSDL)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.paths.append(self.path)
+        if self.server.truncate_replies:
+            # Part of a reply, then the connection is closed.
+            self.wfile.write('HTTP/1.1 200 OK\r\nContent-Length: 100\r\n'
+                             '\r\n<rep')
+            self.wfile.flush()
+            self.close_connection = 1
+            return
+        self._respond(self.server.status, '<reply/>')
+        if self.server.drop_connections:
+            # Close the connection without telling the client,
+            # like a server dropping an idle connection.
+            self.close_connection = 1
+
+    def _respond(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(BaseHTTPServer.HTTPServer):
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.connections = 0
+        self.status = 200
+        self.drop_connections = False
+        self.truncate_replies = False
+        self.paths = []
+
+
+class TestPooledHttpTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = _Server()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        self.url = 'http://127.0.0.1:%s/LabManager.asmx' % \
+            self.server.server_address[1]
+        self.transport = transport.PooledHttpTransport(timeout=5)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def send(self):
+        return self.transport.send(Request(self.url, '<request/>'))
+
+    def test_connections_are_reused(self):
+        for i in range(5):
+            self.assertEqual(self.send().message, '<reply/>')
+        self.assertEqual(self.server.connections, 1)
+
+    def test_open(self):
+        self.assertEqual(self.transport.open(Request(self.url)).read(),
+                         WSDL)
+
+    def test_stale_connection_is_retried(self):
+        self.server.drop_connections = True
+        for i in range(3):
+            self.assertEqual(self.send().message, '<reply/>')
+        self.assertEqual(self.server.connections, 3)
+
+    def test_requests_the_server_may_have_seen_are_not_retried(self):
+        self.send()
+        self.server.truncate_replies = True
+        self.assertRaises(httplib.IncompleteRead, self.send)
+        self.assertEqual(len(self.server.paths), 2)
+
+    def test_proxy_option(self):
+        self.transport.options.proxy = {'http': self.url.split('/L')[0]}
+        self.send()
+        self.assertEqual(self.server.paths, [self.url])
+
+    def test_proxy_environment_variables(self):
+        environ = dict(os.environ)
+        os.environ['http_proxy'] = self.url.split('/L')[0]
+        os.environ['no_proxy'] = ''
+        try:
+            self.send()
+            self.assertEqual(self.server.paths, [self.url])
+            os.environ['no_proxy'] = '127.0.0.1'
+            # The test server handles one connection at a time.
+            self.transport.close()
+            self.send()
+            self.assertEqual(self.server.paths[1], '/LabManager.asmx')
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+
+    def test_idle_connections_expire(self):
+        self.transport.idle_timeout = 0
+        self.send()
+        self.send()
+        self.assertEqual(self.server.connections, 2)
+
+    def test_server_error(self):
+        self.server.status = 500
+        try:
+            self.send()
+        except TransportError, e:
+            self.assertEqual(e.httpcode, 500)
+            self.assertEqual(e.fp.read(), '<reply/>')
+        else:
+            self.fail("TransportError not raised")
+
+    def test_connection_refused(self):
+        self.url = 'http://127.0.0.1:1/LabManager.asmx'
+        self.assertRaises(socket.error, self.send)
+
+    def test_clones_share_the_pool(self):
+        self.send()
+        clone = copy.deepcopy(self.transport)
+        self.assertFalse(clone.options is self.transport.options)
+        self.assertEqual(clone.options.timeout, 5)
+        clone.send(Request(self.url, '<request/>'))
+        self.assertEqual(self.server.connections, 1)
+
+    def test_suds_clients_can_be_cloned(self):
+        client = Client(self.url, transport=self.transport,
+                        cache=NoCache())
+        clone = client.clone()
+        self.assertFalse(clone.options.transport is self.transport)
+
+
+if __name__ == '__main__':
+    unittest.main()